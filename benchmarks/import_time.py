@@ -0,0 +1,75 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+# Measures how long it takes a fresh interpreter to import the plugin (i.e.
+# what every `qiime` invocation that loads plugins pays for registering
+# `gut-to-soil-manuscript-figures`), & which heavy dependencies that pulls in.
+# The heavy dependencies are also timed on their own for reference.
+#
+#   python benchmarks/import_time.py [-n REPEATS] [MODULE ...]
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PLUGIN_MODULE = 'gut_to_soil_manuscript_figures.plugin_setup'
+HEAVY_MODULES = ['pkg_resources', 'skbio', 'matplotlib', 'scipy']
+
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed,
+                  'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def time_import(module, repeats):
+    runs = []
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, '-c',
+             _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            check=True, capture_output=True, text=True)
+        runs.append(json.loads(result.stdout))
+
+    return {
+        'module': module,
+        'median_ms': 1000 * statistics.median(r['seconds'] for r in runs),
+        'min_ms': 1000 * min(r['seconds'] for r in runs),
+        'heavy_imports': runs[0]['heavy']
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Times importing modules in a fresh interpreter.')
+    parser.add_argument('modules', nargs='*',
+                        default=[PLUGIN_MODULE, *HEAVY_MODULES])
+    parser.add_argument('-n', '--repeats', type=int, default=5)
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    results = [time_import(module, args.repeats) for module in args.modules]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f'{"module":<45} {"median ms":>10} {"min ms":>8}  heavy imports')
+    for r in results:
+        print(f'{r["module"]:<45} {r["median_ms"]:>10.1f} {r["min_ms"]:>8.1f}'
+              f'  {", ".join(r["heavy_imports"]) or "-"}')
+
+
+if __name__ == '__main__':
+    main()
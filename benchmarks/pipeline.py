@@ -0,0 +1,254 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+# Times each stage of the `pcoa_2d` pipeline on synthetic ordinations of
+# increasing size, writing the results as JSON so that runs can be compared
+# over time (e.g. across commits):
+#
+#   python benchmarks/pipeline.py [--sizes N ...] [-n REPEATS] [-o OUT.json]
+#
+# Each synthetic data set has the 16 subject buckets x 52 weeks of composted
+# samples, the HE & bulking week 0 inputs, and soil, food/landscape compost,
+# himalaya & pit toilet samples, in fixed proportions of the total size.
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+import matplotlib
+import matplotlib.pyplot as plt
+import skbio
+
+from gut_to_soil_manuscript_figures import __version__
+from gut_to_soil_manuscript_figures._handoff import write_handoff
+from gut_to_soil_manuscript_figures._metadata import PLOT_DTYPES
+from gut_to_soil_manuscript_figures._selection import (
+    HIMALAYA_BUCKET, PIT_TOILET_BUCKET)
+from gut_to_soil_manuscript_figures._trajectory import (
+    sample_table, weekly_centroids)
+from gut_to_soil_manuscript_figures.scripts.plot_pcoa_2d import (
+    _background_data, _bucket_util, _draw_background, _draw_highlights,
+    _highlight_data, _orient, _prepare, _render)
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+N_BUCKETS = 16
+N_WEEKS = 52
+
+# fractions of the samples in each of the non-composted groups; the rest are
+# composted (HEC) samples
+GROUP_FRACTIONS = {
+    'Human Excrement': 0.02,
+    'Bulking Material': 0.02,
+    'Soil': 0.10,
+    'Food Compost': 0.025,
+    'Landscape Compost': 0.025,
+    'Himalaya': 0.01,
+    'Pit Toilet': 0.01
+}
+
+
+def make_inputs(n_samples, seed=0):
+    """Synthetic plot metadata & a 3-axis ordination of `n_samples`."""
+    rng = np.random.default_rng(seed)
+
+    counts = {sample_type: int(n_samples * fraction)
+              for sample_type, fraction in GROUP_FRACTIONS.items()}
+    counts['Human Excrement Compost'] = n_samples - sum(counts.values())
+
+    sample_types = []
+    buckets = []
+    weeks = []
+    for sample_type, count in counts.items():
+        i = np.arange(count)
+        sample_types.append(np.full(count, sample_type, dtype=object))
+
+        if sample_type == 'Human Excrement Compost':
+            # every week of a bucket is filled before moving on to the next
+            # bucket, so even the smallest sizes have complete trajectories
+            buckets.append(i // N_WEEKS % N_BUCKETS + 1.0)
+            weeks.append(i % N_WEEKS + 1.0)
+            continue
+
+        if sample_type in ('Human Excrement', 'Bulking Material'):
+            buckets.append(i % N_BUCKETS + 1.0)
+        elif sample_type == 'Himalaya':
+            buckets.append(np.full(count, HIMALAYA_BUCKET))
+        elif sample_type == 'Pit Toilet':
+            buckets.append(np.full(count, PIT_TOILET_BUCKET))
+        else:
+            buckets.append(np.full(count, np.nan))
+        weeks.append(np.full(count, np.nan))
+
+    ids = pd.Index([f'sample.{i}' for i in range(n_samples)],
+                   name='sample-id')
+    md = pd.DataFrame({
+        'SampleType': np.concatenate(sample_types),
+        'Bucket': np.concatenate(buckets),
+        'Composting Time Point': np.concatenate(weeks)
+    }, index=ids).astype(PLOT_DTYPES)
+
+    # composted samples drift along the first axis over time
+    coordinates = rng.normal(scale=0.1, size=(n_samples, 3))
+    coordinates[:, 0] += np.nan_to_num(
+        md['Composting Time Point'].to_numpy(dtype=float)) / N_WEEKS
+
+    eigvals = pd.Series([3.0, 2.0, 1.0])
+    ordination = skbio.OrdinationResults(
+        'PCoA', 'Principal Coordinate Analysis', eigvals,
+        pd.DataFrame(coordinates, index=ids.rename(None)),
+        proportion_explained=eigvals / eigvals.sum())
+
+    return md, ordination
+
+
+def run(n_samples, repeats, highlighted_buckets):
+    md, ordination = make_inputs(n_samples)
+    timings = defaultdict(list)
+
+    @contextlib.contextmanager
+    def stage(name):
+        start = time.perf_counter()
+        yield
+        timings[name].append(time.perf_counter() - start)
+
+    for _ in range(repeats):
+        with tempfile.TemporaryDirectory(prefix='pcoa-2d-bench-') as tmp:
+            md_fp = os.path.join(tmp, 'metadata.tsv')
+            ordination_fp = os.path.join(tmp, 'ordination.txt')
+            handoff_dir = os.path.join(tmp, 'handoff')
+            os.mkdir(handoff_dir)
+
+            # SERIALIZATION (of the inputs handed to the plotting script)
+            with stage('serialize_text'):
+                md.to_csv(md_fp, sep='\t')
+                ordination.write(ordination_fp)
+            with stage('serialize_handoff'):
+                write_handoff(handoff_dir, md, ordination)
+
+            # PARSING
+            with stage('parse_text'):
+                _prepare(md_fp, ordination_fp)
+            with stage('parse_handoff'):
+                prop_explained, ord_2d, plot_md, selector, _ = \
+                    _prepare(handoff_dir, handoff_dir)
+
+            with stage('orient_coordinates'):
+                view, fig_aspect, x_label, y_label = \
+                    _orient(prop_explained, selector, ord_2d, 'False',
+                            'False', 'False')
+
+            with stage('bucket_util'):
+                _bucket_util(highlighted_buckets, selector)
+
+            with stage('weekly_average'):
+                centroids = weekly_centroids(sample_table(selector, ord_2d))
+
+            # PLOT-READY LAYER DATA
+            with stage('layer_data'):
+                layers = {
+                    **_background_data(view, fig_aspect, x_label, y_label,
+                                       'True', 'True', 'True', centroids),
+                    **_highlight_data(selector, view, plot_md,
+                                      highlighted_buckets)
+                }
+
+            # ARTIST CREATION
+            fig, ax = plt.subplots(1, 1, figsize=(15, 8))
+            ax.set_aspect(aspect=fig_aspect)
+
+            with stage('draw_background'):
+                background = _draw_background(ax, layers)
+            with stage('draw_highlights'):
+                artists, _, _ = _draw_highlights(ax, layers, 'True')
+            for artist in artists:
+                artist.remove()
+
+            # RENDERING; `savefig` is also timed on its own within `render`
+            savefig = fig.savefig
+
+            def timed_savefig(*args, **kwargs):
+                with stage('savefig'):
+                    savefig(*args, **kwargs)
+
+            fig.savefig = timed_savefig
+
+            with stage('render'):
+                _render(fig, ax, background, layers, measure='Benchmark',
+                        week_annotations='True',
+                        plot_fp=os.path.join(tmp, 'pcoa_plot.png'),
+                        export_legend='False', legend_fp=None)
+            plt.close(fig)
+
+    return [{
+        'n_samples': n_samples,
+        'stage': name,
+        'median_s': statistics.median(times),
+        'min_s': min(times),
+        'runs_s': times
+    } for name, times in timings.items()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Times each stage of the pcoa_2d pipeline.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=DEFAULT_SIZES,
+                        help='numbers of samples to benchmark')
+    parser.add_argument('-n', '--repeats', type=int, default=3)
+    parser.add_argument('--highlighted-buckets', default='2, 5')
+    parser.add_argument('-o', '--output',
+                        help='write the JSON results here instead of to'
+                             ' stdout')
+    args = parser.parse_args(argv)
+
+    results = []
+    for n_samples in args.sizes:
+        for result in run(n_samples, args.repeats, args.highlighted_buckets):
+            results.append(result)
+            print(f'{n_samples:>9} {result["stage"]:<18}'
+                  f' {result["median_s"]:>9.4f} s', file=sys.stderr)
+
+    report = {
+        'benchmark': 'pcoa_2d_pipeline',
+        'timestamp': datetime.datetime.now(
+            datetime.timezone.utc).isoformat(),
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'dependencies': {
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'matplotlib': matplotlib.__version__,
+            'scikit-bio': skbio.__version__
+        },
+        'repeats': args.repeats,
+        'highlighted_buckets': args.highlighted_buckets,
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
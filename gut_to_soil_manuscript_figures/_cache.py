@@ -0,0 +1,197 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from . import __version__
+from ._metadata import PLOT_COLUMNS
+
+CACHE_DIR_ENV = 'GUT_TO_SOIL_FIGURES_CACHE_DIR'
+CACHE_MAX_SIZE_ENV = 'GUT_TO_SOIL_FIGURES_CACHE_MAX_SIZE'
+DEFAULT_MAX_SIZE = 512 * 1024 ** 2
+
+_TMP_PREFIX = '.tmp-'
+
+
+def render_key(md, ordination, params, trajectories=None):
+    """Content hash of everything that a rendered PCoA figure depends on.
+
+    Only the first two ordination axes (& their proportion explained), the
+    `PLOT_COLUMNS` of the plotted samples' metadata and the render parameters
+    are hashed, so unrelated changes to either input still hit the cache.
+    A trajectory index (which the highlighted buckets & weekly means are
+    drawn from instead) is hashed in full. The package version is included
+    so that rendering changes invalidate old entries.
+    """
+    h = hashlib.sha256()
+    h.update(__version__.encode())
+
+    samples = ordination.samples.iloc[:, 0:2]
+    h.update('\n'.join(map(str, samples.index)).encode())
+    h.update(np.ascontiguousarray(samples.to_numpy(dtype=float)).tobytes())
+    h.update(np.asarray(ordination.proportion_explained.iloc[0:2],
+                        dtype=float).tobytes())
+
+    # aligned to the ordination, so samples that aren't plotted don't count
+    h.update(pd.util.hash_pandas_object(
+        md[PLOT_COLUMNS].reindex(samples.index),
+        index=False).to_numpy().tobytes())
+
+    if trajectories is not None:
+        for table in trajectories:
+            h.update(pd.util.hash_pandas_object(table).to_numpy().tobytes())
+
+    h.update(json.dumps(params, sort_keys=True).encode())
+
+    return h.hexdigest()
+
+
+class RenderCache:
+    """On-disk cache of rendered figures, keyed by `render_key`.
+
+    Each entry is a directory of output files (or of the layer data that a
+    figure was drawn from, see `_layers.py`). Entries are evicted least
+    recently used first once the cache grows past `max_size` bytes.
+    """
+
+    def __init__(self, path=None, max_size=None):
+        if path is None:
+            path = os.environ.get(CACHE_DIR_ENV)
+        if path is None:
+            cache_home = os.environ.get(
+                'XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'),
+                                               '.cache'))
+            path = os.path.join(cache_home, 'gut-to-soil-manuscript-figures')
+
+        if max_size is None:
+            max_size = int(os.environ.get(CACHE_MAX_SIZE_ENV,
+                                          DEFAULT_MAX_SIZE))
+
+        self.path = path
+        self.max_size = max_size
+
+    def get(self, key, output_dir):
+        # copies a cached entry's files into `output_dir`, if there is one;
+        # they're staged first, so that an entry that another process evicts
+        # while it's being copied is a miss rather than a partial copy
+        entry = os.path.join(self.path, key)
+        staging = tempfile.mkdtemp(prefix=_TMP_PREFIX, dir=output_dir)
+        try:
+            try:
+                # marking the entry as recently used for eviction
+                os.utime(entry)
+                for fn in os.listdir(entry):
+                    shutil.copyfile(os.path.join(entry, fn),
+                                    os.path.join(staging, fn))
+            except OSError:
+                return False
+
+            for fn in os.listdir(staging):
+                os.replace(os.path.join(staging, fn),
+                           os.path.join(output_dir, fn))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        return True
+
+    def put(self, key, output_dir, filenames):
+        os.makedirs(self.path, exist_ok=True)
+
+        # staging the entry & then renaming it into place, so that a partially
+        # written entry is never visible to `get`
+        staging = tempfile.mkdtemp(prefix=_TMP_PREFIX, dir=self.path)
+        for fn in filenames:
+            shutil.copyfile(os.path.join(output_dir, fn),
+                            os.path.join(staging, fn))
+
+        try:
+            os.rename(staging, os.path.join(self.path, key))
+        except OSError:
+            # another render already stored this entry
+            shutil.rmtree(staging)
+
+        self.evict()
+
+    def entries(self):
+        # (key, size in bytes, last used) for each entry, oldest first
+        if not os.path.isdir(self.path):
+            return []
+
+        entries = []
+        for key in os.listdir(self.path):
+            entry = os.path.join(self.path, key)
+            if key.startswith(_TMP_PREFIX) or not os.path.isdir(entry):
+                continue
+
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, fn))
+                           for fn in os.listdir(entry))
+                entries.append((key, size, os.path.getmtime(entry)))
+            except OSError:
+                # removed by another process in the meantime
+                continue
+
+        return sorted(entries, key=lambda e: e[2])
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+
+        for key, size, _ in entries:
+            if total <= self.max_size:
+                break
+            self._remove(key)
+            total -= size
+
+    def _remove(self, key):
+        # the entry is moved out of place before it's deleted, so that `get`
+        # never sees an entry with only some of its files
+        trash = tempfile.mkdtemp(prefix=_TMP_PREFIX, dir=self.path)
+        try:
+            os.rename(os.path.join(self.path, key), os.path.join(trash, key))
+        except OSError:
+            # already removed by another process
+            pass
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def info(self):
+        entries = self.entries()
+
+        return {
+            'path': self.path,
+            'entries': len(entries),
+            'size': sum(size for _, size, _ in entries),
+            'max_size': self.max_size
+        }
+
+    def clear(self):
+        for key, _, _ in self.entries():
+            self._remove(key)
+
+
+# `python -m gut_to_soil_manuscript_figures._cache [info|clear]`
+if __name__ == '__main__':
+    cache = RenderCache()
+    command = sys.argv[1] if len(sys.argv) > 1 else 'info'
+
+    if command == 'clear':
+        cache.clear()
+    elif command != 'info':
+        sys.exit(f'Unrecognized command {command!r}.'
+                 ' Must be either `info` or `clear`.')
+
+    for field, value in cache.info().items():
+        print(f'{field}: {value}')
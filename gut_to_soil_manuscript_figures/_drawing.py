@@ -0,0 +1,330 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import contextlib
+import math
+
+import numpy as np
+import matplotlib as mpl
+import matplotlib.image
+from matplotlib.artist import Artist
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PathCollection
+from matplotlib.colors import LinearSegmentedColormap, LogNorm, to_rgb
+from matplotlib.text import Text
+from matplotlib.transforms import Bbox
+
+from ._selection import DENSITY_THRESHOLD
+
+# the number of bins along the longer side of a density image
+DENSITY_BINS = 200
+
+# the number of markers in a collection above which it's drawn as a single
+# image in vector output, rather than as one vector element per marker
+VECTOR_MARKER_LIMIT = 1_000
+
+
+def add_lines(ax, lines, **kwargs):
+    """Adds many (possibly disjoint) lines to `ax` as a single artist.
+
+    Each line is an (n, 2) array of XY points. The cap & join styles default
+    to those of a solid `ax.plot` line so that the lines look the same.
+    """
+    kwargs.setdefault('capstyle', 'projecting')
+    kwargs.setdefault('joinstyle', 'round')
+    collection = LineCollection(lines, **kwargs)
+
+    return ax.add_collection(collection)
+
+
+class Labels(Artist):
+    """Many text labels drawn (and measured) as a single artist.
+
+    The labels share the text properties of a single `Text`, which is moved
+    to each label's XY position (in data coordinates) when drawing. This
+    looks the same as annotating each point separately but avoids creating,
+    laying out & removing one artist per label.
+    """
+
+    zorder = 3
+
+    def __init__(self, xy, texts, **kwargs):
+        super().__init__()
+        self._xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+        self._texts = [str(text) for text in texts]
+        self._text = Text(**kwargs)
+
+        # matching `ax.annotate`, which doesn't clip its text to the axes
+        self.set_clip_on(False)
+
+    def set_figure(self, fig):
+        super().set_figure(fig)
+        self._text.set_figure(fig)
+
+    def set_transform(self, t):
+        super().set_transform(t)
+        self._text.set_transform(t)
+
+    def _each_label(self):
+        for xy, text in zip(self._xy, self._texts):
+            self._text.set_position(xy)
+            self._text.set_text(text)
+            yield self._text
+
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+
+        for text in self._each_label():
+            text.draw(renderer)
+
+        self.stale = False
+
+    def get_window_extent(self, renderer=None):
+        extents = [text.get_window_extent(renderer)
+                   for text in self._each_label()]
+        if not extents:
+            return Bbox.null()
+
+        return Bbox.union(extents)
+
+
+class DensityGrid:
+    """Draws groups of samples as 2D histogram images on a shared grid.
+
+    Only groups with more than `threshold` samples are meant to be drawn
+    this way; smaller ones are still drawn as markers. Each group is binned
+    with `np.histogram2d` over the same grid (spanning every sample in the
+    plot), so the images of different groups line up. A group's image is
+    shaded from partly transparent to its color on a log scale of the
+    number of samples in each bin, & empty bins are left transparent.
+    """
+
+    def __init__(self, x, y, threshold=DENSITY_THRESHOLD, bins=DENSITY_BINS,
+                 aspect=1.0):
+        self.threshold = threshold
+        self.extent = (np.min(x), np.max(x), np.min(y), np.max(y))
+
+        # `bins` along the longer side of the plot, with the other side's
+        # bins sized so that they're square once drawn at the axes' aspect
+        width = self.extent[1] - self.extent[0]
+        height = (self.extent[3] - self.extent[2]) * aspect
+        scale = bins / max(width, height, np.finfo(float).tiny)
+        self.bins = (max(round(width * scale), 1),
+                     max(round(height * scale), 1))
+
+    def draw(self, ax, x, y, color, zorder=1):
+        xmin, xmax, ymin, ymax = self.extent
+        counts, x_edges, y_edges = np.histogram2d(
+            x, y, bins=self.bins, range=[[xmin, xmax], [ymin, ymax]])
+
+        # cropping the grid to the bins that the group occupies, so that
+        # the image only extends the axes limits as far as its samples do
+        x_bins = np.flatnonzero(counts.any(axis=1))
+        y_bins = np.flatnonzero(counts.any(axis=0))
+        counts = counts[x_bins[0]:x_bins[-1] + 1, y_bins[0]:y_bins[-1] + 1]
+        x_edges = x_edges[x_bins[0]:x_bins[-1] + 2]
+        y_edges = y_edges[y_bins[0]:y_bins[-1] + 2]
+
+        rgb = to_rgb(color)
+        cmap = LinearSegmentedColormap.from_list(
+            f'density-{color}', [(*rgb, 0.4), (*rgb, 1.0)])
+
+        # histogram2d bins x along the rows, whereas images are row-major
+        # in y; empty bins are masked to leave them fully transparent
+        image = ax.imshow(np.ma.masked_equal(counts.T, 0), cmap=cmap,
+                          norm=LogNorm(vmin=1, vmax=counts.max()),
+                          origin='lower',
+                          extent=(x_edges[0], x_edges[-1],
+                                  y_edges[0], y_edges[-1]),
+                          aspect=ax.get_aspect(), interpolation='nearest',
+                          zorder=zorder)
+
+        # not snapping the axes limits to the image, so that they keep the
+        # same margins as when the samples are drawn as markers
+        image.sticky_edges.x[:] = []
+        image.sticky_edges.y[:] = []
+
+        # the legend's 'best' location only avoids markers & lines, so the
+        # centers of the occupied bins are also added as (never drawn)
+        # markers for it to avoid
+        occupied_x, occupied_y = np.nonzero(counts)
+        ax.scatter(x=(x_edges[occupied_x] + x_edges[occupied_x + 1]) / 2,
+                   y=(y_edges[occupied_y] + y_edges[occupied_y + 1]) / 2,
+                   visible=False)
+
+        return image
+
+
+@contextlib.contextmanager
+def rasterized_collections(fig, limit=VECTOR_MARKER_LIMIT):
+    """Rasterizes the marker collections of `fig` with over `limit` markers.
+
+    Within this context, saving `fig` in a vector format writes each large
+    collection as a single embedded image (at the DPI it's saved at), while
+    everything else (axes, text, lines & small collections) stays vector.
+    Raster output is unaffected either way.
+    """
+    collections = [collection
+                   for ax in fig.axes for collection in ax.collections
+                   if isinstance(collection, PathCollection)
+                   and not collection.get_rasterized()
+                   and len(collection.get_offsets()) > limit]
+    for collection in collections:
+        collection.set_rasterized(True)
+
+    try:
+        yield collections
+    finally:
+        for collection in collections:
+            collection.set_rasterized(False)
+
+
+def budget_dpi(fig, dpi, max_pixels):
+    """The highest DPI, up to `dpi`, to fit `fig` in `max_pixels` pixels.
+
+    The size is that of the figure when saved with `bbox_inches='tight'`
+    (i.e. its tight bounding box, padded by `savefig.pad_inches`), & each
+    side is allowed to be rounded up by a pixel. Raises a `ValueError` when
+    `max_pixels` is too few to save `fig` at 1 DPI.
+    """
+    pad = mpl.rcParams['savefig.pad_inches']
+    bbox = fig.get_tightbbox(fig.canvas.get_renderer())
+    width = bbox.width + 2 * pad
+    height = bbox.height + 2 * pad
+
+    # the positive root of (width * dpi + 1) * (height * dpi + 1) = max_pixels
+    a = width * height
+    b = width + height
+    max_dpi = (-b + math.sqrt(b ** 2 - 4 * a * (1 - max_pixels))) / (2 * a)
+    if max_dpi < 1:
+        min_pixels = math.ceil(width + 1) * math.ceil(height + 1)
+        raise ValueError(
+            f'The maximum number of pixels ({max_pixels}) is too few to save'
+            f' the figure, which needs at least {min_pixels} pixels (at 1'
+            ' DPI).')
+
+    return min(dpi, max_dpi)
+
+
+def anchored_loc(legend, renderer):
+    """The location that `legend` is drawn at, relative to its anchor.
+
+    Resolves a legend placed at `loc='best'` to the fixed location (e.g.
+    'upper right') that it was drawn at, by comparing its center to that of
+    its `bbox_to_anchor`, so that other legends can be placed alike without
+    searching for the best location again.
+    """
+    bbox = legend.get_window_extent(renderer)
+    anchor = legend.get_bbox_to_anchor()
+
+    def side(center, anchor_center, before, after):
+        if abs(center - anchor_center) < 0.5:
+            return 'center'
+        return before if center < anchor_center else after
+
+    horizontal = side((bbox.x0 + bbox.x1) / 2, (anchor.x0 + anchor.x1) / 2,
+                      'right', 'left')
+    vertical = side((bbox.y0 + bbox.y1) / 2, (anchor.y0 + anchor.y1) / 2,
+                    'upper', 'lower')
+    if vertical == 'center':
+        return 'center' if horizontal == 'center' else f'center {horizontal}'
+
+    return f'{vertical} {horizontal}'
+
+
+class BackgroundBuffer:
+    """A figure's drawn background, which other artists are blitted onto.
+
+    The figure is drawn once on its Agg canvas with the `excluded` artists
+    hidden, & a copy of the canvas' buffer is kept. Each figure sharing
+    that background is then rendered by restoring the buffer & drawing
+    only its own artists on top of it (in z-order, but above every artist
+    of the background), rather than redrawing every artist, & saved by
+    cropping the buffer. The figure's layout, DPI
+    & axes limits have to stay as they were when it was drawn.
+    """
+
+    def __init__(self, fig, excluded=()):
+        if not isinstance(fig.canvas, FigureCanvasAgg):
+            raise TypeError('Blitting needs a figure with an Agg canvas.')
+
+        visible = [artist.get_visible() for artist in excluded]
+        # an axes moves its title while it's hidden, so the positions of the
+        # excluded texts are kept
+        positions = {artist: artist.get_position() for artist in excluded
+                     if isinstance(artist, Text)}
+        for artist in excluded:
+            artist.set_visible(False)
+        self.fig = fig
+        try:
+            fig.canvas.draw()
+            self._background = fig.canvas.copy_from_bbox(fig.bbox)
+            # the background's tight bounding box, in pixels
+            self._bbox = fig.get_tightbbox(self.renderer).transformed(
+                fig.dpi_scale_trans)
+        finally:
+            for artist, was_visible in zip(excluded, visible):
+                artist.set_visible(was_visible)
+            for artist, position in positions.items():
+                artist.set_position(position)
+
+    @property
+    def renderer(self):
+        # the canvas' current renderer, which is replaced whenever the figure
+        # is drawn at another size or DPI (e.g. when it's saved in full), &
+        # which the whole background is restored to
+        return self.fig.canvas.get_renderer()
+
+    def draw(self, artists):
+        """Restores the background & draws the (visible) `artists` on it."""
+        self.fig.canvas.restore_region(self._background)
+        renderer = self.renderer
+        for artist in sorted(artists, key=lambda artist: artist.get_zorder()):
+            artist.draw(renderer)
+
+    def tight_bbox(self, artists):
+        """The tight bounding box of the background & `artists`, in pixels.
+
+        Padded by `savefig.pad_inches`, as when saving with
+        `bbox_inches='tight'`.
+        """
+        renderer = self.renderer
+        bboxes = [self._bbox]
+        for artist in artists:
+            if artist.get_visible():
+                bbox = artist.get_tightbbox(renderer)
+                if bbox is not None and (bbox.width or bbox.height):
+                    bboxes.append(bbox)
+
+        pad = mpl.rcParams['savefig.pad_inches'] * self.fig.dpi
+
+        return Bbox.union(bboxes).padded(pad)
+
+    def save(self, fp, bbox):
+        """Saves the `bbox` (in pixels) of what's drawn as a PNG.
+
+        Returns whether it was saved, which it isn't if `bbox` isn't within
+        the canvas (e.g. when a legend extends past it), as the buffer
+        doesn't include anything drawn outside of it. The crop is snapped to
+        whole pixels, whereas `savefig` shifts what it draws to the bbox, so
+        the image can be shifted by up to a pixel relative to a saved one.
+        """
+        buffer = np.asarray(self.fig.canvas.buffer_rgba())
+        height, width = buffer.shape[:2]
+        # sized as `savefig` sizes an image of `bbox` (i.e. truncated)
+        x0, y0 = round(bbox.x0), round(bbox.y0)
+        x1, y1 = x0 + int(bbox.width), y0 + int(bbox.height)
+        if x0 < 0 or y0 < 0 or x1 > width or y1 > height:
+            return False
+
+        # the buffer's rows start at the top of the figure
+        region = np.ascontiguousarray(buffer[height - y1:height - y0, x0:x1])
+        mpl.image.imsave(str(fp), region, format='png', dpi=self.fig.dpi)
+
+        return True
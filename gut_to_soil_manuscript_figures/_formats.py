@@ -0,0 +1,63 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import itertools
+
+import qiime2.plugin.model as model
+from qiime2.plugin import ValidationError
+
+from ._trajectory import TRAJECTORY_CENTROIDS_FN, TRAJECTORY_SAMPLES_FN
+
+
+class _TrajectoryTableFormat(model.TextFileFormat):
+    # a TSV with a fixed header, whose `NUMERIC` columns are all numbers
+    HEADER = None
+    NUMERIC = None
+
+    def _validate_(self, level):
+        # only the first few rows are checked at the minimum level
+        n_rows = {'min': 5, 'max': None}[level]
+
+        with self.open() as fh:
+            header = fh.readline().rstrip('\r\n').split('\t')
+            if header != self.HEADER:
+                raise ValidationError(
+                    f'Expected the header {self.HEADER}, found {header}.')
+
+            numeric = [self.HEADER.index(column) for column in self.NUMERIC]
+            for line_number, line in enumerate(
+                    itertools.islice(fh, n_rows), start=2):
+                fields = line.rstrip('\r\n').split('\t')
+                if len(fields) != len(self.HEADER):
+                    raise ValidationError(
+                        f'Line {line_number} has {len(fields)} fields,'
+                        f' expected {len(self.HEADER)}.')
+                for i in numeric:
+                    try:
+                        float(fields[i])
+                    except ValueError:
+                        raise ValidationError(
+                            f'{self.HEADER[i]!r} on line {line_number} is'
+                            f' not a number: {fields[i]!r}.')
+
+
+class TrajectorySamplesFormat(_TrajectoryTableFormat):
+    HEADER = ['sample-id', 'bucket', 'role', 'week', 'PC1', 'PC2']
+    NUMERIC = ['bucket', 'PC1', 'PC2']
+
+
+class TrajectoryCentroidsFormat(_TrajectoryTableFormat):
+    HEADER = ['SampleType', 'week', 'PC1', 'PC2']
+    NUMERIC = ['week', 'PC1', 'PC2']
+
+
+class TrajectoryIndexDirectoryFormat(model.DirectoryFormat):
+    samples = model.File(TRAJECTORY_SAMPLES_FN,
+                         format=TrajectorySamplesFormat)
+    centroids = model.File(TRAJECTORY_CENTROIDS_FN,
+                           format=TrajectoryCentroidsFormat)
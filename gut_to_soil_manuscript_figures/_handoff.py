@@ -0,0 +1,89 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+# Binary hand-off of the plot inputs between `pcoa_2d` and the plotting script
+# when it's run in a separate process. The inputs are written as a directory
+# of `.npy` files (all aligned to the ordination's samples) that the script
+# memory-maps instead of re-parsing text:
+#
+#   ids.npy                    fixed-width unicode sample IDs
+#   coordinates.npy            (n, 2) float64 coordinates on the first 2 axes
+#   proportion_explained.npy   (2,) float64
+#   SampleType.npy             fixed-width unicode ('' when missing)
+#   Bucket.npy                 float64 (NaN when missing)
+#   Composting Time Point.npy  float64 (NaN when missing)
+#   trajectories/              (OPTIONAL) a trajectory index, as written by
+#                              `write_bucket_trajectories`
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from ._metadata import PLOT_COLUMNS
+from ._trajectory import read_bucket_trajectories, write_bucket_trajectories
+
+
+def is_handoff(path):
+    return os.path.isfile(os.path.join(str(path), 'coordinates.npy'))
+
+
+def write_handoff(path, md, ordination, trajectories=None):
+    samples = ordination.samples.iloc[:, 0:2]
+    ids = samples.index.astype(str)
+
+    np.save(os.path.join(path, 'ids.npy'), ids.to_numpy(dtype=str))
+    np.save(os.path.join(path, 'coordinates.npy'),
+            np.ascontiguousarray(samples.to_numpy(dtype=np.float64)))
+    np.save(os.path.join(path, 'proportion_explained.npy'),
+            ordination.proportion_explained.iloc[0:2].to_numpy(
+                dtype=np.float64))
+
+    # raises a KeyError for ordination samples missing from the metadata,
+    # just like the plotting script does
+    md = md.loc[samples.index, PLOT_COLUMNS]
+    np.save(os.path.join(path, 'SampleType.npy'),
+            md['SampleType'].astype(object).fillna('').to_numpy(dtype=str))
+    for column in ('Bucket', 'Composting Time Point'):
+        np.save(os.path.join(path, f'{column}.npy'),
+                pd.to_numeric(md[column]).to_numpy(dtype=np.float64))
+
+    if trajectories is not None:
+        os.mkdir(os.path.join(path, 'trajectories'))
+        write_bucket_trajectories(os.path.join(path, 'trajectories'),
+                                  trajectories)
+
+
+def _load(path, name):
+    return np.load(os.path.join(str(path), f'{name}.npy'), mmap_mode='r')
+
+
+def read_ordination(path):
+    # returns the first two axes & their proportion explained, with the
+    # coordinates backed by the memory-mapped file
+    index = pd.Index(_load(path, 'ids'), dtype=object)
+    ord_2d = pd.DataFrame(_load(path, 'coordinates'), index=index,
+                          copy=False)
+
+    return ord_2d, np.asarray(_load(path, 'proportion_explained'))
+
+
+def read_metadata(path):
+    index = pd.Index(_load(path, 'ids'), dtype=object, name='sample-id')
+
+    return pd.DataFrame({column: _load(path, column)
+                         for column in PLOT_COLUMNS}, index=index)
+
+
+def read_trajectories(path):
+    # None when no trajectory index was handed off
+    path = os.path.join(str(path), 'trajectories')
+    if not os.path.isdir(path):
+        return None
+
+    return read_bucket_trajectories(path)
@@ -0,0 +1,158 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+# Data payload of the interactive PCoA plot, which is drawn client-side by
+# `assets/pcoa_2d.js` so that buckets can be toggled without re-rendering.
+# The per-sample columns are base64-encoded little-endian typed arrays,
+# all aligned to `ids`:
+#
+#   x, y     float32 coordinates (already inverted/swapped)
+#   group    uint8 index into `groups` (see `GROUPS`)
+#   bucket   int8 bucket number (0 when missing)
+#   week     int16 composting week (-1 when missing)
+#
+# Samples that aren't in any of the plotted groups are left out.
+
+import base64
+import importlib.resources
+import json
+import os
+import shutil
+
+import numpy as np
+
+from ._selection import (
+    HIMALAYA_BUCKET, PIT_TOILET_BUCKET, PLOT_SAMPLE_TYPES, SampleSelector)
+from ._trajectory import COMPOSTED_TYPE, sample_table, weekly_centroids
+
+# the plotted sample groups, in drawing order, as (name, label, color); the
+# colors match those of the static plot
+GROUPS = (
+    ('fecal', 'HE', '#8c564b'),
+    ('bulking', 'Bulking Material', '#008000'),
+    ('composted', 'HEC', '#C5C9C7'),
+    ('soil', 'Soil', '#000000'),
+    ('compost', 'FLWC', '#ff0000'),
+    ('himalaya', 'Himalaya', '#0000ff'),
+    ('pit_toilet', 'Pit Toilet', '#bfbf00')
+)
+
+PAYLOAD_FN = 'pcoa_data.json'
+SCRIPT_FN = 'pcoa_2d.js'
+
+
+def _encode(values, dtype):
+    array = np.ascontiguousarray(values,
+                                 dtype=np.dtype(dtype).newbyteorder('<'))
+
+    return {'dtype': np.dtype(dtype).name,
+            'data': base64.b64encode(array.tobytes()).decode('ascii')}
+
+
+def _group_masks(selector, himalaya, pit_toilet):
+    # the same groups as the background of the static plot
+    in_buckets = selector.in_bucket()
+    plotted = selector.of_type(*PLOT_SAMPLE_TYPES)
+    masks = {
+        'fecal': selector.of_type('Human Excrement') & in_buckets,
+        'bulking': selector.of_type('Bulking Material'),
+        'composted': selector.of_type(COMPOSTED_TYPE) & in_buckets,
+        'soil': selector.of_type('Soil'),
+        'compost': selector.of_type('Food Compost', 'Landscape Compost'),
+    }
+    if himalaya:
+        masks['himalaya'] = selector.in_bucket(HIMALAYA_BUCKET)
+    if pit_toilet:
+        masks['pit_toilet'] = selector.in_bucket(PIT_TOILET_BUCKET)
+
+    return {name: mask & plotted for name, mask in masks.items()}
+
+
+def interactive_payload(md, ordination, measure='', invert_x=False,
+                        invert_y=False, swap_axes=False, himalaya=False,
+                        pit_toilet=False, highlighted_buckets='',
+                        average=False):
+    """The interactive plot's data, as a JSON-serializable dict.
+
+    Coordinates are oriented exactly as in the static plot, & the weekly
+    HEC means (plus the HE & bulking material week 0 means) of all buckets
+    are precomputed, so the client only has to filter & draw. The weekly
+    mean is initially shown if `average` is set, as in the static plot.
+    """
+    ord_2d = ordination.samples.iloc[:, 0:2].set_axis([0, 1], axis=1)
+    prop_explained = dict(zip(
+        ['PC1', 'PC2'],
+        ordination.proportion_explained.iloc[0:2].to_numpy(dtype=float)))
+
+    selector = SampleSelector(md, ord_2d)
+    table = sample_table(selector, ord_2d)
+
+    masks = _group_masks(selector, himalaya, pit_toilet)
+    group = np.full(len(table), 255, dtype=np.uint8)
+    for code, (name, _, _) in enumerate(GROUPS):
+        if name in masks:
+            group[masks[name] & (group == 255)] = code
+    plotted = group != 255
+
+    # axes are inverted before being swapped, as in the static plot
+    signs = {'PC1': -1.0 if invert_x else 1.0,
+             'PC2': -1.0 if invert_y else 1.0}
+    axes = ['PC2', 'PC1'] if swap_axes else ['PC1', 'PC2']
+    labels = [f'PCoA {axis[-1]}' for axis in axes]
+    # the figure aspect of the static plot
+    aspect = prop_explained[axes[1]] / prop_explained[axes[0]]
+
+    coords = {axis: table[axis].to_numpy(dtype=float) * signs[axis]
+              for axis in axes}
+
+    centroids = weekly_centroids(table)
+    means = {}
+    for sample_type, key in ((COMPOSTED_TYPE, 'composted'),
+                             ('Human Excrement', 'fecal'),
+                             ('Bulking Material', 'bulking')):
+        if sample_type not in centroids.index.get_level_values(0):
+            continue
+        weekly = centroids.loc[sample_type]
+        means[key] = {
+            'week': weekly.index.to_numpy(dtype=float).astype(int).tolist(),
+            'x': (weekly[axes[0]] * signs[axes[0]]).tolist(),
+            'y': (weekly[axes[1]] * signs[axes[1]]).tolist()
+        }
+
+    bucket = np.nan_to_num(table['Bucket'].to_numpy(dtype=float), nan=0.0)
+    week = np.nan_to_num(table['week'].to_numpy(dtype=float), nan=-1.0)
+
+    return {
+        'measure': measure,
+        'axis_labels': labels,
+        'aspect': float(aspect),
+        'groups': [{'name': name, 'label': label, 'color': color}
+                   for name, label, color in GROUPS],
+        'highlighted_buckets': [int(b) for b in highlighted_buckets.split(',')
+                                if b.strip()],
+        'average': bool(average),
+        'n_samples': int(plotted.sum()),
+        'ids': table.index[plotted].astype(str).tolist(),
+        'x': _encode(coords[axes[0]][plotted], np.float32),
+        'y': _encode(coords[axes[1]][plotted], np.float32),
+        'group': _encode(group[plotted], np.uint8),
+        'bucket': _encode(bucket[plotted], np.int8),
+        'week': _encode(week[plotted], np.int16),
+        'weekly_means': means
+    }
+
+
+def write_interactive(output_dir, payload):
+    """Writes the payload & the script that draws it into `output_dir`."""
+    with open(os.path.join(output_dir, PAYLOAD_FN), 'w') as fh:
+        json.dump(payload, fh, separators=(',', ':'))
+
+    script = importlib.resources.files(
+        'gut_to_soil_manuscript_figures') / 'assets' / SCRIPT_FN
+    with importlib.resources.as_file(script) as script_path:
+        shutil.copyfile(script_path, os.path.join(output_dir, SCRIPT_FN))
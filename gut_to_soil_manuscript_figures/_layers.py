@@ -0,0 +1,53 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+# Plot-ready layer data of a single PCoA figure: every coordinate that's
+# drawn, already oriented (inverted & swapped), so that a figure that only
+# differs in its presentation (title, legend export, week annotations or
+# density threshold) can be redrawn without the metadata or ordination.
+# It's written as a single `.npz` of named arrays:
+#
+#   fig_aspect, x_label, y_label       scalars, as set by the orientation
+#   average, himalaya, pit_toilet,     the plot's 'True'/'False' layer flags,
+#   highlighted_buckets                & highlighted bucket(s) string
+#   n_samples, extent                  number of ordination samples & their
+#                                      (xmin, xmax, ymin, ymax) bounds
+#   group/<name>                       (n, 2) XY of each background group
+#   buckets, bucket/<i>                composted bucket numbers & the XY of
+#                                      the i-th bucket's samples
+#   mean/weekly, mean/weeks,           (OPTIONAL) weekly HEC means & their
+#   mean/HE, mean/bulking              weeks, & the HE & bulking week 0 means
+#   highlighted, highlight/<i>/<part>  highlighted bucket numbers & the i-th
+#                                      one's trajectory (HEC, weeks) & start
+#                                      (HE_week0, bulk_week0, HEC_week1)
+
+import os
+
+import numpy as np
+
+LAYERS_FN = 'layers.npz'
+
+# the plot parameters that the layer data depends on; every other parameter
+# only changes how the layers are presented
+LAYER_PARAMETERS = ('invert_x', 'invert_y', 'swap_axes', 'average',
+                    'himalaya', 'pit_toilet', 'highlighted_buckets')
+
+
+def is_layers(path):
+    return str(path).endswith('.npz') and os.path.isfile(str(path))
+
+
+def write_layers(path, layers):
+    np.savez(path, **layers)
+
+
+def read_layers(path):
+    # scalars are returned as python values, as they were written
+    with np.load(str(path)) as layers:
+        return {name: layers[name].item() if layers[name].ndim == 0
+                else layers[name] for name in layers.files}
@@ -0,0 +1,79 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from functools import partial
+
+import pandas as pd
+
+# the only metadata columns that the PCoA figures use, and the compact dtypes
+# that they're loaded with
+PLOT_COLUMNS = ['SampleType', 'Bucket', 'Composting Time Point']
+PLOT_DTYPES = {
+    'SampleType': 'category',
+    'Bucket': 'float32',
+    'Composting Time Point': 'float32'
+}
+
+# the number of metadata rows parsed at a time when only the rows of given
+# sample IDs are kept
+METADATA_CHUNKSIZE = 100_000
+
+
+def check_metadata_ids(md_ids, ids):
+    """Raises a `KeyError` for any of `ids` that aren't in `md_ids`."""
+    ids = pd.Index(ids)
+    missing = ids[~ids.isin(md_ids)]
+    if len(missing):
+        raise KeyError(f'{len(missing)} ordination sample(s) are missing from'
+                       f' the metadata: {list(missing[:10])}'
+                       f'{" ..." if len(missing) > 10 else ""}')
+
+
+def plot_metadata(metadata, ids=None):
+    """Projects a `qiime2.Metadata` onto the typed `PLOT_COLUMNS`.
+
+    Only these columns are ever materialized, so the cost doesn't grow with
+    the number of unrelated columns in the metadata. Given the (ordination)
+    sample `ids`, only their rows are kept (in the metadata's order) & cast.
+    """
+    md = pd.concat([metadata.get_column(column).to_series()
+                    for column in PLOT_COLUMNS], axis=1)
+    if ids is not None:
+        check_metadata_ids(md.index, ids)
+        md = md[md.index.isin(ids)]
+
+    return md.astype(PLOT_DTYPES)
+
+
+def read_plot_metadata(fp, ids=None, chunksize=METADATA_CHUNKSIZE):
+    """Reads just the typed `PLOT_COLUMNS` from a metadata TSV.
+
+    Given the (ordination) sample `ids`, the file is streamed in chunks of
+    `chunksize` rows & only their rows are kept (in the file's order), so
+    memory use is proportional to the plotted samples rather than to the
+    metadata. Any of `ids` missing from the file raise a `KeyError` before
+    anything is plotted. Directive (e.g. `#q2:types`) & comment rows are
+    skipped.
+    """
+    # read as strings & only cast once the directive rows (whose values,
+    # e.g. 'numeric', aren't numbers) have been dropped
+    read = partial(pd.read_csv, str(fp), sep='\t',
+                   usecols=['sample-id', *PLOT_COLUMNS], dtype=str,
+                   index_col='sample-id')
+    if ids is None:
+        md = read()
+        md = md[~md.index.str.startswith('#', na=False)]
+    else:
+        ids = pd.Index(ids)
+        with read(chunksize=chunksize) as chunks:
+            kept = [chunk[chunk.index.isin(ids)] for chunk in chunks]
+        kept = [chunk for chunk in kept if len(chunk)]
+        md = pd.concat(kept) if kept else read(nrows=0)
+        check_metadata_ids(md.index, ids)
+
+    return md.astype(PLOT_DTYPES)
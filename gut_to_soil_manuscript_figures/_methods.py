@@ -6,67 +6,146 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import html
+import importlib.resources
 import os
-import pkg_resources
-import skbio
+import struct
 import subprocess
+import tempfile
 
 import qiime2
+from q2_types.ordination import OrdinationFormat
+
+from ._cache import RenderCache, render_key
+from ._handoff import write_handoff
+from ._interactive import interactive_payload, write_interactive
+from ._layers import LAYER_PARAMETERS, LAYERS_FN
+from ._metadata import plot_metadata
+from ._orientation import align_to_reference, canonical_orientation
+from ._ordination import read_ordination_axes
+from ._profile import Profiler, activate, read_report, stage
+from ._selection import DENSITY_THRESHOLD, filter_plot_metadata
+from ._server import render_on_server
+from ._trajectory import BucketTrajectories, bucket_trajectories
+
+
+def trajectory_index(metadata: qiime2.Metadata,
+                     ordination: OrdinationFormat) -> BucketTrajectories:
+    ordination = _read_ordination(ordination)
+    md = plot_metadata(metadata, ordination.samples.index)
+
+    ord_2d = ordination.samples.iloc[:, 0:2].set_axis([0, 1], axis=1)
+    _, selector = filter_plot_metadata(md, ord_2d)
+
+    return bucket_trajectories(selector, ord_2d)
 
 
 def pcoa_2d(output_dir: str, metadata: qiime2.Metadata,
-            ordination: skbio.OrdinationResults,
+            ordination: OrdinationFormat,
             measure: str = 'Unweighted Unifrac',
             average: bool = False, week_annotations: bool = False,
             invert_x: bool = False, invert_y: bool = False,
             swap_axes: bool = False, himalaya: bool = False,
             pit_toilet: bool = False, export_legend: bool = False,
-            highlighted_buckets: str = ''):
-
-    md = metadata.to_dataframe()
-
-    metadata_fp = os.path.join(output_dir, 'metadata.tsv')
-    ordination_fp = os.path.join(output_dir, 'ordination.txt')
-
-    md.to_csv(metadata_fp, sep='\t', index_label='sample-id')
-    ordination.write(ordination_fp)
-
-    script_path = \
-        pkg_resources.resource_filename(
-            'gut_to_soil_manuscript_figures',
-            'scripts/plot_pcoa_2d.py'
-        )
-
-    average = str(average)
-    week_annotations = str(week_annotations)
-    invert_x = str(invert_x)
-    invert_y = str(invert_y)
-    swap_axes = str(swap_axes)
-    himalaya = str(himalaya)
-    pit_toilet = str(pit_toilet)
-    export_legend = str(export_legend)
-
-    plot_fp = os.path.join(output_dir, 'pcoa_plot.png')
-    legend_fp = os.path.join(output_dir, 'legend.png')
-
-    command = [
-        'python', script_path,
-        metadata_fp,
-        ordination_fp,
-        measure,
-        average,
-        week_annotations,
-        plot_fp,
-        invert_x,
-        invert_y,
-        swap_axes,
-        himalaya,
-        pit_toilet,
-        export_legend,
-        highlighted_buckets,
-        legend_fp
-    ]
-    subprocess.run(command, check=True)
+            highlighted_buckets: str = '', isolate: bool = False,
+            use_cache: bool = False, profile: bool = False,
+            density_threshold: int = DENSITY_THRESHOLD,
+            interactive: bool = False,
+            trajectory_index: BucketTrajectories = None,
+            orientation: str = 'manual',
+            reference: OrdinationFormat = None,
+            vector_formats: list = None, dpi: int = None,
+            max_pixels: int = None):
+
+    # stages are only timed when profiling, otherwise they're no-ops
+    profiler = Profiler('pcoa_2d') if profile else None
+    with activate(profiler):
+        with stage('read_ordination'):
+            ordination = _read_ordination(ordination)
+        with stage('project_metadata'):
+            md = plot_metadata(metadata, ordination.samples.index)
+
+        # resolved to the same flags that can be set by hand
+        with stage('orient'):
+            swap_axes, invert_x, invert_y = _orient(
+                orientation, md, ordination, reference, swap_axes, invert_x,
+                invert_y)
+
+        plot_fp = os.path.join(output_dir, 'pcoa_plot.png')
+        legend_fp = os.path.join(output_dir, 'legend.png')
+
+        plot_spec = _plot_spec(measure, average, week_annotations, plot_fp,
+                               invert_x, invert_y, swap_axes, himalaya,
+                               pit_toilet, export_legend, highlighted_buckets,
+                               legend_fp, density_threshold, vector_formats,
+                               dpi, max_pixels)
+
+        if use_cache:
+            # the key covers every parameter that affects the images, but not
+            # where they're written to
+            with stage('cache_lookup'):
+                cache = RenderCache()
+                key = render_key(md, ordination,
+                                 {k: v for k, v in plot_spec.items()
+                                  if k not in ('plot_fp', 'legend_fp')},
+                                 trajectory_index)
+                cached = cache.get(key, output_dir)
+
+                # figures that only differ in their presentation (e.g. the
+                # title or the legend export) are drawn from the same layer
+                # data, which is cached separately
+                layers_key = render_key(
+                    md, ordination,
+                    {'layers': {k: plot_spec[k] for k in LAYER_PARAMETERS}},
+                    trajectory_index)
+        else:
+            cached = False
+
+        if not cached:
+            with tempfile.TemporaryDirectory(
+                    prefix='pcoa-2d-layers-') as layers_dir:
+                # the cached layer data is copied out of the cache before
+                # it's drawn, so that it can't be evicted in the meantime
+                layers_cached = False
+                if use_cache:
+                    with stage('cache_lookup'):
+                        layers_cached = cache.get(layers_key, layers_dir)
+
+                if layers_cached:
+                    # redrawing from the cached layer data alone
+                    from_layers = os.path.join(layers_dir, LAYERS_FN)
+                    layers_fp = None
+                else:
+                    from_layers = None
+                    layers_fp = os.path.join(layers_dir, LAYERS_FN) \
+                        if use_cache else None
+
+                _render_pcoa_2d(md, ordination, plot_spec, isolate,
+                                profiler, trajectory_index, from_layers,
+                                layers_fp)
+
+                if use_cache:
+                    outputs = ['pcoa_plot.png']
+                    outputs += [f'pcoa_plot.{fmt}'
+                                for fmt in vector_formats or []]
+                    if export_legend:
+                        outputs.append('legend.png')
+                    with stage('cache_store'):
+                        cache.put(key, output_dir, outputs)
+                        if layers_fp is not None:
+                            cache.put(layers_key, layers_dir, [LAYERS_FN])
+
+        # the interactive plot is drawn by the browser from the loaded inputs,
+        # so it doesn't need anything from the static render
+        if interactive:
+            with stage('interactive_payload'):
+                write_interactive(output_dir, interactive_payload(
+                    md, ordination, measure, invert_x, invert_y, swap_axes,
+                    himalaya, pit_toilet, highlighted_buckets, average))
+
+    if profile:
+        report = profiler.report()
+        profiler.write(os.path.join(output_dir, 'profile.json'), report)
 
     with open(os.path.join(output_dir, 'index.html'), 'w') as f:
         f.write('''
@@ -79,12 +158,375 @@ def pcoa_2d(output_dir: str, metadata: qiime2.Metadata,
             <h1>2D PCoA Plot</h1>
             <img src="pcoa_plot.png" alt="PCoA Plot">
         ''')
-        if export_legend == 'True':
+        width, height = _png_size(os.path.join(output_dir, 'pcoa_plot.png'))
+        f.write(f'''
+            <p>
+            <a href="pcoa_plot.png">PNG</a> ({width} &times; {height} px)
+        ''')
+        for fmt in vector_formats or []:
+            f.write(f'''
+            &middot; <a href="pcoa_plot.{fmt}">{fmt.upper()}</a>
+            ''')
+        f.write('''
+            </p>
+        ''')
+        if export_legend:
             f.write('''
                     <p>
                     <img src="legend.png" alt="PCoA Plot legend">
                     ''')
+        if orientation != 'manual':
+            f.write(f'''
+            <p>
+            Orientation ({html.escape(orientation)}):
+            swap_axes={swap_axes}, invert_x={invert_x}, invert_y={invert_y}
+            </p>
+            ''')
+        if interactive:
+            f.write('''
+            <h2>Interactive plot</h2>
+            <p>
+            Hover over a sample to see its ID, and use the checkboxes to
+            show or hide sample groups and to highlight buckets.
+            </p>
+            <div id="pcoa-interactive"></div>
+            <script src="pcoa_2d.js"></script>
+            ''')
+        if profile:
+            f.write(_profile_html(report))
+        f.write('''
+        </body>
+        </html>
+        ''')
+
+
+# renders a single figure, either from the inputs (optionally writing its
+# layer data to `layers_fp`) or from the layer data of an earlier render
+def _render_pcoa_2d(md, ordination, plot_spec, isolate, profiler,
+                    trajectories=None, from_layers=None, layers_fp=None):
+    if isolate:
+        # the script's own stage report, when profiling
+        script_report = \
+            _plot_pcoa_2d_subprocess(md, ordination, plot_spec,
+                                     profile=profiler is not None,
+                                     trajectories=trajectories,
+                                     from_layers=from_layers,
+                                     layers_fp=layers_fp)
+        if profiler is not None:
+            profiler.merge(script_report)
+    elif from_layers is not None:
+        # imported here so that matplotlib is only loaded when rendering
+        from .scripts.plot_pcoa_2d import plot_pcoa_2d_layers
+        plot_pcoa_2d_layers(from_layers, **{k: plot_spec[k] for k in (
+            'measure', 'week_annotations', 'plot_fp', 'export_legend',
+            'legend_fp', 'density_threshold', *_OUTPUT_PARAMETERS)})
+    else:
+        from .scripts.plot_pcoa_2d import plot_pcoa_2d
+        plot_pcoa_2d(md, ordination, **plot_spec, trajectories=trajectories,
+                     layers_fp=layers_fp)
+
+
+# the stage timing report, as a table for the visualization
+def _profile_html(report):
+    rows = ''.join(f'''
+                <tr>
+                    <td>{html.escape(entry['process'])}</td>
+                    <td>{html.escape(entry['stage'])}</td>
+                    <td>{entry['calls']}</td>
+                    <td>{entry['seconds']:.3f}</td>
+                    <td>{entry['peak_rss_bytes'] / 1024 ** 2:.1f}</td>
+                </tr>''' for entry in report['stages'])
+
+    return f'''
+            <h2>Stage timings</h2>
+            <p>
+            Total: {report['wall_seconds']:.3f} s,
+            peak RSS: {report['peak_rss_bytes'] / 1024 ** 2:.1f} MiB
+            (<a href="profile.json">profile.json</a>).
+            Nested stages are included in the time of the stage they're in.
+            </p>
+            <table>
+                <tr>
+                    <th>Process</th>
+                    <th>Stage</th>
+                    <th>Calls</th>
+                    <th>Seconds</th>
+                    <th>Peak RSS (MiB)</th>
+                </tr>{rows}
+            </table>
+            '''
+
+
+def pcoa_2d_batch(output_dir: str, metadata: qiime2.Metadata,
+                  ordination: OrdinationFormat, specs: list,
+                  measure: str = 'Unweighted Unifrac',
+                  week_annotations: bool = False,
+                  export_legend: bool = False, n_jobs: int = 1,
+                  density_threshold: int = DENSITY_THRESHOLD,
+                  trajectory_index: BucketTrajectories = None,
+                  blit: bool = False):
+
+    ordination = _read_ordination(ordination)
+    md = plot_metadata(metadata, ordination.samples.index)
+
+    plot_specs = []
+    for i, spec in enumerate(specs, start=1):
+        params = _parse_render_spec(spec)
+        plot_specs.append(_plot_spec(
+            measure=measure,
+            week_annotations=week_annotations,
+            plot_fp=os.path.join(output_dir, f'pcoa_plot_{i}.png'),
+            export_legend=export_legend,
+            legend_fp=os.path.join(output_dir, f'legend_{i}.png'),
+            density_threshold=density_threshold,
+            **params))
+
+    # imported here so that matplotlib is only loaded when rendering
+    from .scripts.plot_pcoa_2d import plot_pcoa_2d_batch
+    plot_pcoa_2d_batch(md, ordination, plot_specs, n_jobs=n_jobs,
+                       trajectories=trajectory_index, blit=blit)
+
+    with open(os.path.join(output_dir, 'index.html'), 'w') as f:
+        f.write('''
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>2D PCoA Plots</title>
+        </head>
+        <body>
+            <h1>2D PCoA Plots</h1>
+        ''')
+        for i, spec in enumerate(specs, start=1):
+            f.write(f'''
+            <h2>{i}. {html.escape(spec) or 'defaults'}</h2>
+            <img src="pcoa_plot_{i}.png" alt="PCoA Plot {i}">
+            ''')
+            if export_legend:
+                f.write(f'''
+                    <p>
+                    <img src="legend_{i}.png" alt="PCoA Plot {i} legend">
+                    ''')
         f.write('''
         </body>
         </html>
         ''')
+
+
+def pcoa_2d_grid(output_dir: str, metadata: qiime2.Metadata,
+                 ordinations: OrdinationFormat,
+                 average: bool = False, week_annotations: bool = False,
+                 invert_x: bool = False, invert_y: bool = False,
+                 swap_axes: bool = False, himalaya: bool = False,
+                 pit_toilet: bool = False, export_legend: bool = False,
+                 highlighted_buckets: str = '', n_columns: int = 2,
+                 density_threshold: int = DENSITY_THRESHOLD):
+
+    # the metadata is projected (& later filtered & sorted) only once for
+    # every ordination, keeping the rows of any of their samples; they're
+    # plotted in the collection's order & titled with their keys
+    ordinations = {measure: _read_ordination(ordination)
+                   for measure, ordination in ordinations.items()}
+    md = plot_metadata(metadata, sorted(set().union(
+        *(ordination.samples.index for ordination in ordinations.values()))))
+
+    plot_spec = _plot_spec(
+        None, average, week_annotations,
+        os.path.join(output_dir, 'pcoa_grid.png'), invert_x, invert_y,
+        swap_axes, himalaya, pit_toilet, export_legend, highlighted_buckets,
+        os.path.join(output_dir, 'legend.png'), density_threshold)
+    del plot_spec['measure']
+
+    # imported here so that matplotlib is only loaded when rendering
+    from .scripts.plot_pcoa_2d import plot_pcoa_2d_grid
+    plot_pcoa_2d_grid(md, ordinations, n_columns=n_columns, **plot_spec)
+
+    with open(os.path.join(output_dir, 'index.html'), 'w') as f:
+        f.write(f'''
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>2D PCoA Plots</title>
+        </head>
+        <body>
+            <h1>2D PCoA Plots</h1>
+            <p>{html.escape(', '.join(ordinations))}</p>
+            <img src="pcoa_grid.png" alt="PCoA Plots">
+        ''')
+        if export_legend:
+            f.write('''
+                    <p>
+                    <img src="legend.png" alt="PCoA Plots legend">
+                    ''')
+        f.write('''
+        </body>
+        </html>
+        ''')
+
+
+# util for resolving the `orientation` of a plot to its axis flags
+def _orient(orientation, md, ordination, reference, swap_axes, invert_x,
+            invert_y):
+    if orientation != 'reference' and reference is not None:
+        raise ValueError('A reference ordination is only used when'
+                         ' `orientation` is "reference".')
+
+    ord_2d = ordination.samples.iloc[:, 0:2]
+    if orientation == 'manual':
+        return swap_axes, invert_x, invert_y
+    elif orientation == 'canonical':
+        return canonical_orientation(md, ord_2d, swap_axes)
+    elif orientation == 'reference':
+        if reference is None:
+            raise ValueError('A reference ordination is required when'
+                             ' `orientation` is "reference".')
+        return align_to_reference(
+            ord_2d, _read_ordination(reference).samples.iloc[:, 0:2])
+
+    raise ValueError(f'Invalid value {orientation!r} for `orientation`.'
+                     ' Must be one of "manual", "canonical" or'
+                     ' "reference".')
+
+
+# the ordination is taken as its file format (rather than as an
+# `skbio.OrdinationResults`) so that registering the plugin doesn't import
+# scikit-bio, & so that only the axes used by the figures are parsed
+def _read_ordination(ordination):
+    # already loaded, e.g. an `skbio.OrdinationResults` passed in directly
+    if hasattr(ordination, 'samples'):
+        return ordination
+
+    return read_ordination_axes(str(ordination))
+
+
+# the (width, height) of a PNG image, from its header
+def _png_size(fp):
+    with open(fp, 'rb') as fh:
+        header = fh.read(24)
+
+    return struct.unpack('>II', header[16:24])
+
+
+# the `_plot_spec` parameters that follow the profile & layer data paths on
+# the script's command line
+_OUTPUT_PARAMETERS = ('vector_formats', 'dpi', 'max_pixels')
+
+
+# the plotting script takes its flags as 'True'/'False' strings so that
+# it can be driven identically from the command line and in-process
+def _plot_spec(measure, average, week_annotations, plot_fp, invert_x,
+               invert_y, swap_axes, himalaya, pit_toilet, export_legend,
+               highlighted_buckets, legend_fp,
+               density_threshold=DENSITY_THRESHOLD, vector_formats=None,
+               dpi=None, max_pixels=None):
+    # ordered to match the script's command line arguments (see
+    # `_OUTPUT_PARAMETERS`), with the vector formats comma-separated & an
+    # unset DPI or maximum number of pixels as an empty string
+    return {
+        'measure': measure,
+        'average': str(average),
+        'week_annotations': str(week_annotations),
+        'plot_fp': plot_fp,
+        'invert_x': str(invert_x),
+        'invert_y': str(invert_y),
+        'swap_axes': str(swap_axes),
+        'himalaya': str(himalaya),
+        'pit_toilet': str(pit_toilet),
+        'export_legend': str(export_legend),
+        'highlighted_buckets': highlighted_buckets,
+        'legend_fp': legend_fp,
+        'density_threshold': str(density_threshold),
+        'vector_formats': ','.join(vector_formats or []),
+        'dpi': '' if dpi is None else str(dpi),
+        'max_pixels': '' if max_pixels is None else str(max_pixels)
+    }
+
+
+# the per-figure parameters that can be set in a `pcoa_2d_batch` spec
+_RENDER_SPEC_DEFAULTS = {
+    'highlighted_buckets': '',
+    'average': False,
+    'swap_axes': False,
+    'invert_x': False,
+    'invert_y': False,
+    'himalaya': False,
+    'pit_toilet': False
+}
+
+
+# specs are semicolon-separated `parameter=value` pairs, where boolean
+# parameters can be given on their own to enable them,
+# e.g. 'highlighted_buckets=2, 3; average; swap_axes=False'
+def _parse_render_spec(spec):
+    params = dict(_RENDER_SPEC_DEFAULTS)
+
+    for item in spec.split(';'):
+        if not item.strip():
+            continue
+
+        key, sep, value = item.partition('=')
+        key = key.strip()
+        value = value.strip()
+
+        if key not in params:
+            raise ValueError(
+                f'Unrecognized parameter {key!r} in render spec {spec!r}.'
+                f' Must be one of: {", ".join(_RENDER_SPEC_DEFAULTS)}.')
+
+        if key == 'highlighted_buckets':
+            params[key] = value
+        elif not sep:
+            params[key] = True
+        elif value in ('True', 'true'):
+            params[key] = True
+        elif value in ('False', 'false'):
+            params[key] = False
+        else:
+            raise ValueError(
+                f'Invalid value {value!r} for {key!r} in render spec'
+                f' {spec!r}. Must be either `True` or `False`.')
+
+    return params
+
+
+# renders the plot on the render server when there's one available (see
+# `_server`), & otherwise in a fresh interpreter, handing the inputs over as
+# memory-mappable binary files rather than text that has to be re-parsed
+def _plot_pcoa_2d_subprocess(md, ordination, plot_spec, profile=False,
+                             trajectories=None, from_layers=None,
+                             layers_fp=None):
+    script = importlib.resources.files(
+        'gut_to_soil_manuscript_figures') / 'scripts' / 'plot_pcoa_2d.py'
+
+    with importlib.resources.as_file(script) as script_path, \
+            tempfile.TemporaryDirectory(
+                prefix='pcoa-2d-inputs-') as inputs_dir:
+        # the layer data of an earlier render is handed over as is
+        if from_layers is not None:
+            inputs = from_layers
+        else:
+            with stage('serialize_handoff'):
+                write_handoff(inputs_dir, md, ordination, trajectories)
+            inputs = inputs_dir
+
+        # the hand-off directory holds both the metadata & the ordination;
+        # the script writes its own stage report, which is returned so that
+        # it can be merged into the caller's
+        args = [
+            inputs,
+            inputs,
+            *(value for param, value in plot_spec.items()
+              if param not in _OUTPUT_PARAMETERS),
+            os.path.join(inputs_dir, 'profile.json') if profile else '',
+            layers_fp or '',
+            *(plot_spec[param] for param in _OUTPUT_PARAMETERS)
+        ]
+
+        with stage('render_server'):
+            served = render_on_server(args)
+        if not served:
+            with stage('subprocess'):
+                subprocess.run(['python', str(script_path), *args],
+                               check=True)
+
+        if profile:
+            return read_report(os.path.join(inputs_dir, 'profile.json'))
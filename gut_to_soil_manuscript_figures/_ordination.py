@@ -0,0 +1,95 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+# Streaming reader for the (scikit-bio) ordination text format, which only
+# keeps the leading axes that the PCoA figures use:
+#
+#   Eigvals<tab>n
+#   ...
+#
+#   Proportion explained<tab>n
+#   ...
+#
+#   Species<tab>rows<tab>cols
+#   ...
+#
+#   Site<tab>rows<tab>cols
+#   <sample-id><tab><axis 1><tab><axis 2><tab>...
+#   ...
+#
+# followed by the biplot & site constraints sections, which are never read.
+
+import collections
+
+import numpy as np
+import pandas as pd
+
+# the subset of an `skbio.OrdinationResults` that the figures use, with the
+# same attribute names so that either can be passed around
+OrdinationAxes = collections.namedtuple(
+    'OrdinationAxes', ['samples', 'proportion_explained'])
+
+
+def _section_header(fh, name):
+    # skipping the blank lines between sections
+    line = fh.readline()
+    while line and not line.strip():
+        line = fh.readline()
+
+    fields = line.rstrip('\r\n').split('\t')
+    if fields[0] != name:
+        raise ValueError(f'Expected the {name!r} section of the ordination,'
+                         f' found {line.strip()!r} instead.')
+
+    return [int(field) for field in fields[1:]]
+
+
+def read_ordination_axes(fp, n_axes=2):
+    """Reads the first `n_axes` sample coordinates of an ordination.
+
+    The eigenvalues & feature (species) coordinates are skipped over without
+    being parsed, only the first `n_axes` fields of each sample (site) row
+    are split off & converted, & the file isn't read past the samples.
+    """
+    with open(str(fp)) as fh:
+        n_eigvals, = _section_header(fh, 'Eigvals')
+        if n_eigvals:
+            fh.readline()
+
+        n_prop_explained, = _section_header(fh, 'Proportion explained')
+        if n_prop_explained < n_axes:
+            raise ValueError(
+                f'The ordination has the proportion explained of'
+                f' {n_prop_explained} axes, but {n_axes} are required.')
+        prop_explained = np.array(
+            fh.readline().split('\t', n_axes)[:n_axes], dtype=np.float64)
+
+        n_features, _ = _section_header(fh, 'Species')
+        for _ in range(n_features):
+            fh.readline()
+
+        n_samples, n_dims = _section_header(fh, 'Site')
+        if n_dims < n_axes:
+            raise ValueError(
+                f'The ordination has {n_dims} axes, but {n_axes} are'
+                ' required.')
+
+        # only the ID & leading axis fields of each row are split off &
+        # converted, regardless of how many axes there are
+        ids = []
+        coordinates = []
+        for _ in range(n_samples):
+            fields = fh.readline().split('\t', n_axes + 1)
+            ids.append(fields[0])
+            coordinates.extend(fields[1:n_axes + 1])
+
+    samples = pd.DataFrame(
+        np.array(coordinates, dtype=np.float64).reshape(-1, n_axes),
+        index=pd.Index(ids, dtype=object))
+
+    return OrdinationAxes(samples, pd.Series(prop_explained))
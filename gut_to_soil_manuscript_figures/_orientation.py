@@ -0,0 +1,84 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+# Automatic orientation of the first two ordination axes, resolved to the
+# same (`swap_axes`, `invert_x`, `invert_y`) flags that can be set by hand.
+# As with those flags, `invert_x` & `invert_y` flip PCoA 1 & 2 (before any
+# swapping), so the axes keep their labels & proportion explained.
+
+import itertools
+
+import numpy as np
+
+from ._selection import PLOT_SAMPLE_TYPES, SampleSelector
+from ._trajectory import COMPOSTED_TYPE
+
+# every (swap_axes, invert_x, invert_y) combination, & the matrices that
+# map (PC1, PC2) coordinates to plot XY for each of them
+ORIENTATIONS = list(itertools.product((False, True), repeat=3))
+_SWAP = np.array([[0.0, 1.0], [1.0, 0.0]])
+_TRANSFORMS = np.array([
+    np.diag([-1.0 if invert_x else 1.0, -1.0 if invert_y else 1.0]) @
+    (_SWAP if swap else np.eye(2))
+    for swap, invert_x, invert_y in ORIENTATIONS])
+
+
+def align_to_reference(ord_2d, reference_2d):
+    """The orientation that best superimposes `ord_2d` onto a reference.
+
+    This is an orthogonal Procrustes fit restricted to sign flips & axis
+    swaps (so that the axes are never rotated away from the PCoA axes),
+    over the samples in both ordinations. After centering both, the
+    residual of each candidate `T` is minimized by maximizing
+    `trace(Y' X T)`, which is scored for all 8 candidates at once.
+    """
+    shared = ord_2d.index.intersection(reference_2d.index)
+    if len(shared) < 2:
+        raise ValueError(
+            'The ordination and the reference ordination must have at least'
+            f' two samples in common to be aligned, found {len(shared)}.')
+
+    x = ord_2d.loc[shared].to_numpy(dtype=float)[:, 0:2]
+    y = reference_2d.loc[shared].to_numpy(dtype=float)[:, 0:2]
+    cross = (x - x.mean(axis=0)).T @ (y - y.mean(axis=0))
+
+    scores = np.einsum('ij,kij->k', cross, _TRANSFORMS)
+
+    return ORIENTATIONS[int(np.argmax(scores))]
+
+
+def canonical_orientation(md, ord_2d, swap_axes=False):
+    """Flips the axes so soils are on the left & week 1 HEC is at the top.
+
+    Soil samples are placed left of the center of all plotted samples (of
+    `PLOT_SAMPLE_TYPES`, so other samples in the metadata can't flip the
+    axes), & week 1 composted samples above it. Axes are never swapped
+    (`swap_axes` is kept as given), & an axis without the samples to decide
+    it isn't flipped.
+    """
+    selector = SampleSelector(md, ord_2d)
+    plotted = selector.of_type(*PLOT_SAMPLE_TYPES)
+    if not plotted.any():
+        return swap_axes, False, False
+
+    coords = ord_2d.to_numpy(dtype=float)[selector.positions, 0:2]
+    if swap_axes:
+        coords = coords @ _SWAP
+    center = coords[plotted].mean(axis=0)
+
+    soil = selector.of_type('Soil')
+    week1 = selector.of_type(COMPOSTED_TYPE) & selector.at_week(1)
+
+    flip_x = soil.any() and coords[soil, 0].mean() > center[0]
+    flip_y = week1.any() and coords[week1, 1].mean() < center[1]
+
+    # mapping the flips of the plot's axes back to those of PCoA 1 & 2
+    if swap_axes:
+        flip_x, flip_y = flip_y, flip_x
+
+    return swap_axes, bool(flip_x), bool(flip_y)
@@ -0,0 +1,102 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import contextlib
+import json
+import os
+import resource
+import sys
+import time
+
+
+def peak_rss():
+    # in bytes; `ru_maxrss` is reported in KiB everywhere but macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class Profiler:
+    """Collects the wall time & peak RSS of each stage of a render.
+
+    Stages are identified by name; entering a stage again (e.g. one that
+    runs once per sample group) adds to its time & call count. Stages can
+    be nested, in which case the outer stage's time includes the inner's.
+    The peak RSS of a stage is that of the process by the end of the stage.
+    """
+
+    def __init__(self, process):
+        self.process = process
+        self.stages = {}
+        self._start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            entry = self.stages.setdefault(
+                (self.process, name),
+                {'stage': name, 'process': self.process,
+                 'calls': 0, 'seconds': 0.0})
+            entry['calls'] += 1
+            entry['seconds'] += seconds
+            entry['peak_rss_bytes'] = peak_rss()
+
+    def merge(self, report):
+        # adds the stages of another (e.g. a subprocess's) report
+        for entry in report['stages']:
+            self.stages[(entry['process'], entry['stage'])] = entry
+
+    def report(self):
+        stages = list(self.stages.values())
+
+        return {
+            'wall_seconds': time.perf_counter() - self._start,
+            'peak_rss_bytes': max([peak_rss()] + [s['peak_rss_bytes']
+                                                  for s in stages]),
+            'stages': stages
+        }
+
+    def write(self, fp, report=None):
+        # an already-taken `report` is written as is, so that it matches
+        # wherever else it's shown
+        if report is None:
+            report = self.report()
+        with open(os.fspath(fp), 'w') as fh:
+            json.dump(report, fh, indent=2)
+
+
+# the profiler that `stage` records into, if any
+_active = None
+
+
+@contextlib.contextmanager
+def activate(profiler):
+    global _active
+    previous = _active
+    _active = profiler
+    try:
+        yield profiler
+    finally:
+        _active = previous
+
+
+def stage(name):
+    """Times a stage in the active profiler (a no-op when profiling is off)."""
+    if _active is None:
+        return contextlib.nullcontext()
+
+    return _active.stage(name)
+
+
+def read_report(fp):
+    with open(os.fspath(fp)) as fh:
+        return json.load(fh)
@@ -0,0 +1,329 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+
+from ._metadata import check_metadata_ids
+
+
+# the subject buckets from the gut-to-soil study, plus the bucket numbers
+# used to flag the external himalaya & pit toilet samples in the metadata
+SUBJECT_BUCKETS = (1, 16)
+HIMALAYA_BUCKET = 18.0
+PIT_TOILET_BUCKET = 19.0
+
+# the sample types that are drawn (himalaya & pit toilet samples are only
+# drawn when requested for a given figure)
+PLOT_SAMPLE_TYPES = ('Soil', 'Food Compost', 'Landscape Compost',
+                     'Human Excrement', 'Human Excrement Compost',
+                     'Bulking Material', 'Himalaya', 'Pit Toilet')
+
+# the default number of samples in a background group above which it's drawn
+# as a density image rather than one marker per sample
+DENSITY_THRESHOLD = 50_000
+
+
+# the code of a missing bucket or week in the selector's compact arrays
+MISSING = -1
+
+
+def _codes(values, dtype, column):
+    # whole-numbered (float) metadata values as compact integer codes
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    present = values[~missing]
+    info = np.iinfo(dtype)
+    if (present != np.round(present)).any() or \
+            (present < 0).any() or (present > info.max).any():
+        raise ValueError(f'{column!r} values must be whole numbers between 0 '
+                         f'& {info.max}.')
+
+    codes = np.full(len(values), MISSING, dtype=dtype)
+    codes[~missing] = present
+
+    return codes
+
+
+def _decoded(codes):
+    return np.where(codes == MISSING, np.nan, codes.astype(float))
+
+
+class SampleSelector:
+    """Resolves groups of samples present in both the metadata & ordination.
+
+    The metadata IDs are joined against the ordination's (hashed) index
+    exactly once, and the columns used for grouping are pulled out as
+    compact aligned arrays: an int8 code into the sample types, an int8
+    bucket & an int16 week (`MISSING` where there is none). Every sample
+    group is then a vectorized integer comparison over those arrays, &
+    each sample type or bucket mask is only computed once.
+    """
+
+    def __init__(self, md, ord_2d):
+        positions = ord_2d.index.get_indexer(md.index)
+        present = positions >= 0
+
+        self.ids = md.index.values[present]
+        self.positions = positions[present]
+
+        sample_types = pd.Categorical(md['SampleType'])
+        self.sample_types = np.asarray(sample_types.categories)
+        # (int8 codes, for up to 127 sample types)
+        self.type_code = sample_types.codes[present]
+        self.bucket_code = _codes(md['Bucket'].to_numpy(dtype=float)[present],
+                                  np.int8, 'Bucket')
+        self.week_code = _codes(
+            md['Composting Time Point'].to_numpy(dtype=float)[present],
+            np.int16, 'Composting Time Point')
+
+        self._masks = {}
+
+    # DECODED COLUMNS
+    @property
+    def sample_type(self):
+        sample_type = np.full(len(self.type_code), np.nan, dtype=object)
+        known = self.type_code != MISSING
+        sample_type[known] = self.sample_types[self.type_code[known]]
+
+        return sample_type
+
+    @property
+    def bucket(self):
+        return _decoded(self.bucket_code)
+
+    @property
+    def week(self):
+        return _decoded(self.week_code)
+
+    # MASKS
+    def _mask(self, key, compute):
+        # masks are shared between groups, so they're read-only
+        if key not in self._masks:
+            mask = compute()
+            mask.flags.writeable = False
+            self._masks[key] = mask
+
+        return self._masks[key]
+
+    def of_type(self, *sample_types):
+        def compute():
+            codes = pd.Index(self.sample_types).get_indexer(sample_types)
+            return np.isin(self.type_code, codes[codes >= 0])
+
+        return self._mask(('type', *sample_types), compute)
+
+    def in_bucket(self, bucket=None):
+        # no bucket selects every subject bucket
+        if bucket is None:
+            low, high = SUBJECT_BUCKETS
+            return self._mask(('bucket', None), lambda: (
+                (self.bucket_code >= low) & (self.bucket_code <= high)))
+
+        bucket = float(bucket)
+        return self._mask(('bucket', bucket),
+                          lambda: self.bucket_code == bucket)
+
+    def at_week(self, week=None):
+        # no week selects the samples without a composting time point
+        if week is None:
+            return self.week_code == MISSING
+
+        return self.week_code == float(week)
+
+    # SELECTION
+    def select(self, mask, by_week=False):
+        idx = np.flatnonzero(mask)
+        if by_week:
+            idx = idx[np.argsort(self.week_code[idx], kind='stable')]
+
+        return self._take(idx)
+
+    def _take(self, idx):
+        # what a sample group is returned as, given its samples' positions in
+        # the selector's arrays
+        return self.ids[idx]
+
+    # SAMPLE GROUPS
+    def human_excrement(self):
+        return self.select(self.of_type('Human Excrement') & self.in_bucket())
+
+    def bulking(self):
+        return self.select(self.of_type('Bulking Material'))
+
+    def composted(self, bucket=None):
+        return self.select(self.of_type('Human Excrement Compost') &
+                           self.in_bucket(bucket))
+
+    def composted_buckets(self):
+        # the subject buckets that have any composted samples
+        return np.unique(self.bucket_code[
+            self.of_type('Human Excrement Compost') & self.in_bucket()
+        ]).astype(float)
+
+    def week0(self, sample_type, bucket=None):
+        # week 0 inputs (i.e. HE & bulking) have no composting time point
+        mask = self.of_type(sample_type) & self.at_week()
+        if bucket is not None:
+            mask &= self.in_bucket(bucket)
+
+        return self.select(mask)
+
+    def composted_week(self, week, bucket=None):
+        mask = self.of_type('Human Excrement Compost') & self.at_week(week)
+        if bucket is not None:
+            mask &= self.in_bucket(bucket)
+
+        return self.select(mask)
+
+    def bucket_trajectory(self, bucket):
+        # weeks 1-52 for a single bucket, in time series order
+        return self.select(self.of_type('Human Excrement Compost') &
+                           self.in_bucket(bucket) & (self.week_code > 0),
+                           by_week=True)
+
+    def soil(self):
+        return self.select(self.of_type('Soil'))
+
+    def compost(self):
+        return self.select(self.of_type('Food Compost', 'Landscape Compost'))
+
+    def himalaya(self):
+        return self.select(self.in_bucket(HIMALAYA_BUCKET))
+
+    def pit_toilet(self):
+        return self.select(self.in_bucket(PIT_TOILET_BUCKET))
+
+
+class CoordinateView(SampleSelector):
+    """The plot coordinates of a `SampleSelector`'s samples, oriented once.
+
+    Serves the same sample groups as the selector, but as (n, 2) arrays of
+    plot XY coordinates rather than IDs. Axis inversion & swapping are
+    applied once to a single contiguous array, whose rows are ordered so
+    that each background group (a sample type, each bucket's composted
+    samples & the himalaya or pit toilet samples) is one contiguous run in
+    the selector's order. Those groups are returned as zero-copy slices of
+    that array, & any other group as a (copied) positional take from it.
+    """
+
+    def __init__(self, selector, ord_2d, swap_axes=False, invert_x=False,
+                 invert_y=False):
+        # sharing the selector's (already joined) arrays
+        self.ids = selector.ids
+        self.positions = selector.positions
+        self.sample_types = selector.sample_types
+        self.type_code = selector.type_code
+        self.bucket_code = selector.bucket_code
+        self.week_code = selector.week_code
+        self._masks = selector._masks
+
+        # (PC1, PC2) -> plot XY, with the axes inverted before being swapped
+        signs = np.array([-1.0 if invert_x else 1.0,
+                          -1.0 if invert_y else 1.0])
+        self._columns = [1, 0] if swap_axes else [0, 1]
+        self._signs = signs[self._columns]
+
+        self._index = ord_2d.index
+        self._coords = np.asarray(ord_2d, dtype=float)[:, 0:2]
+
+        order = np.lexsort((self._run_key(), self._run()))
+        self._xy = self._orient(self._coords[self.positions[order]])
+        # the row in `_xy` of each of the selector's samples
+        self._rows = np.empty(len(order), dtype=np.intp)
+        self._rows[order] = np.arange(len(order))
+
+        # the (xmin, xmax, ymin, ymax) of every ordination sample, whether
+        # plotted or not; inverting an axis negates & swaps its bounds
+        low = np.nanmin(self._coords, axis=0)
+        high = np.nanmax(self._coords, axis=0)
+        bounds = np.where(signs > 0, [low, high], [-high, -low])
+        self.extent = bounds[:, self._columns].T.ravel()
+        self.n_samples = len(self._index)
+
+    def _run(self):
+        # the run that each sample is stored in, matching the groups drawn
+        runs = (('Human Excrement',), ('Bulking Material',),
+                ('Human Excrement Compost',), ('Soil',),
+                ('Food Compost', 'Landscape Compost'))
+        run = np.full(len(self.ids), len(runs) + 2)
+        for code, sample_types in enumerate(runs):
+            run[self.of_type(*sample_types)] = code
+        run[self.in_bucket(HIMALAYA_BUCKET)] = len(runs)
+        run[self.in_bucket(PIT_TOILET_BUCKET)] = len(runs) + 1
+
+        return run
+
+    def _run_key(self):
+        # composted samples are split by bucket, & HE samples into those in
+        # & out of the subject buckets (without reordering the rest of them)
+        composted = self.of_type('Human Excrement Compost')
+        return np.where(composted, self.bucket_code,
+                        np.where(self.of_type('Human Excrement') &
+                                 ~self.in_bucket(), 1.0, 0.0))
+
+    def _orient(self, coords):
+        xy = coords[:, self._columns]
+        xy *= self._signs
+
+        return xy
+
+    def _take(self, idx):
+        rows = self._rows[idx]
+        if len(rows) and rows[-1] - rows[0] + 1 == len(rows) and \
+                np.all(np.diff(rows) == 1):
+            return self._xy[rows[0]:rows[-1] + 1]
+
+        return self._xy[rows]
+
+    def of_ids(self, ids):
+        """The plot XY of the given (ordination) sample IDs, in order."""
+        rows = self._index.get_indexer(ids)
+        if (rows < 0).any():
+            raise KeyError(f'{list(np.asarray(ids)[rows < 0])} not in index')
+
+        return self._orient(self._coords[rows])
+
+    def orient_table(self, table):
+        """Orients a table's `PC1` & `PC2` columns as plot (X, Y) columns."""
+        columns = ['PC1', 'PC2']
+        oriented = table[[columns[i] for i in self._columns]] * self._signs
+
+        return oriented.set_axis(['X', 'Y'], axis=1)
+
+
+def sort_plot_metadata(metadata):
+    """Filters the metadata to the plotted sample types & sorts it by week.
+
+    The `Bucket` & `Composting Time Point` columns are cast to float. This
+    doesn't depend on the ordination, so it can be done once for any number
+    of ordinations of the same samples.
+    """
+    # sorting the filtered md (by allowed sample types) by week
+    md = metadata[metadata['SampleType']
+                  .isin(PLOT_SAMPLE_TYPES)].sort_values('Composting Time Point')
+    md['Bucket'] = md['Bucket'].astype(float)
+    md['Composting Time Point'] = md['Composting Time Point'].astype(float)
+
+    return md
+
+
+def filter_plot_metadata(metadata, ord_2d):
+    """Filters & sorts the metadata, & joins it against the ordination.
+
+    Returns the metadata of the plotted samples (sorted by week, with float
+    `Bucket` & `Composting Time Point` columns) and its `SampleSelector`.
+    Raises a `KeyError` for ordination samples missing from the metadata.
+    """
+    # filtering metadata to only include samples w/IDs present in ordination
+    check_metadata_ids(metadata.index, ord_2d.index)
+    md = sort_plot_metadata(metadata.loc[ord_2d.index.values])
+
+    # joining the md against the ordination once; every sample group
+    # is resolved from this index
+    return md, SampleSelector(md, ord_2d)
@@ -0,0 +1,410 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+# A long-lived render server for isolated `pcoa_2d` renders, which keeps
+# pandas, scikit-bio & matplotlib imported between renders:
+#
+#   python -m gut_to_soil_manuscript_figures._server SOCKET
+#       [--workers N] [--max-queue N] [--timeout SECONDS]
+#
+# `pcoa_2d(isolate=True)` hands its renders to the server listening on
+# `$GUT_TO_SOIL_FIGURES_RENDER_SOCKET` when there is one, and otherwise runs
+# the plotting script in a fresh interpreter as before.
+#
+# Clients send a single JSON request per connection, on one line, & get a
+# single JSON response line back:
+#
+#   {"op": "health"}  ->  {"ok": true, "version": ..., "running": ..., ...}
+#   {"op": "render", "args": [...], "cwd": ...}  ->  {"ok": true}
+#                                               or  {"ok": false, ...}
+#
+# where `args` are the plotting script's command line arguments (with any
+# relative paths relative to `cwd`), so a job only carries the paths of the
+# hand-off directory (or layer data) & output files, never the data itself.
+# A render that can't be queued because the queue is full is rejected
+# straight away with `"busy": true`.
+
+import argparse
+import collections
+import contextlib
+import json
+import os
+import selectors
+import signal
+import socket
+import sys
+import time
+import traceback
+
+from . import __version__
+
+RENDER_SOCKET_ENV = 'GUT_TO_SOIL_FIGURES_RENDER_SOCKET'
+
+DEFAULT_WORKERS = 1
+DEFAULT_MAX_QUEUE = 8
+# seconds that a single render may take before it's killed
+DEFAULT_TIMEOUT = 600.0
+# seconds that a client waits for the server to answer a health check
+HEALTH_TIMEOUT = 2.0
+
+# requests are a single short line, so anything longer is malformed
+MAX_REQUEST_SIZE = 64 * 1024
+# the end of a failed render's traceback that's sent back to the client
+MAX_ERROR_SIZE = 4 * 1024
+# seconds between checks on the running renders
+POLL_INTERVAL = 0.05
+
+
+class RenderError(RuntimeError):
+    """A render that the server accepted failed or timed out."""
+
+
+def _send(conn, response):
+    try:
+        conn.sendall(json.dumps(response).encode() + b'\n')
+    except OSError:
+        # the client has gone away, so there's no one left to tell
+        pass
+    finally:
+        conn.close()
+
+
+def _render(args, cwd=None):
+    # imported here so that only the server (& not its clients) loads the
+    # plotting script, & with it matplotlib
+    from .scripts.plot_pcoa_2d import main
+
+    if cwd is not None:
+        os.chdir(cwd)
+    main(['plot_pcoa_2d.py', *args])
+
+
+class _Job:
+    def __init__(self, conn, args, cwd=None):
+        self.conn = conn
+        self.args = args
+        self.cwd = cwd
+        self.pid = None
+        self.error_fd = None
+        self.deadline = None
+
+
+class RenderServer:
+    """Renders `pcoa_2d` figures for clients of a local Unix socket.
+
+    The server imports the plotting script once & forks a fresh child for
+    each render, so renders start warm but never share matplotlib state,
+    & one that takes longer than `timeout` seconds can be killed. At most
+    `workers` renders run at a time, & at most `max_queue` more wait for
+    one to finish. The socket is only accessible to the server's user, as
+    renders read & write whatever paths they're given.
+    """
+
+    def __init__(self, socket_path, workers=DEFAULT_WORKERS,
+                 max_queue=DEFAULT_MAX_QUEUE, timeout=DEFAULT_TIMEOUT):
+        self.socket_path = socket_path
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self._queue = collections.deque()
+        self._running = {}
+        self._buffers = {}
+        self._selector = selectors.DefaultSelector()
+
+        if os.path.exists(socket_path):
+            if check_health(socket_path) is not None:
+                raise RuntimeError(
+                    f'A render server is already listening on {socket_path}.')
+            # left behind by a server that didn't shut down cleanly
+            os.unlink(socket_path)
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # the socket is created without access for other users, rather than
+        # restricted after binding, when they could already connect to it
+        umask = os.umask(0o077)
+        try:
+            self._socket.bind(socket_path)
+        finally:
+            os.umask(umask)
+        os.chmod(socket_path, 0o600)
+        self._socket.listen()
+        self._socket.setblocking(False)
+        self._selector.register(self._socket, selectors.EVENT_READ)
+
+        # loading everything that renders need before the first one
+        from .scripts import plot_pcoa_2d  # noqa: F401
+
+    def serve_forever(self):
+        try:
+            while True:
+                for key, _ in self._selector.select(POLL_INTERVAL):
+                    if key.fileobj is self._socket:
+                        self._accept()
+                    else:
+                        self._read(key.fileobj)
+
+                self._reap()
+                while self._queue and len(self._running) < self.workers:
+                    self._start(self._queue.popleft())
+        finally:
+            self.close()
+
+    def close(self):
+        # the renders that are cut short are handed back to their clients
+        shut_down = {'ok': False, 'busy': True,
+                     'error': 'The render server shut down.'}
+        for job in list(self._running.values()):
+            self._kill(job, shut_down)
+        while self._queue:
+            _send(self._queue.popleft().conn, shut_down)
+        for conn in list(self._buffers):
+            self._selector.unregister(conn)
+            conn.close()
+        self._buffers.clear()
+
+        if self._socket.fileno() != -1:
+            self._selector.unregister(self._socket)
+            self._socket.close()
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.socket_path)
+            self._selector.close()
+
+    def health(self):
+        return {
+            'ok': True,
+            'version': __version__,
+            'pid': os.getpid(),
+            'workers': self.workers,
+            'running': len(self._running),
+            'queued': len(self._queue),
+            'max_queue': self.max_queue,
+            'timeout': self.timeout
+        }
+
+    def _accept(self):
+        try:
+            conn, _ = self._socket.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        self._buffers[conn] = b''
+        self._selector.register(conn, selectors.EVENT_READ)
+
+    def _read(self, conn):
+        try:
+            data = conn.recv(MAX_REQUEST_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+
+        buffer = self._buffers[conn] + data
+        if data and b'\n' not in buffer and len(buffer) <= MAX_REQUEST_SIZE:
+            self._buffers[conn] = buffer
+            return
+
+        self._selector.unregister(conn)
+        del self._buffers[conn]
+        # responses are sent in full, as they're only a line long
+        conn.settimeout(HEALTH_TIMEOUT)
+
+        if not data:
+            conn.close()
+            return
+        try:
+            request = json.loads(buffer.partition(b'\n')[0])
+        except ValueError:
+            request = None
+        self._handle(conn, request)
+
+    def _handle(self, conn, request):
+        op = request.get('op') if isinstance(request, dict) else None
+        if op == 'health':
+            _send(conn, self.health())
+        elif op == 'render':
+            args = request.get('args')
+            cwd = request.get('cwd')
+            if not isinstance(args, list) \
+                    or not all(isinstance(arg, str) for arg in args):
+                _send(conn, {'ok': False,
+                             'error': '`args` must be a list of strings.'})
+            elif cwd is not None and not isinstance(cwd, str):
+                _send(conn, {'ok': False, 'error': '`cwd` must be a string.'})
+            elif len(self._queue) >= self.max_queue:
+                _send(conn, {'ok': False, 'busy': True,
+                             'error': f'The render queue is full'
+                                      f' ({self.max_queue} jobs).'})
+            else:
+                self._queue.append(_Job(conn, args, cwd))
+        else:
+            _send(conn, {'ok': False,
+                         'error': f'Unrecognized request {request!r}. Must be'
+                                  ' a JSON object with an `op` of either'
+                                  ' "health" or "render".'})
+
+    def _start(self, job):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            status = 0
+            try:
+                _render(job.args, job.cwd)
+            except BaseException:
+                status = 1
+                error = traceback.format_exc().encode(errors='replace')
+                os.write(write_fd, error[-MAX_ERROR_SIZE:])
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+
+        os.close(write_fd)
+        job.pid = pid
+        job.error_fd = read_fd
+        job.deadline = time.monotonic() + self.timeout
+        self._running[pid] = job
+
+    def _reap(self):
+        for pid, job in list(self._running.items()):
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                del self._running[pid]
+                error = os.read(job.error_fd, MAX_ERROR_SIZE).decode(
+                    errors='replace')
+                os.close(job.error_fd)
+
+                code = os.waitstatus_to_exitcode(status)
+                if code == 0:
+                    _send(job.conn, {'ok': True})
+                else:
+                    _send(job.conn, {
+                        'ok': False,
+                        'error': error or f'The render exited with code'
+                                          f' {code}.'})
+            elif time.monotonic() > job.deadline:
+                self._kill(job, {'ok': False,
+                                 'error': f'The render timed out after'
+                                          f' {self.timeout} seconds.'})
+
+    def _kill(self, job, response):
+        os.kill(job.pid, signal.SIGKILL)
+        os.waitpid(job.pid, 0)
+        os.close(job.error_fd)
+        del self._running[job.pid]
+        _send(job.conn, response)
+
+
+def _request(socket_path, request, timeout=None):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        with sock.makefile('rb') as reader:
+            line = reader.readline()
+
+    if not line:
+        raise ConnectionError('The render server closed the connection'
+                              ' without responding.')
+
+    return json.loads(line)
+
+
+def check_health(socket_path, timeout=HEALTH_TIMEOUT):
+    """The status of the render server on `socket_path`, if it's usable.
+
+    Returns None if there's no server answering on the socket, or if it's
+    running another version of this package (whose renders could differ).
+    """
+    try:
+        status = _request(socket_path, {'op': 'health'}, timeout)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(status, dict) or not status.get('ok') \
+            or status.get('version') != __version__:
+        return None
+
+    return status
+
+
+def render_on_server(args, socket_path=None):
+    """Renders a figure from the plotting script's `args` on the server.
+
+    The server is the one on `socket_path`, defaulting to
+    `$GUT_TO_SOIL_FIGURES_RENDER_SOCKET`. Returns whether the figure was
+    rendered, which it isn't when no server is set or healthy, or when its
+    queue is full, in which case it's left to the caller to render. Raises a
+    `RenderError` if the server rendered the figure but failed to.
+    """
+    if socket_path is None:
+        socket_path = os.environ.get(RENDER_SOCKET_ENV)
+    if not socket_path or check_health(socket_path) is None:
+        return False
+
+    try:
+        response = _request(socket_path, {'op': 'render', 'args': args,
+                                          'cwd': os.getcwd()})
+    except (OSError, ValueError):
+        # the server went away before answering
+        return False
+
+    if response.get('ok'):
+        return True
+    if response.get('busy'):
+        return False
+
+    raise RenderError(response.get('error'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serves isolated pcoa_2d renders on a Unix socket.')
+    parser.add_argument('socket',
+                        help='path of the Unix socket to listen on (set'
+                             f' ${RENDER_SOCKET_ENV} to this for pcoa_2d'
+                             ' to use the server)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='number of renders to run at a time')
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE,
+                        help='number of renders that can wait for a worker'
+                             ' before more are turned away')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help='seconds that a render may take before it is'
+                             ' killed')
+    parser.add_argument('--check', action='store_true',
+                        help='print the status of the server on the socket'
+                             ' & exit, with a non-zero status if it is not'
+                             ' healthy')
+    args = parser.parse_args(argv)
+
+    if args.check:
+        status = check_health(args.socket)
+        json.dump(status, sys.stdout, indent=2)
+        print()
+        return 0 if status is not None else 1
+
+    server = RenderServer(args.socket, workers=args.workers,
+                          max_queue=args.max_queue, timeout=args.timeout)
+
+    # shutting down (& removing the socket) on SIGTERM as on Ctrl-C
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
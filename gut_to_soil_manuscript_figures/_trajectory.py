@@ -0,0 +1,145 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import collections
+import os
+
+import numpy as np
+import pandas as pd
+
+from ._selection import SampleSelector
+
+# the sample types that make up the composting time series; HE & bulking
+# material are the week 0 inputs to each bucket
+WEEK0_TYPES = ('Human Excrement', 'Bulking Material')
+COMPOSTED_TYPE = 'Human Excrement Compost'
+
+# the role of each sample in its bucket's time series, in the order that
+# they're stored: the HE & bulking material week 0 inputs, then the
+# composted samples of weeks 1-52
+TRAJECTORY_ROLES = {
+    'HE': 'Human Excrement',
+    'bulking': 'Bulking Material',
+    'HEC': COMPOSTED_TYPE
+}
+
+# the files that `BucketTrajectories` are stored as
+TRAJECTORY_SAMPLES_FN = 'samples.tsv'
+TRAJECTORY_CENTROIDS_FN = 'centroids.tsv'
+
+# every subject bucket's time series (`samples`, indexed by sample ID with
+# `bucket`, `role`, `week`, `PC1` & `PC2` columns) & the `weekly_centroids`
+# (as `SampleType`, `week`, `PC1` & `PC2` columns), precomputed from the
+# metadata & ordination so that figures don't have to select them again
+BucketTrajectories = collections.namedtuple(
+    'BucketTrajectories', ['samples', 'centroids'])
+
+
+def sample_table(selector, ord_2d):
+    """Joins the grouping columns onto the first two ordination axes.
+
+    Returns one row per sample present in both inputs, with the
+    `SampleType`, `Bucket` and `week` columns alongside `PC1` & `PC2`.
+    """
+    coords = ord_2d.to_numpy(dtype=float)[selector.positions]
+
+    return pd.DataFrame({
+        'SampleType': selector.sample_type,
+        'Bucket': selector.bucket,
+        'week': selector.week,
+        'PC1': coords[:, 0],
+        'PC2': coords[:, 1]
+    }, index=pd.Index(selector.ids, name='sample-id'))
+
+
+def weekly_centroids(table):
+    """Mean coordinates per sample type & week, in a single group-by pass.
+
+    Composted (HEC) samples are averaged for each of weeks 1-52, and the HE
+    & bulking material inputs (which have no composting time point) are
+    averaged as week 0. The result is indexed by (`SampleType`, `week`).
+    """
+    week = table['week']
+    composted = \
+        (table['SampleType'] == COMPOSTED_TYPE) & week.between(1, 52)
+    inputs = table['SampleType'].isin(WEEK0_TYPES) & week.isna()
+
+    rows = table[composted | inputs]
+
+    return rows.groupby(
+        [rows['SampleType'], rows['week'].fillna(0.0)]
+    )[['PC1', 'PC2']].mean()
+
+
+def weekly_trajectory(md, ord_2d):
+    """Weekly mean HEC coordinates across all buckets, ordered by week.
+
+    `md` needs the `SampleType`, `Bucket` & `Composting Time Point` columns
+    and `ord_2d` the first two axes of the ordination's sample coordinates.
+    """
+    table = sample_table(SampleSelector(md, ord_2d), ord_2d)
+
+    return weekly_centroids(table).loc[COMPOSTED_TYPE]
+
+
+def bucket_trajectories(selector, ord_2d):
+    """Precomputes the time series of every subject bucket.
+
+    Each bucket's HE & bulking material week 0 inputs are followed by its
+    composted samples in week order, i.e. exactly the samples (& order)
+    that highlighting the bucket draws.
+    """
+    week = pd.Series(selector.week, index=selector.ids)
+    buckets = np.unique(selector.bucket[
+        selector.of_type(*TRAJECTORY_ROLES.values()) & selector.in_bucket()])
+
+    ids = []
+    rows = []
+    for bucket in buckets:
+        for role, sample_type in TRAJECTORY_ROLES.items():
+            if sample_type == COMPOSTED_TYPE:
+                role_ids = selector.bucket_trajectory(bucket)
+            else:
+                role_ids = selector.week0(sample_type, bucket)
+            ids.extend(role_ids)
+            rows.extend((bucket, role) for _ in role_ids)
+
+    samples = pd.DataFrame(rows, columns=['bucket', 'role'],
+                           index=pd.Index(ids, dtype=object,
+                                          name='sample-id'))
+    samples['bucket'] = samples['bucket'].astype(float)
+    samples['week'] = week.loc[ids].to_numpy(dtype=float)
+    coords = ord_2d.loc[ids].to_numpy(dtype=float)
+    samples['PC1'] = coords[:, 0]
+    samples['PC2'] = coords[:, 1]
+
+    centroids = weekly_centroids(sample_table(selector, ord_2d))
+
+    return BucketTrajectories(samples, centroids.reset_index())
+
+
+def write_bucket_trajectories(path, trajectories):
+    trajectories.samples.to_csv(
+        os.path.join(str(path), TRAJECTORY_SAMPLES_FN), sep='\t')
+    trajectories.centroids.to_csv(
+        os.path.join(str(path), TRAJECTORY_CENTROIDS_FN), sep='\t',
+        index=False)
+
+
+def read_bucket_trajectories(path):
+    # coordinates are parsed exactly, so the centroids match ones computed
+    # from the ordination
+    samples = pd.read_csv(
+        os.path.join(str(path), TRAJECTORY_SAMPLES_FN), sep='\t',
+        dtype={'sample-id': str, 'role': str}, float_precision='round_trip'
+    ).set_index('sample-id')
+    centroids = pd.read_csv(
+        os.path.join(str(path), TRAJECTORY_CENTROIDS_FN), sep='\t',
+        dtype={'SampleType': str}, float_precision='round_trip')
+
+    return BucketTrajectories(samples, centroids)
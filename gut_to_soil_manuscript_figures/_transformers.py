@@ -0,0 +1,25 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from .plugin_setup import plugin
+from ._formats import TrajectoryIndexDirectoryFormat
+from ._trajectory import (
+    BucketTrajectories, read_bucket_trajectories, write_bucket_trajectories)
+
+
+@plugin.register_transformer
+def _1(data: BucketTrajectories) -> TrajectoryIndexDirectoryFormat:
+    ff = TrajectoryIndexDirectoryFormat()
+    write_bucket_trajectories(ff.path, data)
+
+    return ff
+
+
+@plugin.register_transformer
+def _2(ff: TrajectoryIndexDirectoryFormat) -> BucketTrajectories:
+    return read_bucket_trajectories(ff.path)
@@ -0,0 +1,13 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from qiime2.plugin import SemanticType
+
+# the precomputed time series of every subject bucket (see
+# `_trajectory.bucket_trajectories`)
+TrajectoryIndex = SemanticType('TrajectoryIndex')
@@ -0,0 +1,556 @@
+// ----------------------------------------------------------------------------
+// Copyright (c) 2024, Liz Gehret.
+//
+// Distributed under the terms of the Modified BSD License.
+//
+// The full license is in the file LICENSE, distributed with this software.
+// ----------------------------------------------------------------------------
+
+// Draws the interactive PCoA plot from the payload written by
+// `_interactive.py` (see there for its layout) into `#pcoa-interactive`.
+// Sample groups & highlighted buckets are toggled entirely client-side.
+
+(function () {
+  'use strict';
+
+  const PAYLOAD = 'pcoa_data.json';
+  const WIDTH = 900;
+  const MAX_HEIGHT = 700;
+  const MARGIN = {left: 60, right: 20, top: 40, bottom: 50};
+  // samples within this many pixels of the cursor are shown on hover
+  const HOVER_RADIUS = 6;
+
+  const TYPED_ARRAYS = {
+    float32: Float32Array,
+    uint8: Uint8Array,
+    int8: Int8Array,
+    int16: Int16Array
+  };
+
+  // matplotlib's viridis, which the static plot colors the highlighted
+  // buckets with, sampled at 9 evenly spaced points
+  const VIRIDIS = ['#440154', '#472d7b', '#3b528b', '#2c728e', '#21918c',
+                   '#28ae80', '#5ec962', '#addc30', '#fde725'];
+
+  function decode(column) {
+    const bytes = Uint8Array.from(atob(column.data), (c) => c.charCodeAt(0));
+    return new TYPED_ARRAYS[column.dtype](bytes.buffer);
+  }
+
+  function hexToRgb(hex) {
+    const value = parseInt(hex.slice(1), 16);
+    return [(value >> 16) & 255, (value >> 8) & 255, value & 255];
+  }
+
+  function viridis(t) {
+    const position = t * (VIRIDIS.length - 1);
+    const i = Math.min(Math.floor(position), VIRIDIS.length - 2);
+    const [a, b] = [hexToRgb(VIRIDIS[i]), hexToRgb(VIRIDIS[i + 1])];
+    const mix = a.map((v, k) => Math.round(v + (b[k] - v) * (position - i)));
+    return `rgb(${mix.join(',')})`;
+  }
+
+  // evenly spaced 'round' tick values covering [low, high]
+  function ticks(low, high, count) {
+    const step = Math.pow(10, Math.floor(Math.log10((high - low) / count)));
+    const multiple = [1, 2, 5, 10].find(
+      (m) => (high - low) / (m * step) <= count);
+    const spacing = multiple * step;
+    const values = [];
+    for (let v = Math.ceil(low / spacing) * spacing; v <= high;
+      v += spacing) {
+      values.push(Math.round(v / spacing) * spacing);
+    }
+    return values;
+  }
+
+  function element(tag, attributes, parent) {
+    const el = document.createElement(tag);
+    Object.assign(el, attributes);
+    if (parent) {
+      parent.appendChild(el);
+    }
+    return el;
+  }
+
+  class PCoAPlot {
+    constructor(container, payload) {
+      this.payload = payload;
+      this.n = payload.n_samples;
+      this.ids = payload.ids;
+      this.x = decode(payload.x);
+      this.y = decode(payload.y);
+      this.group = decode(payload.group);
+      this.bucket = decode(payload.bucket);
+      this.week = decode(payload.week);
+      this.groups = payload.groups;
+      this.code = Object.fromEntries(
+        this.groups.map((group, code) => [group.name, code]));
+
+      this.groupVisible = this.groups.map(() => true);
+      this.highlighted = new Set(payload.highlighted_buckets);
+      this.average = payload.average;
+
+      this.layout();
+      this.buildControls(container);
+      this.buildIndex();
+      this.draw();
+    }
+
+    // SCALES
+    layout() {
+      let [xMin, xMax, yMin, yMax] = [Infinity, -Infinity, Infinity,
+                                      -Infinity];
+      for (let i = 0; i < this.n; i++) {
+        xMin = Math.min(xMin, this.x[i]);
+        xMax = Math.max(xMax, this.x[i]);
+        yMin = Math.min(yMin, this.y[i]);
+        yMax = Math.max(yMax, this.y[i]);
+      }
+      // matching matplotlib's default 5% data margins
+      const [xPad, yPad] = [(xMax - xMin) * 0.05 || 1,
+                            (yMax - yMin) * 0.05 || 1];
+      this.domain = [xMin - xPad, xMax + xPad, yMin - yPad, yMax + yPad];
+
+      // one y unit is `aspect` times as long as one x unit on screen
+      const [dataWidth, dataHeight] = [this.domain[1] - this.domain[0],
+                                       this.domain[3] - this.domain[2]];
+      let scale = (WIDTH - MARGIN.left - MARGIN.right) / dataWidth;
+      const maxPlotHeight = MAX_HEIGHT - MARGIN.top - MARGIN.bottom;
+      if (dataHeight * scale * this.payload.aspect > maxPlotHeight) {
+        scale = maxPlotHeight / (dataHeight * this.payload.aspect);
+      }
+      this.scaleX = scale;
+      this.scaleY = scale * this.payload.aspect;
+      this.plotWidth = dataWidth * this.scaleX;
+      this.plotHeight = dataHeight * this.scaleY;
+    }
+
+    px(x) {
+      return MARGIN.left + (x - this.domain[0]) * this.scaleX;
+    }
+
+    py(y) {
+      return MARGIN.top + (this.domain[3] - y) * this.scaleY;
+    }
+
+    // CONTROLS
+    buildControls(container) {
+      const controls = element('div', {className: 'pcoa-controls'},
+                               container);
+
+      const groupsBox = element('fieldset', {}, controls);
+      element('legend', {textContent: 'Sample groups'}, groupsBox);
+      const present = new Set(this.group);
+      this.groups.forEach((group, code) => {
+        if (!present.has(code)) {
+          return;
+        }
+        const label = element('label', {}, groupsBox);
+        element('input', {
+          type: 'checkbox', checked: true,
+          onchange: (event) => {
+            this.groupVisible[code] = event.target.checked;
+            this.draw();
+          }
+        }, label);
+        element('span', {
+          textContent: '●',
+          style: `color: ${group.color}`
+        }, label);
+        label.append(` ${group.label} `);
+      });
+
+      const bucketsBox = element('fieldset', {}, controls);
+      element('legend', {textContent: 'Highlighted buckets'}, bucketsBox);
+      const buckets = new Set();
+      for (let i = 0; i < this.n; i++) {
+        if (this.group[i] === this.code.composted) {
+          buckets.add(this.bucket[i]);
+        }
+      }
+      [...buckets].sort((a, b) => a - b).forEach((bucket) => {
+        const label = element('label', {}, bucketsBox);
+        element('input', {
+          type: 'checkbox', checked: this.highlighted.has(bucket),
+          onchange: (event) => {
+            if (event.target.checked) {
+              this.highlighted.add(bucket);
+            } else {
+              this.highlighted.delete(bucket);
+            }
+            this.draw();
+          }
+        }, label);
+        label.append(` ${bucket} `);
+      });
+
+      if (this.payload.weekly_means.composted) {
+        const label = element('label', {}, controls);
+        element('input', {
+          type: 'checkbox', checked: this.average,
+          onchange: (event) => {
+            this.average = event.target.checked;
+            this.draw();
+          }
+        }, label);
+        label.append(' Weekly mean (all buckets)');
+      }
+
+      const wrapper = element('div', {style: 'position: relative'},
+                              container);
+      const ratio = window.devicePixelRatio || 1;
+      const [width, height] = [
+        MARGIN.left + this.plotWidth + MARGIN.right,
+        MARGIN.top + this.plotHeight + MARGIN.bottom];
+      this.canvas = element('canvas', {
+        width: Math.round(width * ratio),
+        height: Math.round(height * ratio)
+      }, wrapper);
+      this.canvas.style.width = `${width}px`;
+      this.canvas.style.height = `${height}px`;
+      this.ctx = this.canvas.getContext('2d');
+      this.ctx.scale(ratio, ratio);
+
+      this.tooltip = element('div', {className: 'pcoa-tooltip'}, wrapper);
+      Object.assign(this.tooltip.style, {
+        position: 'absolute', display: 'none', pointerEvents: 'none',
+        background: 'rgba(255, 255, 255, 0.9)', border: '1px solid #999',
+        padding: '2px 6px', font: '12px sans-serif', whiteSpace: 'pre'
+      });
+      this.canvas.addEventListener('mousemove', (event) => this.hover(event));
+      this.canvas.addEventListener('mouseleave', () => {
+        this.tooltip.style.display = 'none';
+      });
+    }
+
+    // SELECTION
+    isHighlighted(i) {
+      const group = this.group[i];
+      return this.highlighted.has(this.bucket[i]) &&
+        (group === this.code.composted || group === this.code.fecal ||
+         group === this.code.bulking);
+    }
+
+    isVisible(i) {
+      return this.groupVisible[this.group[i]] || this.isHighlighted(i);
+    }
+
+    // the composted samples of a bucket in week order, & its week 0 inputs
+    bucketSamples(bucket) {
+      const trajectory = [];
+      const inputs = [];
+      for (let i = 0; i < this.n; i++) {
+        if (this.bucket[i] !== bucket) {
+          continue;
+        }
+        if (this.group[i] === this.code.composted && this.week[i] > 0) {
+          trajectory.push(i);
+        } else if ((this.group[i] === this.code.fecal ||
+                    this.group[i] === this.code.bulking) &&
+                   this.week[i] < 0) {
+          inputs.push(i);
+        }
+      }
+      trajectory.sort((a, b) => this.week[a] - this.week[b]);
+      return {trajectory, inputs};
+    }
+
+    // DRAWING
+    marker(path, x, y, shape, size) {
+      if (shape === 'triangle') {
+        path.moveTo(x, y - size);
+        path.lineTo(x + size, y + size * 0.8);
+        path.lineTo(x - size, y + size * 0.8);
+        path.closePath();
+      } else if (shape === 'star') {
+        for (let k = 0; k < 10; k++) {
+          const radius = k % 2 ? size * 0.4 : size;
+          const angle = Math.PI / 5 * k - Math.PI / 2;
+          const [sx, sy] = [x + radius * Math.cos(angle),
+                            y + radius * Math.sin(angle)];
+          k ? path.lineTo(sx, sy) : path.moveTo(sx, sy);
+        }
+        path.closePath();
+      } else {
+        path.moveTo(x + size, y);
+        path.arc(x, y, size, 0, 2 * Math.PI);
+      }
+    }
+
+    drawMarkers(indices, style) {
+      const path = new Path2D();
+      for (const i of indices) {
+        this.marker(path, this.px(this.x[i]), this.py(this.y[i]),
+                    style.shape, style.size || 3);
+      }
+      this.stroke(path, style);
+    }
+
+    stroke(path, style) {
+      const ctx = this.ctx;
+      if (style.fill) {
+        ctx.fillStyle = style.fill;
+        ctx.fill(path);
+      }
+      if (style.edge) {
+        ctx.strokeStyle = style.edge;
+        ctx.lineWidth = 1;
+        ctx.stroke(path);
+      }
+    }
+
+    polyline(points, color, width, dash) {
+      const ctx = this.ctx;
+      ctx.beginPath();
+      points.forEach(([x, y], k) => {
+        k ? ctx.lineTo(this.px(x), this.py(y)) :
+          ctx.moveTo(this.px(x), this.py(y));
+      });
+      ctx.setLineDash(dash || []);
+      ctx.strokeStyle = color;
+      ctx.lineWidth = width;
+      ctx.stroke();
+      ctx.setLineDash([]);
+    }
+
+    label(text, x, y, color, dx) {
+      this.ctx.fillStyle = color;
+      this.ctx.font = 'bold 12px sans-serif';
+      this.ctx.fillText(text, this.px(x) + dx, this.py(y) - 2);
+    }
+
+    drawAxes() {
+      const ctx = this.ctx;
+      const [xMin, xMax, yMin, yMax] = this.domain;
+      ctx.strokeStyle = '#000';
+      ctx.lineWidth = 1;
+      ctx.strokeRect(MARGIN.left, MARGIN.top, this.plotWidth,
+                     this.plotHeight);
+
+      ctx.fillStyle = '#000';
+      ctx.font = '12px sans-serif';
+      ctx.textAlign = 'center';
+      for (const v of ticks(xMin, xMax, 8)) {
+        ctx.fillText(String(+v.toPrecision(6)), this.px(v),
+                     MARGIN.top + this.plotHeight + 16);
+      }
+      ctx.fillText(this.payload.axis_labels[0],
+                   MARGIN.left + this.plotWidth / 2,
+                   MARGIN.top + this.plotHeight + 36);
+      ctx.textAlign = 'right';
+      for (const v of ticks(yMin, yMax, 6)) {
+        ctx.fillText(String(+v.toPrecision(6)), MARGIN.left - 4,
+                     this.py(v) + 4);
+      }
+      ctx.save();
+      ctx.translate(14, MARGIN.top + this.plotHeight / 2);
+      ctx.rotate(-Math.PI / 2);
+      ctx.textAlign = 'center';
+      ctx.fillText(this.payload.axis_labels[1], 0, 0);
+      ctx.restore();
+
+      const buckets = [...this.highlighted].sort((a, b) => a - b);
+      const measure = this.payload.measure;
+      const title = buckets.length === 0 ? `${measure} (all Buckets)` :
+        buckets.length === 1 ? `${measure} for Bucket [${buckets}]` :
+          `${measure} for Buckets [${buckets.join(', ')}]`;
+      ctx.font = '14px sans-serif';
+      ctx.textAlign = 'center';
+      ctx.fillText(title, MARGIN.left + this.plotWidth / 2, MARGIN.top - 12);
+      ctx.textAlign = 'start';
+    }
+
+    drawBackground() {
+      // open markers for the bucket samples, as in the static plot
+      const styles = {
+        fecal: {shape: 'circle', edge: this.groups[this.code.fecal].color},
+        bulking: {shape: 'circle',
+                  edge: this.groups[this.code.bulking].color},
+        composted: {shape: 'triangle',
+                    edge: this.groups[this.code.composted].color}
+      };
+      const members = this.groups.map(() => []);
+      for (let i = 0; i < this.n; i++) {
+        const group = this.group[i];
+        if (this.groupVisible[group] &&
+            !(group === this.code.composted &&
+              this.highlighted.has(this.bucket[i]))) {
+          members[group].push(i);
+        }
+      }
+      this.groups.forEach((group, code) => {
+        this.drawMarkers(members[code],
+                         styles[group.name] ||
+                         {shape: 'circle', fill: group.color});
+      });
+    }
+
+    drawAverage() {
+      const means = this.payload.weekly_means;
+      const weekly = means.composted;
+      const points = [];
+      weekly.week.forEach((week, k) => {
+        if (week > 0) {
+          points.push([weekly.x[k], weekly.y[k]]);
+        }
+      });
+      if (!points.length) {
+        return;
+      }
+
+      // week 0 means are only shown w/o any highlighted bucket(s)
+      if (!this.highlighted.size) {
+        for (const [name, color] of [['fecal', '#8c564b'],
+                                     ['bulking', '#008000']]) {
+          if (!means[name]) {
+            continue;
+          }
+          const start = [means[name].x[0], means[name].y[0]];
+          this.polyline([start, points[0]], '#C5C9C7', 0.75, [4, 3]);
+          const path = new Path2D();
+          this.marker(path, this.px(start[0]), this.py(start[1]), 'star', 8);
+          this.stroke(path, {fill: color, edge: '#000'});
+        }
+      }
+
+      this.polyline(points, '#1f77b4', 1.5);
+      const path = new Path2D();
+      for (const [x, y] of points) {
+        this.marker(path, this.px(x), this.py(y), 'star', 6);
+      }
+      this.stroke(path, {fill: '#1f77b4'});
+      this.label('Start', ...points[0], '#000', 2);
+      this.label('End', ...points[points.length - 1], '#000', 4);
+    }
+
+    drawHighlights() {
+      const buckets = [...this.highlighted].sort((a, b) => a - b);
+      buckets.forEach((bucket, k) => {
+        const {trajectory, inputs} = this.bucketSamples(bucket);
+        const color = viridis(buckets.length > 1 ?
+          k / (buckets.length - 1) : 0);
+        const xy = (i) => [this.x[i], this.y[i]];
+
+        if (trajectory.length) {
+          for (const i of inputs) {
+            this.polyline([xy(i), xy(trajectory[0])], '#C5C9C7', 0.75,
+                          [4, 3]);
+          }
+          this.polyline(trajectory.map(xy), '#000', 1.5);
+        }
+        for (const name of ['fecal', 'bulking']) {
+          this.drawMarkers(
+            inputs.filter((i) => this.group[i] === this.code[name]),
+            {shape: 'circle', fill: this.groups[this.code[name]].color});
+        }
+        this.drawMarkers(trajectory, {shape: 'triangle', size: 4,
+                                      fill: color, edge: '#000'});
+        if (trajectory.length) {
+          this.label('Start', ...xy(trajectory[0]), 'purple', 2);
+          this.label('End', ...xy(trajectory[trajectory.length - 1]),
+                     'purple', 4);
+        }
+      });
+    }
+
+    draw() {
+      const ctx = this.ctx;
+      ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
+      ctx.save();
+      ctx.beginPath();
+      ctx.rect(MARGIN.left, MARGIN.top, this.plotWidth, this.plotHeight);
+      ctx.clip();
+      this.drawBackground();
+      if (this.average) {
+        this.drawAverage();
+      }
+      this.drawHighlights();
+      ctx.restore();
+      this.drawAxes();
+    }
+
+    // HOVER
+    // buckets every sample into a grid of HOVER_RADIUS sized cells (as
+    // offsets into one array, sorted by cell) so that hovering only checks
+    // the samples in the cells around the cursor
+    buildIndex() {
+      this.columns = Math.ceil(this.plotWidth / HOVER_RADIUS) + 1;
+      const rows = Math.ceil(this.plotHeight / HOVER_RADIUS) + 1;
+      const cells = new Int32Array(this.n);
+      const counts = new Int32Array(this.columns * rows + 1);
+      for (let i = 0; i < this.n; i++) {
+        cells[i] = this.cell(this.px(this.x[i]), this.py(this.y[i]));
+        counts[cells[i] + 1]++;
+      }
+      for (let c = 1; c < counts.length; c++) {
+        counts[c] += counts[c - 1];
+      }
+      this.cellStarts = counts.slice();
+      this.cellSamples = new Int32Array(this.n);
+      for (let i = 0; i < this.n; i++) {
+        this.cellSamples[counts[cells[i]]++] = i;
+      }
+    }
+
+    cell(px, py) {
+      const column = Math.floor((px - MARGIN.left) / HOVER_RADIUS);
+      const row = Math.floor((py - MARGIN.top) / HOVER_RADIUS);
+      return row * this.columns + column;
+    }
+
+    nearest(px, py) {
+      let [best, bestDistance] = [-1, HOVER_RADIUS * HOVER_RADIUS];
+      const column = Math.floor((px - MARGIN.left) / HOVER_RADIUS);
+      const row = Math.floor((py - MARGIN.top) / HOVER_RADIUS);
+      const rows = (this.cellStarts.length - 1) / this.columns;
+      for (let r = Math.max(row - 1, 0); r <= Math.min(row + 1, rows - 1);
+        r++) {
+        for (let c = Math.max(column - 1, 0);
+          c <= Math.min(column + 1, this.columns - 1); c++) {
+          const cell = r * this.columns + c;
+          for (let k = this.cellStarts[cell]; k < this.cellStarts[cell + 1];
+            k++) {
+            const i = this.cellSamples[k];
+            const distance = (this.px(this.x[i]) - px) ** 2 +
+              (this.py(this.y[i]) - py) ** 2;
+            if (distance <= bestDistance && this.isVisible(i)) {
+              [best, bestDistance] = [i, distance];
+            }
+          }
+        }
+      }
+      return best;
+    }
+
+    hover(event) {
+      const bounds = this.canvas.getBoundingClientRect();
+      const [px, py] = [event.clientX - bounds.left,
+                        event.clientY - bounds.top];
+      const i = this.nearest(px, py);
+      if (i < 0) {
+        this.tooltip.style.display = 'none';
+        return;
+      }
+      const lines = [this.ids[i], this.groups[this.group[i]].label];
+      if (this.bucket[i] > 0) {
+        lines.push(`Bucket ${this.bucket[i]}`);
+      }
+      if (this.week[i] >= 0) {
+        lines.push(`Week ${this.week[i]}`);
+      }
+      this.tooltip.textContent = lines.join('\n');
+      Object.assign(this.tooltip.style, {
+        display: 'block', left: `${px + 12}px`, top: `${py + 12}px`
+      });
+    }
+  }
+
+  const container = document.getElementById('pcoa-interactive');
+  fetch(PAYLOAD)
+    .then((response) => response.json())
+    .then((payload) => new PCoAPlot(container, payload))
+    .catch((error) => {
+      container.textContent = `Unable to load ${PAYLOAD}: ${error}`;
+    });
+}());
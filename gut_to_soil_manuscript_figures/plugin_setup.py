@@ -6,12 +6,20 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
-from qiime2.plugin import Plugin, Metadata, Bool, Str
+import importlib
+
+from qiime2.plugin import (
+    Plugin, Metadata, Bool, Choices, Collection, Str, List, Int, Range)
 
 from q2_types.ordination import PCoAResults
 
 from gut_to_soil_manuscript_figures import __version__
-from gut_to_soil_manuscript_figures._methods import pcoa_2d
+from gut_to_soil_manuscript_figures._formats import (
+    TrajectoryCentroidsFormat, TrajectoryIndexDirectoryFormat,
+    TrajectorySamplesFormat)
+from gut_to_soil_manuscript_figures._methods import (
+    pcoa_2d, pcoa_2d_batch, pcoa_2d_grid, trajectory_index)
+from gut_to_soil_manuscript_figures._types import TrajectoryIndex
 
 plugin = Plugin(
     name='gut-to-soil-manuscript-figures',
@@ -23,9 +31,58 @@ plugin = Plugin(
     short_description=''
 )
 
+plugin.register_formats(TrajectorySamplesFormat, TrajectoryCentroidsFormat,
+                        TrajectoryIndexDirectoryFormat)
+plugin.register_semantic_types(TrajectoryIndex)
+plugin.register_semantic_type_to_format(
+    TrajectoryIndex, artifact_format=TrajectoryIndexDirectoryFormat)
+
+_DENSITY_THRESHOLD_DESCRIPTION = (
+    'The number of samples above which a background sample group (i.e. the'
+    ' HE, bulking material & HEC samples of the non-highlighted buckets,'
+    ' soil, compost, himalaya & pit toilet samples) is drawn as a density'
+    ' image of the number of samples in each region of the plot, rather'
+    ' than as one marker per sample. The HEC samples of all buckets are'
+    ' counted together as a single group. Highlighted buckets & weekly'
+    ' means are always drawn as markers.')
+
+_TRAJECTORY_INDEX_DESCRIPTION = (
+    'The time series of each bucket, precomputed by `trajectory-index` from'
+    ' the same metadata and ordination. When provided, the highlighted'
+    ' buckets and weekly means are drawn from it instead of being selected'
+    ' from the metadata again.')
+
+plugin.methods.register_function(
+    function=trajectory_index,
+    inputs={'ordination': PCoAResults},
+    parameters={'metadata': Metadata},
+    outputs=[('trajectory_index', TrajectoryIndex)],
+    input_descriptions={
+        'ordination': 'The `PCoAResults` that the time series coordinates'
+                      ' are taken from.'
+    },
+    parameter_descriptions={
+        'metadata': 'The Metadata associated with the `PCoAResults` input.'
+    },
+    output_descriptions={
+        'trajectory_index': 'The HE and bulking material week 0 inputs and'
+                            ' the week-ordered composted samples of every'
+                            ' bucket (with their coordinates on the first'
+                            ' two axes), and the weekly mean coordinates'
+                            ' across all buckets.'
+    },
+    name='Bucket trajectory index',
+    description=('Precomputes the time series of every bucket so that'
+                 ' figures can be generated repeatedly without selecting'
+                 ' and sorting the samples of each bucket from the'
+                 ' metadata every time.')
+)
+
 plugin.visualizers.register_function(
     function=pcoa_2d,
-    inputs={'ordination': PCoAResults},
+    inputs={'ordination': PCoAResults,
+            'trajectory_index': TrajectoryIndex,
+            'reference': PCoAResults},
     parameters={
         'metadata': Metadata,
         'measure': Str,
@@ -37,11 +94,23 @@ plugin.visualizers.register_function(
         'himalaya': Bool,
         'pit_toilet': Bool,
         'export_legend': Bool,
-        'highlighted_buckets': Str
+        'highlighted_buckets': Str,
+        'isolate': Bool,
+        'use_cache': Bool,
+        'profile': Bool,
+        'density_threshold': Int % Range(1, None),
+        'interactive': Bool,
+        'orientation': Str % Choices('manual', 'canonical', 'reference'),
+        'vector_formats': List[Str % Choices('svg', 'pdf')],
+        'dpi': Int % Range(1, None),
+        'max_pixels': Int % Range(10_000, None)
     },
     input_descriptions={
         'ordination': 'The two-dimensional `PCoAResults` object that should be'
-                      ' used to generate the plot.'
+                      ' used to generate the plot.',
+        'trajectory_index': _TRAJECTORY_INDEX_DESCRIPTION,
+        'reference': 'An ordination of (some of) the same samples to orient'
+                     ' the plot like, when `orientation` is "reference".'
     },
     parameter_descriptions={
         'metadata': 'The Metadata associated with the `PCoAResults` input.',
@@ -54,15 +123,20 @@ plugin.visualizers.register_function(
         'invert_x': 'Whether to invert the x-axis (based on PCoA axis 1'
                     ' values). It is recommended to generate the plot once'
                     ' with both axis inversions disabled to examine the'
-                    ' default orientation (to determine if this is needed).',
+                    ' default orientation (to determine if this is needed),'
+                    ' or to use an automatic `orientation` instead. Only'
+                    ' used when `orientation` is "manual".',
         'invert_y': 'Whether to invert the y-axis (based on PCoA axis 2'
                     ' values). It is recommended to generate the plot once'
                     ' with both axis inversions disabled to examine the'
-                    ' default orientation (to determine if this is needed).',
+                    ' default orientation (to determine if this is needed),'
+                    ' or to use an automatic `orientation` instead. Only'
+                    ' used when `orientation` is "manual".',
         'swap_axes': 'Whether to swap the x&y axes.'
                     ' It is recommended to generate the plot once'
                     ' with this parameter disabled to examine the'
-                    ' default orientation (to determine if this is needed).',
+                    ' default orientation (to determine if this is needed).'
+                    ' Ignored when `orientation` is "reference".',
         'himalaya': 'Whether to include data from'
                     ' the external himalaya study.',
         'pit_toilet': 'Whether to include data from'
@@ -73,8 +147,181 @@ plugin.visualizers.register_function(
                          ' present in the plot.',
         'highlighted_buckets': 'The bucket(s) that should be highlighted in'
                                ' the plot. If including multiple buckets,'
-                               ' please use the following format: "2, 3, 4".'
+                               ' please use the following format: "2, 3, 4".',
+        'isolate': 'Whether to render the plot in a separate Python process'
+                   ' (reading the inputs back from disk) instead of within'
+                   ' the current process. This is slower, but keeps'
+                   ' Matplotlib state fully isolated from the caller. If a'
+                   ' render server (`python -m'
+                   ' gut_to_soil_manuscript_figures._server SOCKET`) is'
+                   ' listening on `$GUT_TO_SOIL_FIGURES_RENDER_SOCKET`, the'
+                   ' plot is rendered by it instead, which skips starting'
+                   ' a new interpreter.',
+        'use_cache': 'Whether to reuse previously rendered images from the'
+                     ' on-disk render cache when the ordination, the'
+                     ' plotted metadata columns and all other parameters'
+                     ' are unchanged (and to store newly rendered ones).'
+                     ' When only the measure, week annotations, legend'
+                     ' export or density threshold change, the plot is'
+                     ' redrawn from the cached plot-ready layer data'
+                     ' instead of the metadata and ordination.'
+                     ' The cache is located at'
+                     ' `$GUT_TO_SOIL_FIGURES_CACHE_DIR` (defaulting to'
+                     ' `~/.cache/gut-to-soil-manuscript-figures`) and'
+                     ' limited to `$GUT_TO_SOIL_FIGURES_CACHE_MAX_SIZE`'
+                     ' bytes (defaulting to 512 MiB).',
+        'profile': 'Whether to time each stage of generating the plot (and'
+                   ' record the peak memory use by the end of each stage).'
+                   ' The report is included in the visualization, and saved'
+                   ' alongside it as `profile.json`.',
+        'density_threshold': _DENSITY_THRESHOLD_DESCRIPTION,
+        'interactive': 'Whether to also include an interactive version of the'
+                       ' plot in the visualization, which is drawn by the'
+                       ' browser from the (compactly encoded) sample'
+                       ' coordinates, groups and weekly means. Sample groups'
+                       ' can be hidden, buckets highlighted and samples'
+                       ' identified by hovering over them, all without'
+                       ' re-running the visualizer. The data is saved'
+                       ' alongside it as `pcoa_data.json`.',
+        'orientation': 'How the axes are oriented. "manual" uses `invert_x`,'
+                       ' `invert_y` and `swap_axes` as given. "canonical"'
+                       ' inverts the axes so that soil samples are on the'
+                       ' left and week 1 HEC samples are at the top (keeping'
+                       ' `swap_axes` as given). "reference" inverts and/or'
+                       ' swaps the axes to best superimpose the shared'
+                       ' samples onto the `reference` ordination. The'
+                       ' resolved flags are shown in the visualization.',
+        'vector_formats': 'Vector formats to also save the plot in, as'
+                          ' `pcoa_plot.svg` and/or `pcoa_plot.pdf`, for'
+                          ' publication. Marker groups of more than 1,000'
+                          ' samples are embedded as a single image (at the'
+                          ' PNG\'s DPI) rather than as one element per'
+                          ' marker. The files are linked from the'
+                          ' visualization.',
+        'dpi': 'The resolution of the PNG plot (and of any images embedded in'
+               ' the vector formats). Defaults to Matplotlib\'s figure DPI'
+               ' (100, unless configured otherwise).',
+        'max_pixels': 'The maximum number of pixels of the PNG plot. The DPI'
+                      ' is lowered as needed to fit, so that high-DPI'
+                      ' renders stay within a size budget. The resulting'
+                      ' size is shown in the visualization. Must be at least'
+                      ' 10,000 (e.g. 100 x 100 pixels).'
     },
     name='',
-    description=('')
+    description=('Generates a 2D PCoA plot of the compost buckets, optionally'
+                 ' highlighting the time series of some of them. The'
+                 ' visualization contains the rendered plot (and legend,'
+                 ' vector formats, interactive plot and stage timings, when'
+                 ' requested). The input metadata and ordination are not'
+                 ' copied into it, as they are recorded in its provenance.')
+)
+
+
+plugin.visualizers.register_function(
+    function=pcoa_2d_batch,
+    inputs={'ordination': PCoAResults,
+            'trajectory_index': TrajectoryIndex},
+    parameters={
+        'metadata': Metadata,
+        'specs': List[Str],
+        'measure': Str,
+        'week_annotations': Bool,
+        'export_legend': Bool,
+        'n_jobs': Int % Range(1, None),
+        'density_threshold': Int % Range(1, None),
+        'blit': Bool
+    },
+    input_descriptions={
+        'ordination': 'The two-dimensional `PCoAResults` object that should be'
+                      ' used to generate the plots.',
+        'trajectory_index': _TRAJECTORY_INDEX_DESCRIPTION
+    },
+    parameter_descriptions={
+        'metadata': 'The Metadata associated with the `PCoAResults` input.',
+        'specs': 'One entry per plot to generate. Each entry is a list of'
+                 ' semicolon-separated `parameter=value` pairs using the'
+                 ' `pcoa-2d` parameters `highlighted_buckets`, `average`,'
+                 ' `swap_axes`, `invert_x`, `invert_y`, `himalaya` and'
+                 ' `pit_toilet`. Boolean parameters can be given on their'
+                 ' own to enable them, e.g.'
+                 ' "highlighted_buckets=2, 3; average; swap_axes". Any'
+                 ' parameter that is left out uses its `pcoa-2d` default.',
+        'measure': 'The measure that the `PCoAResults` input was generated'
+                   ' from. Used for plot titles and labeling.',
+        'week_annotations': 'Whether to include numeric labels for each'
+                            ' week timepoint for any highlighted bucket(s).',
+        'export_legend': 'Whether to hide the legend in each plot and'
+                         ' export it as a separate `.png` file. If disabled,'
+                         ' the legend will be present in each plot.',
+        'n_jobs': 'The number of worker processes to render the plots with.'
+                  ' Plots are identical regardless of the number of workers.',
+        'density_threshold': _DENSITY_THRESHOLD_DESCRIPTION,
+        'blit': 'Whether to draw the layers shared by plots with the same'
+                ' orientation and sample types once, as an image that only'
+                ' the highlighted bucket(s), title and legend of each plot'
+                ' are drawn on top of. This is much faster for many plots,'
+                ' but every plot uses the layout of the first one, the'
+                ' highlighted bucket(s) are drawn over (rather than removed'
+                ' from) the other buckets, and the image can be shifted by'
+                ' up to a pixel relative to a full render.'
+    },
+    name='Batch of 2D PCoA plots',
+    description=('Generates many 2D PCoA plots from a single ordination,'
+                 ' loading the inputs and drawing the layers that are'
+                 ' shared between plots only once.')
+)
+
+plugin.visualizers.register_function(
+    function=pcoa_2d_grid,
+    inputs={'ordinations': Collection[PCoAResults]},
+    parameters={
+        'metadata': Metadata,
+        'average': Bool,
+        'week_annotations': Bool,
+        'invert_x': Bool,
+        'invert_y': Bool,
+        'swap_axes': Bool,
+        'himalaya': Bool,
+        'pit_toilet': Bool,
+        'export_legend': Bool,
+        'highlighted_buckets': Str,
+        'n_columns': Int % Range(1, None),
+        'density_threshold': Int % Range(1, None)
+    },
+    input_descriptions={
+        'ordinations': 'The `PCoAResults` to plot, keyed by the measure that'
+                       ' each was generated from (e.g. "Unweighted'
+                       ' Unifrac"). Each is plotted as a subplot titled'
+                       ' with its key, in the order of the collection.'
+    },
+    parameter_descriptions={
+        'metadata': 'The Metadata associated with the `PCoAResults` inputs.',
+        'average': 'Whether to plot the weekly average for all buckets at each'
+                   ' timepoint.',
+        'week_annotations': 'Whether to include numeric labels for each'
+                            ' week timepoint for any highlighted bucket(s).',
+        'invert_x': 'Whether to invert the x-axis of every subplot.',
+        'invert_y': 'Whether to invert the y-axis of every subplot.',
+        'swap_axes': 'Whether to swap the x&y axes of every subplot.',
+        'himalaya': 'Whether to include data from'
+                    ' the external himalaya study.',
+        'pit_toilet': 'Whether to include data from'
+                      ' the external pit toilet study.',
+        'export_legend': 'Whether to export the legend (which is shared by'
+                         ' all subplots) as a separate `.png` file instead'
+                         ' of drawing it next to the subplots.',
+        'highlighted_buckets': 'The bucket(s) that should be highlighted in'
+                               ' every subplot. If including multiple'
+                               ' buckets, please use the following format:'
+                               ' "2, 3, 4".',
+        'n_columns': 'The number of subplots in each row of the figure.',
+        'density_threshold': _DENSITY_THRESHOLD_DESCRIPTION
+    },
+    name='Grid of 2D PCoA plots',
+    description=('Plots the same buckets for several ordinations (e.g. one'
+                 ' per distance measure) as subplots of a single figure,'
+                 ' with a shared legend. The metadata is only parsed,'
+                 ' filtered and sorted once for all of the ordinations.')
 )
+
+importlib.import_module('gut_to_soil_manuscript_figures._transformers')
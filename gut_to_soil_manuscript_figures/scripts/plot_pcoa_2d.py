@@ -1,31 +1,95 @@
 #!/usr/bin/python3
 
+import math
+import os
 import sys
-import skbio
 import numpy as np
 import pandas as pd
 import matplotlib as mpl
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+
+from gut_to_soil_manuscript_figures._drawing import (
+    BackgroundBuffer, DensityGrid, Labels, add_lines, anchored_loc,
+    budget_dpi, rasterized_collections)
+from gut_to_soil_manuscript_figures._handoff import (
+    is_handoff, read_metadata, read_ordination, read_trajectories)
+from gut_to_soil_manuscript_figures._layers import (
+    is_layers, read_layers, write_layers)
+from gut_to_soil_manuscript_figures._metadata import (
+    check_metadata_ids, read_plot_metadata)
+from gut_to_soil_manuscript_figures._ordination import read_ordination_axes
+from gut_to_soil_manuscript_figures._profile import (
+    Profiler, activate, stage)
+from gut_to_soil_manuscript_figures._selection import (
+    DENSITY_THRESHOLD, CoordinateView, SampleSelector, filter_plot_metadata,
+    sort_plot_metadata)
+from gut_to_soil_manuscript_figures._trajectory import (
+    sample_table, weekly_centroids)
 
 
 # HELPER METHODS
-# util for converting sample IDs to ordination XY coords & swapping axes
-def _swap_axis(df, sample_type, swap):
-    if swap == 'False':
-        x = df.loc[sample_type][0]
-        y = df.loc[sample_type][1]
-    elif swap == 'True':
-        x = df.loc[sample_type][1]
-        y = df.loc[sample_type][0]
-    else:
-        raise ValueError('Invalid selection for `swap_axes` parameter.'
-                         ' Must either be `True` or `False`.')
-
-    return x, y
+# utils for loading the inputs, which are either file paths (when run as a
+# script), a binary hand-off directory (when run in a separate process by
+# `pcoa_2d`) or already-loaded objects (when called in-process)
+def _load_ordination(ordination):
+    # only the first two axes & their proportion explained are used (or read,
+    # when given a path), from either an `skbio.OrdinationResults` or the
+    # `OrdinationAxes` that `read_ordination_axes` returns
+    if not hasattr(ordination, 'samples'):
+        if is_handoff(ordination):
+            return read_ordination(ordination)
+
+        ordination = read_ordination_axes(ordination)
+
+    return (ordination.samples.iloc[:, 0:2],
+            ordination.proportion_explained.iloc[0:2].to_numpy())
+
+
+def _load_metadata(metadata, ids=None):
+    if isinstance(metadata, pd.DataFrame):
+        return metadata
+
+    if is_handoff(metadata):
+        return read_metadata(metadata)
+
+    # only the columns used by the plot are parsed, & only the rows of the
+    # ordination samples (`ids`) are kept as the file is read
+    return read_plot_metadata(metadata, ids)
+
+
+def _load_trajectories(trajectories, metadata, ord_2d):
+    # a hand-off directory includes the trajectory index, if there is one
+    if trajectories is None and not isinstance(metadata, pd.DataFrame) \
+            and is_handoff(metadata):
+        trajectories = read_trajectories(metadata)
+    if trajectories is None:
+        return None
+
+    missing = trajectories.samples.index[
+        ~trajectories.samples.index.isin(ord_2d.index)]
+    if len(missing):
+        raise ValueError(
+            f'The trajectory index includes {len(missing)} sample(s) that'
+            f' are not in the ordination (e.g. {missing[0]!r}). It must be'
+            ' computed from the same ordination as the plot.')
+
+    # an index of another ordination of the same samples has the same IDs,
+    # so its coordinates (from which its centroids were computed) are
+    # checked as well
+    samples = trajectories.samples
+    if not np.allclose(samples[['PC1', 'PC2']].to_numpy(dtype=float),
+                       ord_2d.loc[samples.index].to_numpy(dtype=float)):
+        raise ValueError(
+            'The coordinates in the trajectory index do not match those of'
+            ' the ordination. It must be computed from the same ordination'
+            ' as the plot.')
+
+    return trajectories
 
 
 # util for highlighted bucket handling
-def _bucket_util(highlighted_buckets, md, ord_2d):
+def _bucket_util(highlighted_buckets, selector, trajectories=None):
     # handles multiple buckets being entered via command line/jupyter notebook
     # entire input for this command is a string, split on commas
     if ',' in highlighted_buckets:
@@ -39,63 +103,31 @@ def _bucket_util(highlighted_buckets, md, ord_2d):
     bucket_starts_dict = {}
 
     for bucket in bucket_list:
-        # sorting the MD by week for line plot
+        # a precomputed trajectory index already has each bucket's samples
+        # in time series order
+        if trajectories is not None:
+            rows = trajectories.samples[
+                trajectories.samples['bucket'] == float(bucket)]
+            role = rows['role']
+            buckets_dict[bucket] = list(rows.index[role == 'HEC'])
+            bucket_starts_dict[bucket] = {
+                'HE_week0': list(rows.index[role == 'HE']),
+                'bulk_week0': list(rows.index[role == 'bulking']),
+                'HEC_week1': list(rows.index[(role == 'HEC') &
+                                             (rows['week'] == 1.0)])
+            }
+            continue
+
+        # week 1-52 IDs for selected bucket, sorted by week for line plot
         # connecting time series data in order
-        md_bucket_sorted = \
-            md[(md['Bucket'] == bucket) &
-               (md['SampleType'] == 'Human Excrement Compost')].\
-            sort_values('Composting Time Point')
-
-        # week 1-52 IDs for selected bucket
-        bucket_ids_sorted = md_bucket_sorted[
-            md_bucket_sorted['Composting Time Point'] > 0.0].index.values
-
-        # making sure bucket IDs used are only ones that are present in both
-        # the md and ordination results
-        bucket_ids = []
-        for i in bucket_ids_sorted:
-            if i in ord_2d.index.values:
-                bucket_ids.append(i)
-
-        buckets_dict[bucket] = bucket_ids
-
-        # week 0 i.e. inputs for dotted line connecting HE & bulking -> HEC
-        # HE
-        bucket_ids_HE_week0 = \
-            md[(md['Bucket'] == bucket) &
-               (md['SampleType'] == 'Human Excrement') &
-               (md['Composting Time Point']).isna()].index.values
-
-        ids_HE_week0 = []
-        for i in bucket_ids_HE_week0:
-            if i in ord_2d.index.values:
-                ids_HE_week0.append(i)
-
-        # bulking
-        bucket_ids_bulk_week0 = \
-            md[(md['Bucket'] == bucket) &
-               (md['SampleType'] == 'Bulking Material') &
-               (md['Composting Time Point']).isna()].index.values
-
-        ids_bulk_week0 = []
-        for i in bucket_ids_bulk_week0:
-            if i in ord_2d.index.values:
-                ids_bulk_week0.append(i)
-
-        # week 1 i.e. end points for dotted line connecting HE & BM -> HEC
-        bucket_ids_HEC_week1 = md_bucket_sorted[
-            md_bucket_sorted['Composting Time Point'] == 1.0].index.values
-
-        ids_HEC_week1 = []
-        for i in bucket_ids_HEC_week1:
-            if i in ord_2d.index.values:
-                ids_HEC_week1.append(i)
+        buckets_dict[bucket] = list(selector.bucket_trajectory(bucket))
 
         # nested dict for each bucket start info: HE week0, bulking, HEC week1
+        # i.e. inputs & end points for dotted line connecting HE & BM -> HEC
         bucket_starts_dict[bucket] = {
-            'HE_week0': [i for i in ids_HE_week0],
-            'bulk_week0': [i for i in ids_bulk_week0],
-            'HEC_week1': [i for i in ids_HEC_week1]
+            'HE_week0': list(selector.week0('Human Excrement', bucket)),
+            'bulk_week0': list(selector.week0('Bulking Material', bucket)),
+            'HEC_week1': list(selector.composted_week(1.0, bucket))
         }
 
     selected_buckets_ids = [i for i in buckets_dict.values()]
@@ -104,385 +136,481 @@ def _bucket_util(highlighted_buckets, md, ord_2d):
     return buckets_dict, selected_buckets_ids, bucket_set, bucket_starts_dict
 
 
-# MAIN METHOD #
-def plot_pcoa_2d(metadata_fp, ordination_fp, measure,
-                 average, week_annotations, plot_fp,
-                 invert_x, invert_y, swap_axes,
-                 himalaya, pit_toilet, export_legend,
-                 highlighted_buckets=None, legend_fp=None):
+# util for loading & indexing the inputs; done once per set of figures
+def _prepare(metadata, ordination, trajectories=None):
+    with stage('load_ordination'):
+        ord_2d, prop_explained = _load_ordination(ordination)
+    # relabeling (a shallow copy of) the first two axes, so that an
+    # ordination that was handed to us in-process is never modified; the
+    # axes are only oriented by the `CoordinateView`, which doesn't modify
+    # them either
+    ord_2d = ord_2d.copy(deep=False)
+    ord_2d.columns = [0, 1]
+
+    with stage('load_metadata'):
+        metadata_in = _load_metadata(metadata, ord_2d.index)
+
+    with stage('filter_ids'):
+        md, selector = filter_plot_metadata(metadata_in, ord_2d)
+
+    with stage('load_trajectories'):
+        trajectories = _load_trajectories(trajectories, metadata, ord_2d)
+
+    return prop_explained, ord_2d, md, selector, trajectories
+
+
+# util for joining metadata that's already been filtered & sorted (once, by
+# `sort_plot_metadata`) against one of several ordinations
+def _join(metadata_in, sorted_md, ord_2d):
+    # ordination samples missing from the metadata are an error, just like
+    # when filtering the metadata for a single ordination
+    check_metadata_ids(metadata_in.index, ord_2d.index)
 
-    ord_rslts = skbio.OrdinationResults.read(str(ordination_fp))
-    ord_2d = ord_rslts.samples.iloc[:, 0:2]
+    md = sorted_md[sorted_md.index.isin(ord_2d.index)]
 
-    metadata_in = pd.read_csv(str(metadata_fp),
-                              sep='\t').set_index('sample-id')
-    # filtering metadata to only include samples w/IDs present in ordination
-    metadata = metadata_in.loc[ord_2d.index.values]
+    return md, SampleSelector(md, ord_2d)
 
+
+# util for the axis orientation shared by every figure in a background group;
+# the selector's samples are served as plot coordinates by the returned view
+def _orient(prop_explained, selector, ord_2d, swap_axes, invert_x, invert_y):
     # setting XY labels based on swap axis &
     # figure aspect based on proportion explained
     if swap_axes == 'True':
-        fig_aspect = \
-            ord_rslts.proportion_explained[0]/ord_rslts.proportion_explained[1]
+        fig_aspect = prop_explained[0]/prop_explained[1]
         x_label = 2
         y_label = 1
     elif swap_axes == 'False':
-        fig_aspect = \
-            ord_rslts.proportion_explained[1]/ord_rslts.proportion_explained[0]
+        fig_aspect = prop_explained[1]/prop_explained[0]
         x_label = 1
         y_label = 2
     else:
         raise ValueError('Invalid value for `swap_axes` parameter.'
                          ' Must be either `True` or `False`.')
 
-    # invering XY axis based on x and/or y invert
-    if invert_x == 'True':
-        ord_2d[0] = ord_2d[0].multiply(-1)
-    if invert_y == 'True':
-        ord_2d[1] = ord_2d[1].multiply(-1)
+    # invering & swapping the XY axes in a single pass over the coordinates
+    with stage('orient_coordinates'):
+        view = CoordinateView(selector, ord_2d, swap_axes == 'True',
+                              invert_x == 'True', invert_y == 'True')
+
+    return view, fig_aspect, x_label, y_label
+
+
+# util for the (unoriented) weekly centroids, when plotting the weekly mean;
+# these are precomputed in a trajectory index, if there is one
+def _centroids(selector, ord_2d, average, trajectories=None):
+    if average != 'True':
+        return None
+
+    if trajectories is not None:
+        return trajectories.centroids.set_index(
+            ['SampleType', 'week'])[['PC1', 'PC2']]
+
+    # every weekly mean (plus the HE & bulking week 0 means) is computed in a
+    # single group-by over the joined sample x coordinate table
+    with stage('weekly_average'):
+        return weekly_centroids(sample_table(selector, ord_2d))
+
+
+# util for drawing a background sample group, either as a scatter or (once
+# the group has more samples than the density threshold) as a density image
+def _draw_group(ax, x, y, density, group_size=None, **kwargs):
+    # `group_size` is the number of samples in the whole group that this is
+    # part of, when it's drawn in parts
+    if group_size is None:
+        group_size = len(x)
+    if density is None or group_size <= density.threshold:
+        return ax.scatter(x=x, y=y, **kwargs)
+
+    # an empty scatter stands in for the image in the legend, & hiding it
+    # also hides the image
+    handle = ax.scatter(x=[], y=[], **kwargs)
+    color = kwargs['edgecolors'] if kwargs['facecolors'] == 'none' \
+        else kwargs['facecolors']
+    image = density.draw(ax, x, y, color)
+    handle.add_callback(
+        lambda artist: image.set_visible(artist.get_visible()))
+
+    return handle
+
+
+# the plot-ready data of every layer that doesn't depend on the highlighted
+# bucket(s), already oriented (see `_layers.py` for its layout); groups are
+# served by the coordinate view (mostly as slices of a single array)
+def _background_data(view, fig_aspect, x_label, y_label, average, himalaya,
+                     pit_toilet, centroids=None):
+    layers = {
+        'fig_aspect': fig_aspect,
+        'x_label': x_label,
+        'y_label': y_label,
+        'average': average,
+        'himalaya': himalaya,
+        'pit_toilet': pit_toilet,
+        'n_samples': view.n_samples,
+        'extent': view.extent,
+        'group/fecal': view.human_excrement(),
+        'group/bulking': view.bulking(),
+        'group/soil': view.soil(),
+        'group/compost': view.compost()
+    }
+
+    # All buckets, so that the highlighted bucket(s) can be hidden for each
+    # figure
+    layers['buckets'] = view.composted_buckets()
+    for i, bucket in enumerate(layers['buckets']):
+        layers[f'bucket/{i}'] = view.composted(bucket)
+
+    # (OPTIONAL) Weekly Mean for all Buckets
+    if average == 'True':
+        centroids = view.orient_table(centroids)
 
-    # allowed sample types to be pulled from the md
-    sample_types = ['Soil', 'Food Compost', 'Landscape Compost',
-                    'Human Excrement', 'Human Excrement Compost',
-                    'Bulking Material']
+        weekly_avgs = centroids.loc['Human Excrement Compost']
+        layers['mean/weekly'] = weekly_avgs.to_numpy(dtype=float)
+        layers['mean/weeks'] = weekly_avgs.index.to_numpy(dtype=float)
+        layers['mean/HE'] = \
+            centroids.loc[('Human Excrement', 0.0)].to_numpy(dtype=float)
+        layers['mean/bulking'] = \
+            centroids.loc[('Bulking Material', 0.0)].to_numpy(dtype=float)
 
-    # if using himalaya and/or pit toilet data
+    # (OPTIONAL SAMPLE TYPES) Himalaya & Pit Toilet
     if himalaya == 'True':
-        sample_types.append('Himalaya')
+        layers['group/himalaya'] = view.himalaya()
     if pit_toilet == 'True':
-        sample_types.append('Pit Toilet')
-
-    # sorting the filtered md (by allowed sample types) by week
-    md = metadata[metadata['SampleType']
-                  .isin(sample_types)].sort_values('Composting Time Point')
-    md['Bucket'] = md['Bucket'].astype(float)
-    md['Composting Time Point'] = md['Composting Time Point'].astype(float)
-
-    buckets_md = md[md['Bucket'].between(1, 16)]
-
-    # ALL SUBJECT FECAL SAMPLES: IDs -> XY ordination points
-    fecal_ids = list(
-        set(buckets_md[buckets_md['SampleType'] == 'Human Excrement']
-            .index.values) &
-        set(ord_2d.index.values))
-    x_fecal, y_fecal = _swap_axis(ord_2d, fecal_ids, swap_axes)
-
-    # ALL SUBJECT BULKING MATERIAL: IDs -> XY ordination points
-    bulking_ids = \
-        list(set(md[md['SampleType'] == 'Bulking Material'].index.values) &
-             set(ord_2d.index.values))
-    x_bulking, y_bulking = _swap_axis(ord_2d, bulking_ids, swap_axes)
-
-    # (OPTIONAL) SELECTED BUCKET(S): IDs -> XY ordination points
-    if highlighted_buckets:
-        buckets_dict, selected_buckets_ids, bucket_set, bucket_starts_dict = \
-            _bucket_util(highlighted_buckets, md, ord_2d)
+        layers['group/pit_toilet'] = view.pit_toilet()
 
-    # (OPTIONAL) WEEKLY MEAN FOR ALL BUCKETS: IDs -> XY ordination points
-    if average == 'True':
-        weeks_md = md[md['Composting Time Point'].between(1, 52)]
-        weeks = list(set(weeks_md['Composting Time Point'].values))
-
-        # dicts for each week's mean x&y values
-        bucket_weekly_avgs_x = {}
-        bucket_weekly_avgs_y = {}
-
-        for week in weeks:
-            x_list = []
-            y_list = []
-
-            # filtering the md to only include post-roll sample types
-            weekly_bucket_ids = md[
-                (md['Composting Time Point'] == week) &
-                (md['SampleType'] == 'Human Excrement Compost')].index.values
-
-            # only use IDs that are present both in the md and ordination
-            included_ids = []
-            for i in weekly_bucket_ids:
-                if i in ord_2d.index.values:
-                    included_ids.append(i)
-
-            # grab weeks 1 & 52 separately to annotate 'start' and 'end' points
-            # for selected bucket(s) and weekly mean for all buckets
-            if week == 1.0:
-                x1, y1 = _swap_axis(ord_2d, included_ids, swap_axes)
-                x1_mean = np.mean(x1.values)
-                y1_mean = np.mean(y1.values)
-            elif week == 52.0:
-                x52, y52 = _swap_axis(ord_2d, included_ids, swap_axes)
-                x52_mean = np.mean(x52.values)
-                y52_mean = np.mean(y52.values)
-            else:
-                pass
-
-            # making sure x&y values correspond to correct ordination axis
-            if swap_axes == 'False':
-                x_list.append(ord_2d.loc[included_ids][0].values)
-                y_list.append(ord_2d.loc[included_ids][1].values)
-            elif swap_axes == 'True':
-                x_list.append(ord_2d.loc[included_ids][1].values)
-                y_list.append(ord_2d.loc[included_ids][0].values)
-            else:
-                raise ValueError('Invalid selection for `swap_axes` parameter.'
-                                 ' Must either be `True` or `False`.')
+    return layers
 
-            x_avg = np.mean(x_list)
-            bucket_weekly_avgs_x[week] = x_avg
 
-            y_avg = np.mean(y_list)
-            bucket_weekly_avgs_y[week] = y_avg
+# the plot-ready data of the highlighted bucket(s): each one's trajectory
+# (with its weeks) & its HE, bulking & HEC week 1 start
+def _highlight_data(selector, view, md, highlighted_buckets,
+                    trajectories=None):
+    layers = {'highlighted_buckets': highlighted_buckets,
+              'highlighted': np.array([], dtype=int)}
+    if not highlighted_buckets:
+        return layers
 
-        # only calculate mean for HE & bulking wk 0 if
-        # no highlighted bucket is selected
-        if not highlighted_buckets:
-            # HE wk 0 mean
-            HE_week0 = \
-                md[(md['SampleType'] == 'Human Excrement') &
-                   (md['Composting Time Point']).isna()].index.values
-            ids_HE_week0 = []
-            for i in HE_week0:
-                if i in ord_2d.index.values:
-                    ids_HE_week0.append(i)
-            x0_HE, y0_HE = _swap_axis(ord_2d, ids_HE_week0, swap_axes)
-            x0_HE_mean = np.mean(x0_HE)
-            y0_HE_mean = np.mean(y0_HE)
-
-            # bulk wk 0 mean
-            bulk_week0 = \
-                md[(md['SampleType'] == 'Bulking Material') &
-                   (md['Composting Time Point']).isna()].index.values
-            ids_bulk_week0 = []
-            for i in bulk_week0:
-                if i in ord_2d.index.values:
-                    ids_bulk_week0.append(i)
-            x0_bulk, y0_bulk = _swap_axis(ord_2d, ids_bulk_week0, swap_axes)
-            x0_bulk_mean = np.mean(x0_bulk)
-            y0_bulk_mean = np.mean(y0_bulk)
-
-    # ALL BUCKETS (minus highlighted bucket(s))
-    all_bucket_ids = \
-        list(set(md[md['Bucket'].between(1, 16)].index) &
-             set(md[md['SampleType'] == 'Human Excrement Compost'].index) &
-             set(ord_2d.index))
-    if highlighted_buckets:
-        bucket_ids = list(set(all_bucket_ids) - bucket_set)
+    with stage('bucket_util'):
+        buckets_dict, selected_buckets_ids, bucket_set, bucket_starts_dict = \
+            _bucket_util(highlighted_buckets, selector, trajectories)
+
+    layers['highlighted'] = np.array(list(buckets_dict), dtype=int)
+    for i, (bucket, ids) in enumerate(buckets_dict.items()):
+        layers[f'highlight/{i}/HEC'] = view.of_ids(ids)
+        layers[f'highlight/{i}/weeks'] = \
+            md.loc[ids]['Composting Time Point'].to_numpy(dtype=float)
+        for part, part_ids in bucket_starts_dict[bucket].items():
+            layers[f'highlight/{i}/{part}'] = view.of_ids(part_ids)
+
+    return layers
+
+
+# draws every layer that doesn't depend on the highlighted bucket(s), so that
+# it can be shared by all figures with the same orientation & sample types
+def _draw_background(ax, layers, density_threshold=DENSITY_THRESHOLD):
+    artists = {}
+
+    # background groups larger than the threshold are binned on a grid
+    # spanning every sample, so that all of their images line up
+    if layers['n_samples'] > int(density_threshold):
+        xmin, xmax, ymin, ymax = layers['extent']
+        density = DensityGrid((xmin, xmax), (ymin, ymax),
+                              threshold=int(density_threshold),
+                              aspect=ax.get_aspect())
     else:
-        bucket_ids = list(set(all_bucket_ids))
-    x_buckets, y_buckets = _swap_axis(ord_2d, bucket_ids, swap_axes)
-
-    # EMP SOILS
-    emp_ids = md.loc[md['SampleType'] == 'Soil'].index.values
-    x_emp, y_emp = _swap_axis(ord_2d, emp_ids, swap_axes)
-
-    # FOOD COMPOST
-    compost_ids = \
-        list(set(md.loc[(md['SampleType'] == 'Food Compost') |
-                        (md['SampleType'] == 'Landscape Compost')].index.values)
-             & set(ord_2d.index.values))
-    x_compost, y_compost = _swap_axis(ord_2d, compost_ids, swap_axes)
-
-    # (OPTIONAL SAMPLE TYPES) HIMALAYA
-    if himalaya == 'True':
-        hima_ids = md.loc[md['Bucket'] == 18.0].index.values
-        x_hima, y_hima = _swap_axis(ord_2d, hima_ids, swap_axes)
-
-    # (OPTIONAL SAMPLE TYPES) PIT TOILET
-    if pit_toilet == 'True':
-        pt_ids = md.loc[md['Bucket'] == 19.0].index.values
-        x_pt, y_pt = _swap_axis(ord_2d, pt_ids, swap_axes)
-
-    # Setting up the plot & axis
-    fig, ax = plt.subplots(1, 1, figsize=(15, 8))
-    ax.set_aspect(aspect=fig_aspect)
-
-    # DEFINING THE COLORMAP FOR EACH SELECTED BUCKET
-    if highlighted_buckets:
-        color_idx = np.linspace(0, 1, len(buckets_dict))
-        color_dict = dict(zip(buckets_dict.keys(), color_idx))
-        viridis = mpl.colormaps['viridis'].resampled(len(buckets_dict))
+        density = None
 
     # Fecal - all subjects
-    fecal_scatter = \
-        plt.scatter(x=x_fecal, y=y_fecal, facecolors='none',
+    x_fecal, y_fecal = layers['group/fecal'].T
+    artists['fecal'] = \
+        _draw_group(ax, x_fecal, y_fecal, density, facecolors='none',
                     edgecolors='tab:brown',
                     label='HE (other buckets)')
 
     # Bulking Material - all subjects
-    bulking_scatter = \
-        plt.scatter(x=x_bulking, y=y_bulking, facecolors='none',
+    x_bulking, y_bulking = layers['group/bulking'].T
+    artists['bulking'] = \
+        _draw_group(ax, x_bulking, y_bulking, density, facecolors='none',
                     edgecolors='g',
                     label='Bulking Material (other buckets)')
 
-    # All buckets (minus highlighted bucket(s))
-    all_sample_buckets = \
-        plt.scatter(x=x_buckets, y=y_buckets, facecolors='none',
-                    edgecolors='#C5C9C7', marker='^',
-                    label='HEC (other buckets)')
+    # All buckets, one artist per bucket so that the highlighted bucket(s)
+    # can be hidden for each figure; whether they're drawn as density images
+    # depends on the size of the other buckets' group as a whole, which is
+    # drawn once (with every bucket) for all of the figures
+    bucket_layers = [layers[f'bucket/{i}']
+                     for i in range(len(layers['buckets']))]
+    n_bucket_samples = sum(len(xy) for xy in bucket_layers)
+    artists['buckets'] = {}
+    for bucket, xy in zip(layers['buckets'], bucket_layers):
+        x_buckets, y_buckets = xy.T
+        artists['buckets'][bucket] = \
+            _draw_group(ax, x_buckets, y_buckets, density,
+                        group_size=n_bucket_samples, facecolors='none',
+                        edgecolors='#C5C9C7', marker='^')
+    # the legend entry of the other buckets, which (unlike any one bucket's
+    # artist) is never hidden
+    artists['buckets_handle'] = \
+        ax.scatter(x=[], y=[], facecolors='none', edgecolors='#C5C9C7',
+                   marker='^', label='HEC (other buckets)')
 
     # (OPTIONAL) Weekly Mean for all Buckets
-    if average == 'True':
-        bucket_avgs_scatter = \
-            plt.scatter(x=bucket_weekly_avgs_x.values(),
-                        y=bucket_weekly_avgs_y.values(),
-                        marker='*', facecolors='#1f77b4',
-                        s=100,
-                        label='HEC (Weekly Mean)')
-
-        # adding HE mean if only plotting the weekly mean
-        # (w/o any highlighted bucket(s))
-        if not highlighted_buckets:
-            # HE
-            HE_week0_scatter = \
-                plt.scatter(x=x0_HE_mean, y=y0_HE_mean,
-                            marker='*', s=150, zorder=1,
-                            facecolors='tab:brown', edgecolors='k',
-                            label='HE (Weekly Mean)')
-
-            # bulking
-            bulk_week0_scatter = \
-                plt.scatter(x=x0_bulk_mean, y=y0_bulk_mean,
-                            marker='*', s=150, zorder=1,
-                            facecolors='g', edgecolors='k',
-                            label='Bulking Material (Weekly Mean)')
+    if layers['average'] == 'True':
+        bucket_weekly_avgs_x, bucket_weekly_avgs_y = layers['mean/weekly'].T
+        weekly_avgs = dict(zip(layers['mean/weeks'], layers['mean/weekly']))
+
+        # grab weeks 1 & 52 separately to annotate 'start' and 'end' points
+        x1_mean, y1_mean = weekly_avgs[1.0]
+        x52_mean, y52_mean = weekly_avgs[52.0]
+
+        x0_HE_mean, y0_HE_mean = layers['mean/HE']
+        x0_bulk_mean, y0_bulk_mean = layers['mean/bulking']
+
+        artists['average'] = \
+            ax.scatter(x=bucket_weekly_avgs_x,
+                       y=bucket_weekly_avgs_y,
+                       marker='*', facecolors='#1f77b4',
+                       s=100,
+                       label='HEC (Weekly Mean)')
+
+        # HE & bulking means, which are only shown when plotting the weekly
+        # mean w/o any highlighted bucket(s)
+        artists['HE_mean'] = \
+            ax.scatter(x=x0_HE_mean, y=y0_HE_mean,
+                       marker='*', s=150, zorder=1,
+                       facecolors='tab:brown', edgecolors='k',
+                       label='HE (Weekly Mean)')
+        artists['bulk_mean'] = \
+            ax.scatter(x=x0_bulk_mean, y=y0_bulk_mean,
+                       marker='*', s=150, zorder=1,
+                       facecolors='g', edgecolors='k',
+                       label='Bulking Material (Weekly Mean)')
 
     # EMP Soil
-    emp_soil_scatter = plt.scatter(x=x_emp, y=y_emp,
-                                   facecolors='k',
-                                   label='Soil')
+    x_emp, y_emp = layers['group/soil'].T
+    artists['soil'] = _draw_group(ax, x_emp, y_emp, density,
+                                  facecolors='k',
+                                  label='Soil')
 
     # Food Compost
-    food_compost_scatter = plt.scatter(x=x_compost, y=y_compost,
-                                       facecolors='r',
-                                       label='FLWC')
+    x_compost, y_compost = layers['group/compost'].T
+    artists['compost'] = _draw_group(ax, x_compost, y_compost, density,
+                                     facecolors='r',
+                                     label='FLWC')
 
     # (OPTIONAL SAMPLE TYPES) Himalaya
-    if himalaya == 'True':
-        himalaya_scatter = plt.scatter(x=x_hima, y=y_hima,
-                                       facecolors='b',
-                                       label='Himalaya')
+    if layers['himalaya'] == 'True':
+        x_hima, y_hima = layers['group/himalaya'].T
+        artists['himalaya'] = _draw_group(ax, x_hima, y_hima, density,
+                                          facecolors='b',
+                                          label='Himalaya')
 
     # (OPTIONAL SAMPLE TYPES) Pit Toilet
-    if pit_toilet == 'True':
-        pit_toilet_scatter = plt.scatter(x=x_pt, y=y_pt,
-                                         facecolors='y',
-                                         label='Pit Toilet')
+    if layers['pit_toilet'] == 'True':
+        x_pt, y_pt = layers['group/pit_toilet'].T
+        artists['pit_toilet'] = _draw_group(ax, x_pt, y_pt, density,
+                                            facecolors='y',
+                                            label='Pit Toilet')
 
-    # collecting the handle info to add to the legend
+    # (OPTIONAL) Weekly Mean for all Buckets
+    if layers['average'] == 'True':
+        ax.plot(bucket_weekly_avgs_x, bucket_weekly_avgs_y, color='#1f77b4')
+        ax.annotate('Start', weight='bold', xy=(x1_mean, y1_mean),
+                    xytext=((x1_mean+0.002), (y1_mean+0.002)))
+        ax.annotate('End', weight='bold', xy=(x52_mean, y52_mean),
+                    xytext=((x52_mean+0.005), (y52_mean+0.002)))
+
+        HE_mean_line, = \
+            ax.plot([x0_HE_mean, x1_mean], [y0_HE_mean, y1_mean],
+                    '--', color='#C5C9C7', linewidth=0.75, zorder=2)
+        bulk_mean_line, = \
+            ax.plot([x0_bulk_mean, x1_mean], [y0_bulk_mean, y1_mean],
+                    '--', color='#C5C9C7', linewidth=0.75, zorder=2)
+        artists['week0_means'] = [artists['HE_mean'], artists['bulk_mean'],
+                                  HE_mean_line, bulk_mean_line]
+
+    return artists
+
+
+# draws the highlighted bucket(s) on top of the background, returning the
+# artists (so they can be removed again), legend handles & bucket numbers
+def _draw_highlights(ax, layers, week_annotations):
+    artists = []
     bucket_handles = []
     bucket_nums = []
 
-    # (OPTIONAL) HIGHLIGHTED BUCKET(S)
-    if highlighted_buckets:
-        # adding start info (HE, bulking -> HEC wk1) for highlighted bucket(s)
-        for bucket, ids in bucket_starts_dict.items():
-            if swap_axes == 'False':
-                x0_HE = ord_2d.loc[ids['HE_week0']][0]
-                y0_HE = ord_2d.loc[ids['HE_week0']][1]
-
-                x0_bulk = ord_2d.loc[ids['bulk_week0']][0]
-                y0_bulk = ord_2d.loc[ids['bulk_week0']][1]
-
-                x1_HEC = ord_2d.loc[ids['HEC_week1']][0]
-                y1_HEC = ord_2d.loc[ids['HEC_week1']][1]
-
-            elif swap_axes == 'True':
-                x0_HE = ord_2d.loc[ids['HE_week0']][1]
-                y0_HE = ord_2d.loc[ids['HE_week0']][0]
-
-                x0_bulk = ord_2d.loc[ids['bulk_week0']][1]
-                y0_bulk = ord_2d.loc[ids['bulk_week0']][0]
-
-                x1_HEC = ord_2d.loc[ids['HEC_week1']][1]
-                y1_HEC = ord_2d.loc[ids['HEC_week1']][0]
-
-            for x, y in zip(x0_HE, y0_HE):
-                ax.plot([x, float(x1_HEC.values)],
-                        [y, float(y1_HEC.values)],
-                        '--', color='#C5C9C7',
-                        linewidth=0.75, zorder=1)
-
-            for x, y in zip(x0_bulk, y0_bulk):
-                ax.plot([x, float(x1_HEC.values)],
-                        [y, float(y1_HEC.values)],
-                        '--', color='#C5C9C7',
-                        linewidth=0.75, zorder=1)
-
-            HE_week0_scatter = \
-                plt.scatter(x=x0_HE, y=y0_HE, facecolors='tab:brown',
-                            label=f'HE (Bucket #{bucket})')
-            bucket_handles.append(HE_week0_scatter)
-
-            bulk_week0_scatter = \
-                plt.scatter(x=x0_bulk, y=y0_bulk, facecolors='g',
-                            label=f'Bulking Material (Bucket #{bucket})')
-            bucket_handles.append(bulk_week0_scatter)
-
-        for bucket, ids in buckets_dict.items():
-            x_bucket, y_bucket = _swap_axis(ord_2d, ids, swap_axes)
-
-            ax.plot(x_bucket, y_bucket, color='k', zorder=1)
-
-            highlighted_bucket_scatter = \
-                plt.scatter(x=x_bucket, y=y_bucket,
-                            facecolors=viridis(color_dict[bucket]),
-                            edgecolors='k', marker='^',
-                            label=f'HEC (Bucket #{bucket})')
-
-            bucket_handles.append(highlighted_bucket_scatter)
-            bucket_nums.append(bucket)
-
-            # adding week annotations for each highlighted bucket
-            if week_annotations == 'True':
-                for week, x, y in zip((md.loc[ids]['Composting Time Point']),
-                                      x_bucket, y_bucket):
-                    week_int = int(week)
-                    ax.annotate(str(week_int), weight='bold', color='purple',
-                                xy=(x, y), xytext=((x+0.002), (y+0.002)))
-            elif week_annotations == 'False':
-                # adding start/end notations for each highlighted bucket
-                ax.annotate('Start', weight='bold', color='purple',
-                            xy=(x_bucket[0], y_bucket[0]),
-                            xytext=((x_bucket[0]+0.002),
-                                    (y_bucket[0]+0.002)))
-                ax.annotate('End', weight='bold', color='purple',
-                            xy=(x_bucket[-1], y_bucket[-1]),
-                            xytext=((x_bucket[-1]+0.005),
-                                    (y_bucket[-1]+0.002)))
+    buckets = layers['highlighted'].tolist()
+    highlights = {bucket: {part: layers[f'highlight/{i}/{part}']
+                           for part in ('HEC', 'weeks', 'HE_week0',
+                                        'bulk_week0', 'HEC_week1')}
+                  for i, bucket in enumerate(buckets)}
+
+    # DEFINING THE COLORMAP FOR EACH SELECTED BUCKET
+    color_idx = np.linspace(0, 1, len(buckets))
+    color_dict = dict(zip(buckets, color_idx))
+    viridis = mpl.colormaps['viridis'].resampled(len(buckets))
+
+    # the HE & bulking -> HEC wk1 connectors, the bucket trajectories & the
+    # week labels of every highlighted bucket are each drawn as one artist,
+    # with the lines added before the markers that they connect
+
+    # adding start info (HE, bulking -> HEC wk1) for highlighted bucket(s)
+    connectors = [[(x, y), tuple(bucket['HEC_week1'][0])]
+                  for bucket in highlights.values()
+                  for x, y in [*bucket['HE_week0'], *bucket['bulk_week0']]]
+    if connectors:
+        artists.append(
+            add_lines(ax, connectors, linestyles='--', colors='#C5C9C7',
+                      linewidths=0.75, capstyle='butt', zorder=1))
+
+    for bucket, highlight in highlights.items():
+        x0_HE, y0_HE = highlight['HE_week0'].T
+        HE_week0_scatter = \
+            ax.scatter(x=x0_HE, y=y0_HE, facecolors='tab:brown',
+                       label=f'HE (Bucket #{bucket})')
+        bucket_handles.append(HE_week0_scatter)
+
+        x0_bulk, y0_bulk = highlight['bulk_week0'].T
+        bulk_week0_scatter = \
+            ax.scatter(x=x0_bulk, y=y0_bulk, facecolors='g',
+                       label=f'Bulking Material (Bucket #{bucket})')
+        bucket_handles.append(bulk_week0_scatter)
+
+    artists.append(
+        add_lines(ax, [highlight['HEC'] for highlight in highlights.values()],
+                  colors='k', zorder=1))
+
+    labels_xy = []
+    labels = []
+    for bucket, highlight in highlights.items():
+        x_bucket, y_bucket = highlight['HEC'].T
+        highlighted_bucket_scatter = \
+            ax.scatter(x=x_bucket, y=y_bucket,
+                       facecolors=viridis(color_dict[bucket]),
+                       edgecolors='k', marker='^',
+                       label=f'HEC (Bucket #{bucket})')
+
+        bucket_handles.append(highlighted_bucket_scatter)
+        bucket_nums.append(bucket)
+
+        # adding week annotations for each highlighted bucket
+        if week_annotations == 'True':
+            for week, x, y in zip(highlight['weeks'], x_bucket, y_bucket):
+                labels_xy.append((x+0.002, y+0.002))
+                labels.append(int(week))
+        elif week_annotations == 'False':
+            # adding start/end notations for each highlighted bucket
+            labels_xy.append((x_bucket[0]+0.002, y_bucket[0]+0.002))
+            labels.append('Start')
+            labels_xy.append((x_bucket[-1]+0.005, y_bucket[-1]+0.002))
+            labels.append('End')
+
+    if labels:
+        artists.append(
+            ax.add_artist(Labels(labels_xy, labels, weight='bold',
+                                 color='purple')))
+
+    artists += bucket_handles
+
+    return artists, bucket_handles, bucket_nums
+
+
+# util for exporting the legend as a separate figure
+def _export_legend(legend, filename, dpi=None):
+    fig = legend.figure
+    fig.canvas.draw()
+    # fixing the legend where it was drawn, as its 'best' location is
+    # otherwise searched for again (& can differ) when saving the crop
+    legend.set_loc(anchored_loc(legend, fig.canvas.get_renderer()))
+    bbox = legend.get_window_extent().transformed(
+        fig.dpi_scale_trans.inverted())
+    fig.savefig(filename, dpi=float(dpi) if dpi else 'figure',
+                bbox_inches=bbox)
+
+
+# the vector formats that a figure can also be saved in
+VECTOR_FORMATS = ('svg', 'pdf')
+
+
+# util for parsing the comma-separated `vector_formats`
+def _vector_formats(vector_formats):
+    formats = [fmt.strip() for fmt in (vector_formats or '').split(',')
+               if fmt.strip()]
+    for fmt in formats:
+        if fmt not in VECTOR_FORMATS:
+            raise ValueError(f'Invalid vector format {fmt!r}. Must be one'
+                             f' of: {", ".join(VECTOR_FORMATS)}.')
+
+    return formats
+
+
+# util for the DPI to save a figure at: `dpi` (or the figure's own), lowered
+# as needed to fit in `max_pixels`; None when neither is set
+def _figure_dpi(fig, dpi=None, max_pixels=None):
+    if not (dpi or max_pixels):
+        return None
+
+    dpi = float(dpi) if dpi else fig.dpi
+    if max_pixels:
+        dpi = budget_dpi(fig, dpi, int(max_pixels))
+
+    return dpi
+
+
+# util for saving a figure in each of the `formats` (vector formats), next to
+# the PNG at `plot_fp` with the same name
+def _save_vector(fig, plot_fp, formats, dpi):
+    # large marker collections are embedded as images (at the same DPI)
+    # rather than written as one element per marker
+    root, _ = os.path.splitext(str(plot_fp))
+    with rasterized_collections(fig):
+        for fmt in formats:
+            fig.savefig(f'{root}.{fmt}', bbox_inches='tight', dpi=dpi,
+                        format=fmt)
+
+
+# util for saving a figure as a PNG (at `dpi`, lowered as needed to fit in
+# `max_pixels`) & in each of the comma-separated `vector_formats`, which are
+# saved next to the PNG with the same name
+def _save_figure(fig, plot_fp, vector_formats=None, dpi=None,
+                 max_pixels=None):
+    formats = _vector_formats(vector_formats)
+    dpi = _figure_dpi(fig, dpi, max_pixels) or 'figure'
+
+    fig.savefig(str(plot_fp), bbox_inches='tight', dpi=dpi)
+    _save_vector(fig, plot_fp, formats, dpi)
+
+
+# shows the background layers for the highlighted bucket(s), & sets the
+# title & axis labels; returns the legend handles (highlights first)
+def _label_axes(ax, artists, bucket_handles, bucket_nums, measure, x_label,
+                y_label, average, himalaya, pit_toilet, highlighted_buckets):
+    # hiding the highlighted bucket(s) from the other buckets layer
+    for bucket, artist in artists['buckets'].items():
+        artist.set_visible(bucket not in bucket_nums)
+    if average == 'True':
+        for artist in artists['week0_means']:
+            artist.set_visible(not highlighted_buckets)
 
     # appending legend info for non-highlighted subject data
-    bucket_handles.append(fecal_scatter)
-    bucket_handles.append(bulking_scatter)
-    bucket_handles.append(all_sample_buckets)
+    bucket_handles.append(artists['fecal'])
+    bucket_handles.append(artists['bulking'])
+    bucket_handles.append(artists['buckets_handle'])
 
     if average == 'True':
         if not highlighted_buckets:
-            bucket_handles.append(HE_week0_scatter)
-            bucket_handles.append(bulk_week0_scatter)
-        bucket_handles.append(bucket_avgs_scatter)
+            bucket_handles.append(artists['HE_mean'])
+            bucket_handles.append(artists['bulk_mean'])
+        bucket_handles.append(artists['average'])
 
-    bucket_handles.append(food_compost_scatter)
-    bucket_handles.append(emp_soil_scatter)
+    bucket_handles.append(artists['compost'])
+    bucket_handles.append(artists['soil'])
 
     if himalaya == 'True':
-        bucket_handles.append(himalaya_scatter)
+        bucket_handles.append(artists['himalaya'])
 
     if pit_toilet == 'True':
-        bucket_handles.append(pit_toilet_scatter)
-
-    # (OPTIONAL) Weekly Mean for all Buckets
-    if average == 'True':
-        ax.plot(bucket_weekly_avgs_x.values(),
-                bucket_weekly_avgs_y.values(), color='#1f77b4')
-        ax.annotate('Start', weight='bold', xy=(x1_mean, y1_mean),
-                    xytext=((x1_mean+0.002), (y1_mean+0.002)))
-        ax.annotate('End', weight='bold', xy=(x52_mean, y52_mean),
-                    xytext=((x52_mean+0.005), (y52_mean+0.002)))
-
-        if not highlighted_buckets:
-            ax.plot([x0_HE_mean, x1_mean], [y0_HE_mean, y1_mean],
-                    '--', color='#C5C9C7', linewidth=0.75, zorder=2)
-            ax.plot([x0_bulk_mean, x1_mean], [y0_bulk_mean, y1_mean],
-                    '--', color='#C5C9C7', linewidth=0.75, zorder=2)
+        bucket_handles.append(artists['pit_toilet'])
 
     # handling title text for buckets depending on bucket highlighting
     if len(bucket_nums) == 0:
@@ -492,50 +620,489 @@ def plot_pcoa_2d(metadata_fp, ordination_fp, measure,
     elif len(bucket_nums) > 1:
         bucket_title_text = f'{measure} for Buckets {sorted(bucket_nums)}'
     # Adding title, labels & legend details
-    plt.gca().set(xlabel=f'PCoA {x_label}', ylabel=f'PCoA {y_label}',
-                  title=f'{bucket_title_text}',
-                  label='Bucket#')
-
-    # Helper method for exporting legend as a separate figure
-    def _export_legend(legend, filename=legend_fp):
-        fig = legend.figure
-        fig.canvas.draw()
-        bbox = legend.get_window_extent().transformed(
-            fig.dpi_scale_trans.inverted())
-        fig.savefig(filename, dpi='figure', bbox_inches=bbox)
+    ax.set(xlabel=f'PCoA {x_label}', ylabel=f'PCoA {y_label}',
+           title=f'{bucket_title_text}',
+           label='Bucket#')
 
-    # Create the legend
-    legend = plt.legend(handles=bucket_handles, bbox_to_anchor=(1.1, 1.05))
+    return bucket_handles
 
-    if export_legend == 'True':
-        _export_legend(legend, legend_fp)
-        legend.remove()
+
+# renders a single figure on top of an already-drawn background, leaving the
+# background as it was found so that the next figure can reuse it; `layers`
+# holds the figure's plot-ready data (see `_layers.py`), & only the
+# presentation of those layers is passed separately
+def _render(fig, ax, artists, layers, measure, week_annotations, plot_fp,
+            export_legend, legend_fp, vector_formats=None, dpi=None,
+            max_pixels=None):
+    # collecting the handle info to add to the legend
+    if layers['highlighted_buckets']:
+        with stage('draw_highlights'):
+            highlight_artists, bucket_handles, bucket_nums = \
+                _draw_highlights(ax, layers, week_annotations)
     else:
-        legend.set_bbox_to_anchor((1.1, 1.05))
+        highlight_artists, bucket_handles, bucket_nums = [], [], []
+
+    bucket_handles = _label_axes(ax, artists, bucket_handles, bucket_nums,
+                                 measure, layers['x_label'],
+                                 layers['y_label'], layers['average'],
+                                 layers['himalaya'], layers['pit_toilet'],
+                                 layers['highlighted_buckets'])
+
+    # Create the legend
+    with stage('legend'):
+        legend = ax.legend(handles=bucket_handles,
+                           bbox_to_anchor=(1.1, 1.05))
+
+        if export_legend == 'True':
+            _export_legend(legend, legend_fp, dpi)
+            legend.remove()
+        else:
+            legend.set_bbox_to_anchor((1.1, 1.05))
+            highlight_artists.append(legend)
 
     # Save the main plot
-    plt.tight_layout()
-    plt.savefig(str(plot_fp), bbox_inches='tight')
+    with stage('layout'):
+        fig.tight_layout()
+    with stage('savefig'):
+        _save_figure(fig, plot_fp, vector_formats, dpi, max_pixels)
+
+    for artist in highlight_artists:
+        artist.remove()
+
+
+# renders the figures that share a drawn background by blitting (see
+# `BackgroundBuffer`): every layer other than the highlighted bucket(s), the
+# HE & bulking week 0 means, the title & the legend is drawn once (per DPI),
+# with the layout (& legend location) of the first figure, & each figure only
+# draws its own artists on top of it. The highlighted bucket(s) are drawn
+# over, rather than hidden from, the other buckets layer, which is part of
+# the shared background. A figure that doesn't fit in the background's
+# canvas (e.g. with a larger legend than the first one) is rendered in full
+# instead.
+def _blit_figures(fig, ax, artists, background, figures):
+    buffer = None
+    buffer_dpi = None
+    # the location of the first figure's legend, which every other legend is
+    # placed at rather than searching for its best location again
+    legend_loc = None
+
+    for highlights, presentation in figures:
+        layers = {**background, **highlights}
+        formats = _vector_formats(presentation['vector_formats'])
+        export_legend = presentation['export_legend'] == 'True'
+
+        if layers['highlighted_buckets']:
+            with stage('draw_highlights'):
+                highlight_artists, bucket_handles, bucket_nums = \
+                    _draw_highlights(ax, layers,
+                                     presentation['week_annotations'])
+        else:
+            highlight_artists, bucket_handles, bucket_nums = [], [], []
+
+        bucket_handles = _label_axes(ax, artists, bucket_handles, bucket_nums,
+                                     presentation['measure'],
+                                     layers['x_label'], layers['y_label'],
+                                     layers['average'], layers['himalaya'],
+                                     layers['pit_toilet'],
+                                     layers['highlighted_buckets'])
+        with stage('legend'):
+            legend = ax.legend(handles=bucket_handles, loc=legend_loc,
+                               bbox_to_anchor=(1.1, 1.05))
+
+        # the artists that differ between figures
+        drawn = [*highlight_artists, *artists.get('week0_means', []),
+                 ax.title]
+
+        if buffer is None:
+            with stage('layout'):
+                legend.set_in_layout(not export_legend)
+                fig.tight_layout()
+                legend.set_in_layout(True)
+                # shrinking the axes to their aspect (as drawing does) so
+                # that the legend & its anchor are placed as they're drawn
+                ax.apply_aspect()
+                legend_loc = anchored_loc(legend, fig.canvas.get_renderer())
+
+        dpi = _figure_dpi(fig, presentation['dpi'],
+                          presentation['max_pixels']) or fig.dpi
+        if buffer is None or dpi != buffer_dpi:
+            with stage('draw_background'):
+                fig.set_dpi(dpi)
+                # drawing every bucket of the other buckets layer
+                hidden = [artist for artist in artists['buckets'].values()
+                          if not artist.get_visible()]
+                for artist in hidden:
+                    artist.set_visible(True)
+                buffer = BackgroundBuffer(fig, excluded=[*drawn, legend])
+                for artist in hidden:
+                    artist.set_visible(False)
+            buffer_dpi = dpi
+
+        with stage('blit'):
+            saved = True
+            if export_legend:
+                buffer.draw([*drawn, legend])
+                saved = buffer.save(presentation['legend_fp'],
+                                    legend.get_window_extent(buffer.renderer))
+                if not saved:
+                    _export_legend(legend, presentation['legend_fp'], dpi)
+                legend.remove()
+            else:
+                drawn.append(legend)
+                highlight_artists.append(legend)
 
+            if saved:
+                buffer.draw(drawn)
+                saved = buffer.save(presentation['plot_fp'],
+                                    buffer.tight_bbox(drawn))
 
-if __name__ == '__main__':
-    metadata_fp = sys.argv[1]
-    ordination_fp = sys.argv[2]
-    measure = sys.argv[3]
-    average = sys.argv[4]
-    week_annotations = sys.argv[5]
-    plot_fp = sys.argv[6]
-    invert_x = sys.argv[7]
-    invert_y = sys.argv[8]
-    swap_axes = sys.argv[9]
-    himalaya = sys.argv[10]
-    pit_toilet = sys.argv[11]
-    export_legend = sys.argv[12]
-    highlighted_buckets = sys.argv[13]
-    legend_fp = sys.argv[14]
-
-    plot_pcoa_2d(metadata_fp, ordination_fp, measure,
+        with stage('savefig'):
+            if saved:
+                _save_vector(fig, presentation['plot_fp'], formats, dpi)
+            else:
+                _save_figure(fig, presentation['plot_fp'],
+                             presentation['vector_formats'], dpi)
+
+        for artist in highlight_artists:
+            artist.remove()
+
+
+# MAIN METHODS #
+def plot_pcoa_2d(metadata, ordination, measure,
                  average, week_annotations, plot_fp,
                  invert_x, invert_y, swap_axes,
                  himalaya, pit_toilet, export_legend,
-                 highlighted_buckets, legend_fp)
+                 highlighted_buckets=None, legend_fp=None,
+                 density_threshold=DENSITY_THRESHOLD, profile_fp=None,
+                 trajectories=None, layers_fp=None, vector_formats=None,
+                 dpi=None, max_pixels=None):
+    # optionally writing a JSON report of each stage's time & peak RSS
+    if profile_fp:
+        profiler = Profiler('plot_pcoa_2d')
+        with activate(profiler):
+            plot_pcoa_2d(metadata, ordination, measure,
+                         average, week_annotations, plot_fp,
+                         invert_x, invert_y, swap_axes,
+                         himalaya, pit_toilet, export_legend,
+                         highlighted_buckets, legend_fp, density_threshold,
+                         trajectories=trajectories, layers_fp=layers_fp,
+                         vector_formats=vector_formats, dpi=dpi,
+                         max_pixels=max_pixels)
+        profiler.write(profile_fp)
+        return
+
+    plot_pcoa_2d_batch(metadata, ordination, [{
+        'measure': measure,
+        'average': average,
+        'week_annotations': week_annotations,
+        'plot_fp': plot_fp,
+        'invert_x': invert_x,
+        'invert_y': invert_y,
+        'swap_axes': swap_axes,
+        'himalaya': himalaya,
+        'pit_toilet': pit_toilet,
+        'export_legend': export_legend,
+        'highlighted_buckets': highlighted_buckets,
+        'legend_fp': legend_fp,
+        'density_threshold': density_threshold,
+        'layers_fp': layers_fp,
+        'vector_formats': vector_formats,
+        'dpi': dpi,
+        'max_pixels': max_pixels
+    }], trajectories=trajectories)
+
+
+# redraws a single figure from the layer data (see `_layers.py`) written by
+# an earlier render (via its `layers_fp`), w/o loading the metadata or the
+# ordination; only the presentation parameters can be changed
+def plot_pcoa_2d_layers(layers, measure, week_annotations, plot_fp,
+                        export_legend, legend_fp=None,
+                        density_threshold=DENSITY_THRESHOLD,
+                        profile_fp=None, vector_formats=None, dpi=None,
+                        max_pixels=None):
+    if profile_fp:
+        profiler = Profiler('plot_pcoa_2d')
+        with activate(profiler):
+            plot_pcoa_2d_layers(layers, measure, week_annotations, plot_fp,
+                                export_legend, legend_fp, density_threshold,
+                                vector_formats=vector_formats, dpi=dpi,
+                                max_pixels=max_pixels)
+        profiler.write(profile_fp)
+        return
+
+    if not isinstance(layers, dict):
+        with stage('load_layers'):
+            layers = read_layers(layers)
+
+    _draw_figures(layers, [(layers, {
+        'measure': measure,
+        'week_annotations': week_annotations,
+        'plot_fp': plot_fp,
+        'export_legend': export_legend,
+        'legend_fp': legend_fp,
+        'vector_formats': vector_formats,
+        'dpi': dpi,
+        'max_pixels': max_pixels
+    })], density_threshold)
+
+
+# renders many figures from a single load of the inputs; each spec is a dict
+# of the `plot_pcoa_2d` parameters (other than the inputs themselves), & may
+# include a `layers_fp` to write the figure's layer data to; figures that
+# share a background are blitted onto it when `blit` is set (see
+# `_blit_figures`)
+def plot_pcoa_2d_batch(metadata, ordination, specs, n_jobs=1,
+                       trajectories=None, blit=False):
+    data = _prepare(metadata, ordination, trajectories)
+
+    # figures that share an orientation & set of background samples share a
+    # single drawn background
+    groups = {}
+    for spec in specs:
+        groups.setdefault(_background_key(spec), []).append(spec)
+
+    if n_jobs == 1:
+        for key, group in groups.items():
+            _render_group(data, key, group, blit)
+        return
+
+    # splitting each group into one contiguous chunk per worker, so that a
+    # single large group still uses the whole pool (each chunk redraws its
+    # own background, which doesn't change any of the figures)
+    tasks = []
+    for key, group in groups.items():
+        chunk_size = -(-len(group) // n_jobs)
+        for i in range(0, len(group), chunk_size):
+            tasks.append((key, group[i:i + chunk_size], blit))
+
+    # the loaded inputs are handed to each worker once when it starts, rather
+    # than being serialized along with every task
+    with ProcessPoolExecutor(max_workers=n_jobs,
+                             initializer=_init_worker,
+                             initargs=(data,)) as executor:
+        # consuming the results so that any worker errors are raised here
+        list(executor.map(_render_group_worker, tasks))
+
+
+# the spec parameters that determine a figure's shared background
+def _background_key(spec):
+    return (*(spec[k] for k in ('swap_axes', 'invert_x', 'invert_y',
+                                'average', 'himalaya', 'pit_toilet')),
+            int(spec.get('density_threshold', DENSITY_THRESHOLD)))
+
+
+# computes the layer data of every figure in the group (sharing a single
+# background) & renders them
+def _render_group(data, key, group, blit=False):
+    prop_explained, ord_2d, md, selector, trajectories = data
+    (swap_axes, invert_x, invert_y, average, himalaya, pit_toilet,
+     density_threshold) = key
+
+    view, fig_aspect, x_label, y_label = \
+        _orient(prop_explained, selector, ord_2d, swap_axes, invert_x,
+                invert_y)
+    centroids = _centroids(selector, ord_2d, average, trajectories)
+
+    with stage('layer_data'):
+        background = _background_data(view, fig_aspect, x_label, y_label,
+                                      average, himalaya, pit_toilet,
+                                      centroids)
+
+    figures = []
+    for spec in group:
+        with stage('layer_data'):
+            highlights = _highlight_data(selector, view, md,
+                                         spec['highlighted_buckets'] or '',
+                                         trajectories)
+        if spec.get('layers_fp'):
+            with stage('write_layers'):
+                write_layers(spec['layers_fp'], {**background, **highlights})
+
+        figures.append((highlights, {k: spec.get(k) for k in (
+            'measure', 'week_annotations', 'plot_fp', 'export_legend',
+            'legend_fp', 'vector_formats', 'dpi', 'max_pixels')}))
+
+    _draw_figures(background, figures, density_threshold, blit)
+
+
+# draws one shared background & renders every figure onto it (or, when
+# blitting, onto its drawn buffer); `figures` are pairs of each figure's
+# highlight layer data & presentation parameters
+def _draw_figures(background, figures, density_threshold=DENSITY_THRESHOLD,
+                  blit=False):
+    # Setting up the plot & axis
+    fig, ax = plt.subplots(1, 1, figsize=(15, 8))
+    ax.set_aspect(aspect=background['fig_aspect'])
+
+    with stage('draw_background'):
+        artists = _draw_background(ax, background, density_threshold)
+
+    if blit:
+        _blit_figures(fig, ax, artists, background, figures)
+        plt.close(fig)
+        return
+
+    # restoring the default layout before each figure, since
+    # `tight_layout` adjusts it based on the previous figure's artists
+    subplotpars = {k: getattr(fig.subplotpars, k) for k in
+                   ('left', 'right', 'bottom', 'top', 'wspace', 'hspace')}
+
+    for highlights, presentation in figures:
+        fig.subplots_adjust(**subplotpars)
+        _render(fig, ax, artists, {**background, **highlights},
+                **presentation)
+
+    # releasing the figure so repeated in-process renders don't accumulate
+    plt.close(fig)
+
+
+# renders one figure with a subplot per ordination (e.g. one per distance
+# measure), all drawn from a single parse of the metadata; `ordinations` maps
+# each subplot's measure to its ordination, & the other parameters are those
+# of `plot_pcoa_2d` (other than the measure)
+def plot_pcoa_2d_grid(metadata, ordinations, average, week_annotations,
+                      plot_fp, invert_x, invert_y, swap_axes, himalaya,
+                      pit_toilet, export_legend, highlighted_buckets=None,
+                      legend_fp=None, density_threshold=DENSITY_THRESHOLD,
+                      n_columns=2, vector_formats=None, dpi=None,
+                      max_pixels=None):
+    # the ordinations are loaded first, so that only the metadata rows of
+    # their samples are kept
+    with stage('load_ordination'):
+        ordinations = {measure: _load_ordination(ordination)
+                       for measure, ordination in ordinations.items()}
+    ids = pd.Index([])
+    for ord_2d, _ in ordinations.values():
+        ids = ids.union(ord_2d.index)
+
+    with stage('load_metadata'):
+        metadata_in = _load_metadata(metadata, ids)
+    with stage('filter_ids'):
+        sorted_md = sort_plot_metadata(metadata_in)
+
+    n_columns = min(int(n_columns), len(ordinations))
+    n_rows = math.ceil(len(ordinations) / n_columns)
+    fig, axes = plt.subplots(n_rows, n_columns, squeeze=False,
+                             figsize=(7.5 * n_columns, 5 * n_rows))
+
+    for ax, (measure, (ord_2d, prop_explained)) in zip(axes.flat,
+                                                       ordinations.items()):
+        ord_2d = ord_2d.copy(deep=False)
+        ord_2d.columns = [0, 1]
+
+        with stage('filter_ids'):
+            md, selector = _join(metadata_in, sorted_md, ord_2d)
+
+        view, fig_aspect, x_label, y_label = \
+            _orient(prop_explained, selector, ord_2d, swap_axes, invert_x,
+                    invert_y)
+        ax.set_aspect(aspect=fig_aspect)
+
+        with stage('layer_data'):
+            layers = {
+                **_background_data(view, fig_aspect, x_label, y_label,
+                                   average, himalaya, pit_toilet,
+                                   _centroids(selector, ord_2d, average)),
+                **_highlight_data(selector, view, md,
+                                  highlighted_buckets or '')
+            }
+
+        with stage('draw_background'):
+            artists = _draw_background(ax, layers, density_threshold)
+        if highlighted_buckets:
+            with stage('draw_highlights'):
+                _, bucket_handles, bucket_nums = \
+                    _draw_highlights(ax, layers, week_annotations)
+        else:
+            bucket_handles, bucket_nums = [], []
+
+        # every subplot has the same legend entries, so only the last
+        # subplot's handles are kept for the shared legend
+        handles = _label_axes(ax, artists, bucket_handles, bucket_nums,
+                              measure, x_label, y_label, average, himalaya,
+                              pit_toilet, highlighted_buckets)
+
+    # removing the unused subplots of an incomplete last row
+    for ax in axes.flat[len(ordinations):]:
+        ax.remove()
+
+    with stage('layout'):
+        fig.tight_layout()
+
+    # a single legend for the whole figure, to the right of the subplots
+    with stage('legend'):
+        legend = fig.legend(handles=handles, loc='center left',
+                            bbox_to_anchor=(1.0, 0.5))
+        if export_legend == 'True':
+            _export_legend(legend, legend_fp, dpi)
+            legend.remove()
+
+    with stage('savefig'):
+        _save_figure(fig, plot_fp, vector_formats, dpi, max_pixels)
+
+    plt.close(fig)
+
+
+# WORKER POOL #
+# the loaded inputs, set once in each worker process by `_init_worker`
+_worker_data = None
+
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+
+def _render_group_worker(task):
+    key, group, blit = task
+    _render_group(_worker_data, key, group, blit)
+
+
+def main(argv):
+    # `argv` is the script's command line, including the script itself
+    metadata_fp = argv[1]
+    ordination_fp = argv[2]
+    measure = argv[3]
+    average = argv[4]
+    week_annotations = argv[5]
+    plot_fp = argv[6]
+    invert_x = argv[7]
+    invert_y = argv[8]
+    swap_axes = argv[9]
+    himalaya = argv[10]
+    pit_toilet = argv[11]
+    export_legend = argv[12]
+    highlighted_buckets = argv[13]
+    legend_fp = argv[14]
+    # (OPTIONAL) sample count above which background groups are drawn as
+    # density images, & path to write a stage timing report to
+    density_threshold = argv[15] if len(argv) > 15 else DENSITY_THRESHOLD
+    profile_fp = argv[16] if len(argv) > 16 else None
+    # (OPTIONAL) path to write the figure's layer data to
+    layers_fp = argv[17] if len(argv) > 17 else None
+    # (OPTIONAL) comma-separated vector formats to also save the figure in
+    # (e.g. 'svg,pdf'), & the DPI & maximum number of pixels of the PNG
+    vector_formats = argv[18] if len(argv) > 18 else None
+    dpi = argv[19] if len(argv) > 19 else None
+    max_pixels = argv[20] if len(argv) > 20 else None
+
+    # the layer data of an earlier render can be given in place of both the
+    # metadata & ordination, in which case the rest of the layer parameters
+    # are ignored
+    if is_layers(metadata_fp):
+        plot_pcoa_2d_layers(metadata_fp, measure, week_annotations, plot_fp,
+                            export_legend, legend_fp, density_threshold,
+                            profile_fp, vector_formats, dpi, max_pixels)
+    else:
+        plot_pcoa_2d(metadata_fp, ordination_fp, measure,
+                     average, week_annotations, plot_fp,
+                     invert_x, invert_y, swap_axes,
+                     himalaya, pit_toilet, export_legend,
+                     highlighted_buckets, legend_fp, density_threshold,
+                     profile_fp, layers_fp=layers_fp,
+                     vector_formats=vector_formats, dpi=dpi,
+                     max_pixels=max_pixels)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,138 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import shutil
+from unittest import mock
+
+import pandas as pd
+import skbio
+
+from qiime2.plugin.testing import TestPluginBase
+
+from gut_to_soil_manuscript_figures._cache import RenderCache, render_key
+
+
+class RenderKeyTests(TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def setUp(self):
+        super().setUp()
+
+        self.md = pd.read_csv(self.get_data_path('metadata.tsv'),
+                              sep='\t').set_index('sample-id')
+        self.ordination = skbio.OrdinationResults.read(
+            self.get_data_path('ordination.txt'))
+        self.params = {'measure': 'Jaccard', 'average': 'True'}
+        self.key = render_key(self.md, self.ordination, self.params)
+
+    def test_unrelated_changes_ignored(self):
+        md = self.md.copy()
+        md['Description'] = 'changed'
+        # the third axis isn't plotted
+        self.ordination.samples[2] = 0.0
+
+        self.assertEqual(render_key(md, self.ordination, self.params),
+                         self.key)
+
+    def test_params_change_key(self):
+        params = dict(self.params, average='False')
+
+        self.assertNotEqual(render_key(self.md, self.ordination, params),
+                            self.key)
+
+    def test_plotted_inputs_change_key(self):
+        md = self.md.copy()
+        md.loc['HEC.1.2', 'Composting Time Point'] = 3
+        self.assertNotEqual(render_key(md, self.ordination, self.params),
+                            self.key)
+
+        self.ordination.samples.iloc[0, 1] += 1.0
+        self.assertNotEqual(render_key(self.md, self.ordination, self.params),
+                            self.key)
+
+
+class RenderCacheTests(TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def setUp(self):
+        super().setUp()
+
+        self.cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        self.output_dir = os.path.join(self.temp_dir.name, 'output')
+        os.mkdir(self.output_dir)
+
+    def _write_output(self, fn, size):
+        with open(os.path.join(self.output_dir, fn), 'wb') as fh:
+            fh.write(b'x' * size)
+
+    def test_put_get(self):
+        cache = RenderCache(self.cache_dir)
+        self._write_output('pcoa_plot.png', 10)
+        self._write_output('metadata.tsv', 10)
+
+        self.assertFalse(cache.get('abc', self.output_dir))
+        cache.put('abc', self.output_dir, ['pcoa_plot.png'])
+
+        new_output_dir = os.path.join(self.temp_dir.name, 'new')
+        os.mkdir(new_output_dir)
+        self.assertTrue(cache.get('abc', new_output_dir))
+        self.assertEqual(os.listdir(new_output_dir), ['pcoa_plot.png'])
+
+    def test_get_evicted_while_copying(self):
+        cache = RenderCache(self.cache_dir)
+        self._write_output('pcoa_plot.png', 10)
+        self._write_output('legend.png', 10)
+        cache.put('abc', self.output_dir, ['pcoa_plot.png', 'legend.png'])
+
+        # another process clears the cache after the first file is copied
+        copyfile = shutil.copyfile
+
+        def copy_then_clear(src, dst):
+            copyfile(src, dst)
+            cache.clear()
+
+        new_output_dir = os.path.join(self.temp_dir.name, 'new')
+        os.mkdir(new_output_dir)
+        with mock.patch('gut_to_soil_manuscript_figures._cache.shutil.'
+                        'copyfile', side_effect=copy_then_clear):
+            self.assertFalse(cache.get('abc', new_output_dir))
+
+        # a miss, without any of the entry's files
+        self.assertEqual(os.listdir(new_output_dir), [])
+        self.assertEqual(cache.entries(), [])
+
+    def test_lru_eviction(self):
+        cache = RenderCache(self.cache_dir, max_size=25)
+        self._write_output('pcoa_plot.png', 10)
+
+        cache.put('a', self.output_dir, ['pcoa_plot.png'])
+        cache.put('b', self.output_dir, ['pcoa_plot.png'])
+        os.utime(os.path.join(self.cache_dir, 'a'), (0, 0))
+        os.utime(os.path.join(self.cache_dir, 'b'), (1, 1))
+        # using 'a' makes 'b' the least recently used entry
+        cache.get('a', self.output_dir)
+        cache.put('c', self.output_dir, ['pcoa_plot.png'])
+
+        self.assertEqual(sorted(k for k, _, _ in cache.entries()),
+                         ['a', 'c'])
+        self.assertEqual(cache.info()['size'], 20)
+
+    def test_info_and_clear(self):
+        cache = RenderCache(self.cache_dir, max_size=100)
+        self.assertEqual(cache.info()['entries'], 0)
+
+        self._write_output('pcoa_plot.png', 10)
+        cache.put('a', self.output_dir, ['pcoa_plot.png'])
+        self.assertEqual(cache.info(), {'path': self.cache_dir,
+                                        'entries': 1, 'size': 10,
+                                        'max_size': 100})
+
+        cache.clear()
+        self.assertEqual(cache.info()['entries'], 0)
+        self.assertEqual(os.listdir(self.cache_dir), [])
@@ -0,0 +1,191 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import io
+import os
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from qiime2.plugin.testing import TestPluginBase
+
+from gut_to_soil_manuscript_figures._drawing import (
+    BackgroundBuffer, DensityGrid, Labels, add_lines, anchored_loc,
+    budget_dpi, rasterized_collections)
+from gut_to_soil_manuscript_figures.scripts.plot_pcoa_2d import _draw_group
+
+
+class DrawingTests(TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def setUp(self):
+        super().setUp()
+
+        self.fig, self.ax = plt.subplots()
+        self.ax.set(xlim=(0, 10), ylim=(0, 10))
+
+    def tearDown(self):
+        plt.close(self.fig)
+        super().tearDown()
+
+    def test_add_lines(self):
+        lines = add_lines(self.ax, [[(0, 0), (1, 1), (2, 0)],
+                                    [(5, 5), (6, 6)]], colors='k')
+
+        self.assertEqual(list(self.ax.collections), [lines])
+        self.assertEqual(len(lines.get_segments()), 2)
+        self.assertEqual(lines.get_capstyle(), 'projecting')
+
+    def test_labels_match_annotations(self):
+        xy = [(1, 1), (4, 2), (8, 9)]
+        texts = [1, 2, 52]
+
+        annotations = [self.ax.annotate(str(text), weight='bold', xy=point,
+                                        xytext=point)
+                       for point, text in zip(xy, texts)]
+        labels = self.ax.add_artist(Labels(xy, texts, weight='bold'))
+
+        renderer = self.fig.canvas.get_renderer()
+        expected = [a.get_window_extent(renderer) for a in annotations]
+
+        np.testing.assert_allclose(
+            labels.get_window_extent(renderer).get_points(),
+            np.array([np.min([b.min for b in expected], axis=0),
+                      np.max([b.max for b in expected], axis=0)]))
+        self.assertFalse(labels.get_clip_on())
+
+    def test_density_grid(self):
+        rng = np.random.default_rng(0)
+        x, y = rng.uniform(0, 10, size=(2, 1000))
+        grid = DensityGrid(x, y, threshold=10, bins=20)
+
+        self.assertEqual(grid.bins, (20, 20))
+
+        # a group occupying only the lower left of the plot
+        image = grid.draw(self.ax, x[(x < 5) & (y < 5)],
+                          y[(x < 5) & (y < 5)], 'tab:red')
+
+        left, right, bottom, top = image.get_extent()
+        self.assertAlmostEqual(left, grid.extent[0])
+        self.assertAlmostEqual(bottom, grid.extent[2])
+        self.assertLess(right, 5.5)
+        self.assertLess(top, 5.5)
+        self.assertEqual(image.get_array().sum(),
+                         np.sum((x < 5) & (y < 5)))
+        self.assertEqual(list(self.ax.images), [image])
+
+    def test_density_grid_square_bins(self):
+        grid = DensityGrid([0, 10], [0, 2], bins=100, aspect=2.0)
+
+        self.assertEqual(grid.bins, (100, 40))
+
+    def test_draw_group_density(self):
+        rng = np.random.default_rng(0)
+        x, y = rng.uniform(0, 10, size=(2, 100))
+        grid = DensityGrid(x, y, threshold=50)
+
+        small = _draw_group(self.ax, x[:50], y[:50], grid,
+                            facecolors='none', edgecolors='tab:brown')
+        large = _draw_group(self.ax, x, y, grid, facecolors='r',
+                            edgecolors='face', label='FLWC')
+
+        self.assertEqual(len(small.get_offsets()), 50)
+        self.assertEqual(len(large.get_offsets()), 0)
+        image, = self.ax.images
+
+        # the (empty) scatter stands in for the image in the legend
+        self.assertEqual(self.ax.get_legend_handles_labels(),
+                         ([large], ['FLWC']))
+        large.set_visible(False)
+        self.assertFalse(image.get_visible())
+
+    def test_rasterized_collections(self):
+        xy = np.linspace(0, 9, 20)
+        large = self.ax.scatter(x=xy, y=xy)
+        small = self.ax.scatter(x=[1.0], y=[1.0])
+
+        def _svg():
+            svg = io.StringIO()
+            self.fig.savefig(svg, format='svg')
+            return svg.getvalue()
+
+        exp = _svg()
+        with rasterized_collections(self.fig, limit=10) as rasterized:
+            self.assertEqual(rasterized, [large])
+            self.assertTrue(large.get_rasterized())
+            self.assertFalse(small.get_rasterized())
+            obs = _svg()
+
+        self.assertFalse(large.get_rasterized())
+        # the large collection's markers are replaced by a single image
+        self.assertEqual(exp.count('<image'), 0)
+        self.assertEqual(obs.count('<image'), 1)
+        self.assertEqual(exp.count('<use') - obs.count('<use'), 20)
+
+    def test_budget_dpi(self):
+        self.ax.set_title('title')
+        fp = os.path.join(self.temp_dir.name, 'plot.png')
+
+        dpi = budget_dpi(self.fig, 300, 100_000)
+        self.assertLess(dpi, 300)
+        self.fig.savefig(fp, dpi=dpi, bbox_inches='tight')
+        height, width, _ = plt.imread(fp).shape
+        self.assertLessEqual(width * height, 100_000)
+        self.assertGreater(width * height, 90_000)
+
+        # DPIs that fit in the budget are kept
+        self.assertEqual(budget_dpi(self.fig, 50, 100_000), 50)
+
+        # a budget that doesn't fit the figure even at 1 DPI
+        with self.assertRaisesRegex(ValueError, r'\(1\) is too few'):
+            budget_dpi(self.fig, 300, 1)
+
+    def test_background_buffer(self):
+        self.ax.scatter(np.arange(10), np.arange(10))
+        line, = self.ax.plot([1, 8], [8, 1], color='k')
+        title = self.ax.set_title('title')
+
+        self.fig.canvas.draw()
+        exp = np.array(self.fig.canvas.buffer_rgba())
+
+        buffer = BackgroundBuffer(self.fig, excluded=[line, title])
+        self.assertTrue(line.get_visible())
+        background = np.array(self.fig.canvas.buffer_rgba())
+        self.assertFalse((background == exp).all())
+
+        # blitting the excluded artists matches drawing them with the rest
+        buffer.draw([title, line])
+        np.testing.assert_array_equal(self.fig.canvas.buffer_rgba(), exp)
+        buffer.draw([])
+        np.testing.assert_array_equal(self.fig.canvas.buffer_rgba(),
+                                      background)
+
+    def test_background_buffer_save(self):
+        title = self.ax.set_title('title')
+        buffer = BackgroundBuffer(self.fig, excluded=[title])
+        buffer.draw([title])
+        fp = os.path.join(self.temp_dir.name, 'plot.png')
+        exp_fp = os.path.join(self.temp_dir.name, 'exp.png')
+
+        # the same size as when saved in full
+        self.assertTrue(buffer.save(fp, buffer.tight_bbox([title])))
+        self.fig.savefig(exp_fp, bbox_inches='tight')
+        self.assertEqual(plt.imread(fp).shape, plt.imread(exp_fp).shape)
+
+        # nothing is saved past the edges of the canvas
+        self.assertFalse(buffer.save(fp, self.fig.bbox.padded(1)))
+
+    def test_anchored_loc(self):
+        self.ax.scatter([1, 2], [3, 4], label='samples')
+
+        for loc in ('upper right', 'lower left', 'center left', 'center',
+                    'upper center'):
+            legend = self.ax.legend(loc=loc, bbox_to_anchor=(1.1, 1.05))
+            self.assertEqual(
+                anchored_loc(legend, self.fig.canvas.get_renderer()), loc)
+            legend.remove()
@@ -0,0 +1,87 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+
+import pandas as pd
+import skbio
+
+import qiime2
+from qiime2.plugin import ValidationError
+from qiime2.plugin.testing import TestPluginBase
+
+from gut_to_soil_manuscript_figures._formats import (
+    TrajectoryCentroidsFormat, TrajectoryIndexDirectoryFormat,
+    TrajectorySamplesFormat)
+from gut_to_soil_manuscript_figures._methods import trajectory_index
+from gut_to_soil_manuscript_figures._trajectory import (
+    BucketTrajectories, write_bucket_trajectories)
+
+
+class TrajectoryIndexFormatTests(TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def setUp(self):
+        super().setUp()
+
+        self.trajectories = trajectory_index(
+            qiime2.Metadata.load(self.get_data_path('metadata.tsv')),
+            skbio.OrdinationResults.read(
+                self.get_data_path('ordination.txt')))
+
+    def _write(self, fn, text):
+        fp = os.path.join(self.temp_dir.name, fn)
+        with open(fp, 'w') as fh:
+            fh.write(text)
+
+        return fp
+
+    def test_directory_format(self):
+        write_bucket_trajectories(self.temp_dir.name, self.trajectories)
+
+        TrajectoryIndexDirectoryFormat(self.temp_dir.name, mode='r').validate()
+
+    def test_samples_format_missing_week(self):
+        fp = self._write('samples.tsv',
+                         'sample-id\tbucket\trole\tweek\tPC1\tPC2\n'
+                         'HE.1\t1.0\tHE\t\t0.5\t-0.5\n')
+
+        TrajectorySamplesFormat(fp, mode='r').validate()
+
+    def test_samples_format_wrong_header(self):
+        fp = self._write('samples.tsv', 'sample-id\tbucket\tPC1\tPC2\n')
+
+        with self.assertRaisesRegex(ValidationError, 'header'):
+            TrajectorySamplesFormat(fp, mode='r').validate()
+
+    def test_centroids_format_not_a_number(self):
+        fp = self._write('centroids.tsv',
+                         'SampleType\tweek\tPC1\tPC2\n'
+                         'Human Excrement Compost\t1.0\tabc\t0.5\n')
+
+        with self.assertRaisesRegex(ValidationError, "'PC1' on line 2"):
+            TrajectoryCentroidsFormat(fp, mode='r').validate()
+
+    def test_centroids_format_wrong_number_of_fields(self):
+        fp = self._write('centroids.tsv',
+                         'SampleType\tweek\tPC1\tPC2\n'
+                         'Human Excrement Compost\t1.0\t0.5\n')
+
+        with self.assertRaisesRegex(ValidationError, '3 fields'):
+            TrajectoryCentroidsFormat(fp, mode='r').validate()
+
+    def test_transformers(self):
+        ff = self.get_transformer(
+            BucketTrajectories, TrajectoryIndexDirectoryFormat
+        )(self.trajectories)
+        obs = self.get_transformer(
+            TrajectoryIndexDirectoryFormat, BucketTrajectories)(ff)
+
+        pd.testing.assert_frame_equal(obs.samples, self.trajectories.samples)
+        pd.testing.assert_frame_equal(obs.centroids,
+                                      self.trajectories.centroids)
@@ -0,0 +1,79 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+import skbio
+
+from qiime2.plugin.testing import TestPluginBase
+
+from gut_to_soil_manuscript_figures._handoff import (
+    is_handoff, read_metadata, read_ordination, read_trajectories,
+    write_handoff)
+from gut_to_soil_manuscript_figures._trajectory import BucketTrajectories
+
+
+class HandoffTests(TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def setUp(self):
+        super().setUp()
+
+        self.md = pd.read_csv(self.get_data_path('metadata.tsv'),
+                              sep='\t').set_index('sample-id')
+        self.ordination = skbio.OrdinationResults.read(
+            self.get_data_path('ordination.txt'))
+
+    def test_round_trip(self):
+        path = self.temp_dir.name
+        self.assertFalse(is_handoff(path))
+
+        write_handoff(path, self.md, self.ordination)
+        self.assertTrue(is_handoff(path))
+
+        ord_2d, prop_explained = read_ordination(path)
+        np.testing.assert_array_equal(
+            ord_2d.to_numpy(), self.ordination.samples.iloc[:, 0:2])
+        self.assertEqual(list(ord_2d.index),
+                         list(self.ordination.samples.index))
+        np.testing.assert_array_equal(
+            prop_explained, self.ordination.proportion_explained[0:2])
+
+        md = read_metadata(path)
+        self.assertEqual(list(md.columns),
+                         ['SampleType', 'Bucket', 'Composting Time Point'])
+        exp = self.md.loc[ord_2d.index]
+        self.assertEqual(list(md['SampleType']), list(exp['SampleType']))
+        np.testing.assert_array_equal(md['Bucket'], exp['Bucket'])
+        np.testing.assert_array_equal(md['Composting Time Point'],
+                                      exp['Composting Time Point'])
+
+    def test_missing_metadata_samples(self):
+        with self.assertRaises(KeyError):
+            write_handoff(self.temp_dir.name, self.md.drop(index='HE.1'),
+                          self.ordination)
+
+    def test_trajectories(self):
+        path = self.temp_dir.name
+        exp = BucketTrajectories(
+            pd.DataFrame({'bucket': [1.0], 'role': ['HE'], 'week': [np.nan],
+                          'PC1': [0.5], 'PC2': [-0.5]},
+                         index=pd.Index(['HE.1'], name='sample-id')),
+            pd.DataFrame({'SampleType': ['Human Excrement'], 'week': [0.0],
+                          'PC1': [0.5], 'PC2': [-0.5]}))
+
+        write_handoff(path, self.md, self.ordination, exp)
+        obs = read_trajectories(path)
+
+        pd.testing.assert_frame_equal(obs.samples, exp.samples)
+        pd.testing.assert_frame_equal(obs.centroids, exp.centroids)
+
+    def test_no_trajectories(self):
+        write_handoff(self.temp_dir.name, self.md, self.ordination)
+
+        self.assertIsNone(read_trajectories(self.temp_dir.name))
@@ -0,0 +1,123 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import base64
+import json
+import os
+
+import numpy as np
+import skbio
+
+from qiime2.plugin.testing import TestPluginBase
+
+from gut_to_soil_manuscript_figures._interactive import (
+    GROUPS, PAYLOAD_FN, SCRIPT_FN, interactive_payload, write_interactive)
+from gut_to_soil_manuscript_figures._metadata import read_plot_metadata
+
+
+def _decode(column):
+    return np.frombuffer(base64.b64decode(column['data']),
+                         dtype=np.dtype(column['dtype']).newbyteorder('<'))
+
+
+class InteractivePayloadTests(TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def setUp(self):
+        super().setUp()
+
+        self.md = read_plot_metadata(self.get_data_path('metadata.tsv'))
+        self.ordination = skbio.OrdinationResults.read(
+            self.get_data_path('ordination.txt'))
+
+    def _column(self, payload, name):
+        values = _decode(payload[name])
+        self.assertEqual(len(values), payload['n_samples'])
+
+        return dict(zip(payload['ids'], values))
+
+    def test_groups(self):
+        payload = interactive_payload(self.md, self.ordination,
+                                      himalaya=True)
+        names = [group['name'] for group in payload['groups']]
+        group = {id_: names[code]
+                 for id_, code in self._column(payload, 'group').items()}
+
+        self.assertEqual(group['HE.1'], 'fecal')
+        self.assertEqual(group['BM.2'], 'bulking')
+        self.assertEqual(group['HEC.3.52'], 'composted')
+        self.assertEqual(group['LC.1'], 'compost')
+        self.assertEqual(group['HI.0'], 'himalaya')
+        # pit toilet samples are only included when requested
+        self.assertNotIn('PT.0', group)
+        self.assertEqual(len(payload['groups']), len(GROUPS))
+
+    def test_codes(self):
+        payload = interactive_payload(self.md, self.ordination)
+        bucket = self._column(payload, 'bucket')
+        week = self._column(payload, 'week')
+
+        self.assertEqual(payload['bucket']['dtype'], 'int8')
+        self.assertEqual(payload['week']['dtype'], 'int16')
+        self.assertEqual((bucket['HEC.2.52'], week['HEC.2.52']), (2, 52))
+        self.assertEqual((bucket['S.0'], week['S.0']), (0, -1))
+        self.assertEqual(week['HE.1'], -1)
+
+    def test_late_weeks(self):
+        md = self.md.copy()
+        md.loc['HEC.2.52', 'Composting Time Point'] = 200.0
+
+        week = self._column(interactive_payload(md, self.ordination), 'week')
+
+        self.assertEqual(week['HEC.2.52'], 200)
+
+    def test_average(self):
+        self.assertFalse(
+            interactive_payload(self.md, self.ordination)['average'])
+        self.assertTrue(interactive_payload(self.md, self.ordination,
+                                            average=True)['average'])
+
+    def test_orientation(self):
+        exp = self.ordination.samples.loc['HEC.1.2']
+        payload = interactive_payload(self.md, self.ordination,
+                                      invert_x=True, swap_axes=True)
+
+        self.assertEqual(payload['axis_labels'], ['PCoA 2', 'PCoA 1'])
+        # inverted along PCoA 1, which is then drawn on the y axis
+        self.assertAlmostEqual(self._column(payload, 'x')['HEC.1.2'], exp[1],
+                               places=6)
+        self.assertAlmostEqual(self._column(payload, 'y')['HEC.1.2'],
+                               -exp[0], places=6)
+        prop_explained = self.ordination.proportion_explained
+        self.assertAlmostEqual(payload['aspect'],
+                               prop_explained[0] / prop_explained[1])
+
+    def test_weekly_means(self):
+        payload = interactive_payload(self.md, self.ordination)
+        means = payload['weekly_means']
+        samples = self.ordination.samples
+
+        self.assertEqual(means['composted']['week'], [1, 2, 52])
+        self.assertAlmostEqual(
+            means['composted']['x'][2],
+            samples.loc[['HEC.1.52', 'HEC.2.52', 'HEC.3.52'], 0].mean())
+        self.assertEqual(means['fecal']['week'], [0])
+        self.assertAlmostEqual(
+            means['bulking']['y'][0],
+            samples.loc[['BM.1', 'BM.2', 'BM.3'], 1].mean())
+
+    def test_write_interactive(self):
+        output_dir = self.temp_dir.name
+        payload = interactive_payload(self.md, self.ordination,
+                                      highlighted_buckets='1, 3')
+
+        write_interactive(output_dir, payload)
+
+        with open(os.path.join(output_dir, PAYLOAD_FN)) as fh:
+            self.assertEqual(json.load(fh)['highlighted_buckets'], [1, 3])
+        self.assertTrue(os.path.exists(os.path.join(output_dir, SCRIPT_FN)))
@@ -0,0 +1,134 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+
+import numpy as np
+import matplotlib.pyplot as plt
+import skbio
+
+from qiime2.plugin.testing import TestPluginBase
+
+from gut_to_soil_manuscript_figures._layers import (
+    is_layers, read_layers, write_layers)
+from gut_to_soil_manuscript_figures._metadata import read_plot_metadata
+from gut_to_soil_manuscript_figures.scripts.plot_pcoa_2d import (
+    _draw_background, _draw_highlights, _label_axes, plot_pcoa_2d,
+    plot_pcoa_2d_layers)
+
+
+class LayersTests(TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def setUp(self):
+        super().setUp()
+
+        self.md = read_plot_metadata(self.get_data_path('metadata.tsv'))
+        self.ordination = skbio.OrdinationResults.read(
+            self.get_data_path('ordination.txt'))
+
+    def _path(self, fn):
+        return os.path.join(self.temp_dir.name, fn)
+
+    def _read(self, fn):
+        with open(self._path(fn), 'rb') as fh:
+            return fh.read()
+
+    def _plot(self, measure, week_annotations, plot_fn, layers_fp=None):
+        plot_pcoa_2d(self.md, self.ordination, measure, 'True',
+                     week_annotations, self._path(plot_fn), 'True', 'False',
+                     'True', 'True', 'False', 'False',
+                     highlighted_buckets='2, 3', layers_fp=layers_fp)
+
+    def test_round_trip(self):
+        path = self._path('layers.npz')
+        self.assertFalse(is_layers(path))
+
+        write_layers(path, {'x_label': 2, 'average': 'True',
+                            'group/soil': np.array([[1.0, 2.0]]),
+                            'highlighted': np.array([], dtype=int)})
+        self.assertTrue(is_layers(path))
+
+        layers = read_layers(path)
+        self.assertEqual(layers['x_label'], 2)
+        self.assertEqual(layers['average'], 'True')
+        np.testing.assert_array_equal(layers['group/soil'], [[1.0, 2.0]])
+        self.assertEqual(layers['highlighted'].tolist(), [])
+
+    def test_layer_data(self):
+        layers_fp = self._path('layers.npz')
+        self._plot('Jaccard', 'True', 'plot.png', layers_fp)
+        layers = read_layers(layers_fp)
+
+        self.assertEqual((layers['x_label'], layers['y_label']), (2, 1))
+        self.assertEqual(layers['highlighted'].tolist(), [2, 3])
+        self.assertNotIn('group/pit_toilet', layers)
+
+        # oriented (PCoA 1 inverted & then the axes swapped), & in time
+        # series order
+        samples = self.ordination.samples
+        exp = samples.loc[['HEC.2.1', 'HEC.2.2', 'HEC.2.52'], [1, 0]] * \
+            [1.0, -1.0]
+        np.testing.assert_array_equal(layers['highlight/0/HEC'], exp)
+        np.testing.assert_array_equal(layers['highlight/0/weeks'],
+                                      [1.0, 2.0, 52.0])
+
+    def test_redraw_from_layers(self):
+        layers_fp = self._path('layers.npz')
+        self._plot('Jaccard', 'True', 'first.png', layers_fp)
+
+        # only the presentation differs from the render that wrote the layer
+        # data, so redrawing from it matches rendering from the inputs
+        self._plot('Bray-Curtis', 'False', 'exp.png')
+        plot_pcoa_2d_layers(layers_fp, 'Bray-Curtis', 'False',
+                            self._path('obs.png'), 'False')
+
+        self.assertEqual(self._read('obs.png'), self._read('exp.png'))
+        self.assertNotEqual(self._read('obs.png'), self._read('first.png'))
+
+    def _background(self, highlighted_buckets, density_threshold=None):
+        layers_fp = self._path('layers.npz')
+        plot_pcoa_2d(self.md, self.ordination, 'Jaccard', 'False', 'False',
+                     self._path('plot.png'), 'False', 'False', 'False',
+                     'False', 'False', 'False',
+                     highlighted_buckets=highlighted_buckets,
+                     layers_fp=layers_fp)
+        layers = read_layers(layers_fp)
+
+        fig, ax = plt.subplots()
+        self.addCleanup(plt.close, fig)
+        ax.set_aspect(aspect=layers['fig_aspect'])
+        kwargs = {} if density_threshold is None \
+            else {'density_threshold': density_threshold}
+
+        return ax, layers, _draw_background(ax, layers, **kwargs)
+
+    def test_other_buckets_legend_handle(self):
+        ax, layers, artists = self._background('1')
+        _, bucket_handles, bucket_nums = \
+            _draw_highlights(ax, layers, 'False')
+        handles = _label_axes(ax, artists, bucket_handles, bucket_nums,
+                              'Jaccard', 1, 2, 'False', 'False', 'False',
+                              layers['highlighted_buckets'])
+
+        # the first bucket is highlighted (& so hidden from the other
+        # buckets), but the other buckets' legend entry is still shown
+        self.assertFalse(artists['buckets'][1.0].get_visible())
+        handle, = [handle for handle in handles
+                   if handle.get_label() == 'HEC (other buckets)']
+        self.assertTrue(handle.get_visible())
+
+    def test_other_buckets_density(self):
+        # each of the 3 buckets has 3 composted samples, so only the other
+        # buckets' group as a whole is over the threshold
+        ax, layers, artists = self._background('', density_threshold=5)
+
+        self.assertEqual(len(ax.images), 3)
+        for artist in artists['buckets'].values():
+            self.assertEqual(len(artist.get_offsets()), 0)
+        self.assertEqual(len(artists['soil'].get_offsets()), 4)
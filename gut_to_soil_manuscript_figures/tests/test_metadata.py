@@ -0,0 +1,88 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import numpy as np
+
+import qiime2
+from qiime2.plugin.testing import TestPluginBase
+
+from gut_to_soil_manuscript_figures._metadata import (
+    PLOT_COLUMNS, check_metadata_ids, plot_metadata, read_plot_metadata)
+
+
+class PlotMetadataTests(TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def assert_plot_metadata(self, md):
+        self.assertEqual(list(md.columns), PLOT_COLUMNS)
+        self.assertEqual(md['SampleType'].dtype, 'category')
+        self.assertEqual(md['Bucket'].dtype, np.float32)
+        self.assertEqual(md['Composting Time Point'].dtype, np.float32)
+
+        self.assertEqual(md.loc['HEC.2.52', 'SampleType'],
+                         'Human Excrement Compost')
+        self.assertEqual(md.loc['HEC.2.52', 'Bucket'], 2.0)
+        self.assertEqual(md.loc['HEC.2.52', 'Composting Time Point'], 52.0)
+        self.assertTrue(np.isnan(md.loc['S.0', 'Bucket']))
+
+    def test_plot_metadata(self):
+        metadata = qiime2.Metadata.load(self.get_data_path('metadata.tsv'))
+
+        self.assert_plot_metadata(plot_metadata(metadata))
+
+    def test_read_plot_metadata(self):
+        md = read_plot_metadata(self.get_data_path('metadata.tsv'))
+
+        # the unused Description column is never parsed
+        self.assert_plot_metadata(md)
+
+    def test_read_plot_metadata_ids(self):
+        fp = self.get_data_path('metadata.tsv')
+        ids = ['S.0', 'HEC.2.52', 'HE.1']
+
+        # streamed in chunks smaller than the file, keeping the file's order
+        md = read_plot_metadata(fp, ids, chunksize=2)
+
+        self.assertEqual(list(md.index),
+                         list(read_plot_metadata(fp).index.intersection(ids)))
+        self.assert_plot_metadata(md)
+        self.assertEqual(list(md['SampleType'].cat.categories),
+                         ['Human Excrement', 'Human Excrement Compost',
+                          'Soil'])
+
+    def test_read_plot_metadata_directives(self):
+        # a `#q2:types` row, whose values aren't numbers, is skipped
+        fp = self.get_data_path('metadata-directives.tsv')
+
+        md = read_plot_metadata(fp)
+        self.assertNotIn('#q2:types', md.index)
+        self.assert_plot_metadata(md)
+
+        md = read_plot_metadata(fp, ['S.0', 'HEC.2.52'], chunksize=2)
+        self.assertEqual(list(md.index), ['HEC.2.52', 'S.0'])
+        self.assert_plot_metadata(md)
+
+    def test_plot_metadata_ids(self):
+        metadata = qiime2.Metadata.load(self.get_data_path('metadata.tsv'))
+
+        md = plot_metadata(metadata, ['S.0', 'HEC.2.52'])
+
+        self.assertEqual(list(md.index), ['HEC.2.52', 'S.0'])
+        self.assert_plot_metadata(md)
+
+    def test_missing_ids(self):
+        fp = self.get_data_path('metadata.tsv')
+        metadata = qiime2.Metadata.load(fp)
+
+        with self.assertRaisesRegex(KeyError, r"1 ordination .*\['nope'\]"):
+            read_plot_metadata(fp, ['HE.1', 'nope'], chunksize=2)
+        with self.assertRaisesRegex(KeyError, 'nope'):
+            plot_metadata(metadata, ['HE.1', 'nope'])
+
+        with self.assertRaisesRegex(KeyError, r'12 ordination .* \.\.\.'):
+            check_metadata_ids(['a'], [f'id{i}' for i in range(12)])
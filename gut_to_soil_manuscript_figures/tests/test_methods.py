@@ -6,11 +6,508 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import json
+import os
+from unittest import mock
+
+import numpy as np
+import matplotlib.pyplot as plt
+import skbio
+
+import qiime2
 from qiime2.plugin.testing import TestPluginBase
+from q2_types.ordination import OrdinationFormat
+
+from gut_to_soil_manuscript_figures._cache import CACHE_DIR_ENV
+from gut_to_soil_manuscript_figures._methods import (
+    pcoa_2d, pcoa_2d_batch, pcoa_2d_grid, trajectory_index,
+    _parse_render_spec)
+from gut_to_soil_manuscript_figures._selection import sort_plot_metadata
+
+
+class OutputsMixin:
+    """Helpers for comparing the files written by different renders."""
+
+    def output_dir(self, name):
+        output_dir = os.path.join(self.temp_dir.name, name)
+        os.mkdir(output_dir)
+
+        return output_dir
 
+    def assert_same_outputs(self, exp_dir, obs_dir, fns=('pcoa_plot.png',)):
+        for fn in fns:
+            with open(os.path.join(exp_dir, fn), 'rb') as fh:
+                exp = fh.read()
+            with open(os.path.join(obs_dir, fn), 'rb') as fh:
+                self.assertEqual(fh.read(), exp, fn)
 
-class PCoATests(TestPluginBase):
+
+class PCoATests(OutputsMixin, TestPluginBase):
     package = 'gut_to_soil_manuscript_figures.tests'
 
+    def setUp(self):
+        super().setUp()
+
+        self.metadata = qiime2.Metadata.load(
+            self.get_data_path('metadata.tsv'))
+        self.ordination = skbio.OrdinationResults.read(
+            self.get_data_path('ordination.txt'))
+
     def test_simple1(self):
         pass
+
+    def test_pcoa_2d_in_process(self):
+        output_dir = self.temp_dir.name
+
+        pcoa_2d(output_dir, self.metadata, self.ordination,
+                average=True, export_legend=True, highlighted_buckets='2')
+
+        for fn in ('index.html', 'pcoa_plot.png', 'legend.png'):
+            self.assertTrue(os.path.exists(os.path.join(output_dir, fn)))
+        # nothing is round-tripped through disk when rendering in-process
+        self.assertFalse(
+            os.path.exists(os.path.join(output_dir, 'metadata.tsv')))
+
+    def test_pcoa_2d_export_legend(self):
+        output_dir = self.temp_dir.name
+
+        pcoa_2d(output_dir, self.metadata, self.ordination,
+                highlighted_buckets='1, 3', himalaya=True, pit_toilet=True,
+                export_legend=True)
+
+        # the legend is cropped where it was drawn, rather than wherever its
+        # 'best' location is when saving the crop (which leaves it blank,
+        # other than the edges of the frame)
+        legend = plt.imread(os.path.join(output_dir, 'legend.png'))
+        self.assertGreater(np.abs(legend[..., :3] - 1).mean(), 0.03)
+
+    def test_pcoa_2d_from_format(self):
+        # the ordination view that QIIME 2 hands to the visualizer
+        ordination = OrdinationFormat(self.get_data_path('ordination.txt'),
+                                      mode='r')
+
+        pcoa_2d(self.temp_dir.name, self.metadata, ordination,
+                highlighted_buckets='2')
+
+        self.assertTrue(os.path.exists(
+            os.path.join(self.temp_dir.name, 'pcoa_plot.png')))
+
+    def test_pcoa_2d_isolated(self):
+        output_dir = self.temp_dir.name
+
+        pcoa_2d(output_dir, self.metadata, self.ordination,
+                highlighted_buckets='1, 3', isolate=True)
+
+        self.assertTrue(
+            os.path.exists(os.path.join(output_dir, 'pcoa_plot.png')))
+        # the binary hand-off is cleaned up after rendering
+        self.assertEqual(sorted(os.listdir(output_dir)),
+                         ['index.html', 'pcoa_plot.png'])
+
+    def test_pcoa_2d_isolated_matches_in_process(self):
+        for name, kwargs in (
+                ('markers', dict(average=True, swap_axes=True)),
+                ('density', dict(density_threshold=1))):
+            with self.subTest(name):
+                outputs = [self.output_dir(f'{name}-{isolate}')
+                           for isolate in (False, True)]
+                for output_dir, isolate in zip(outputs, (False, True)):
+                    pcoa_2d(output_dir, self.metadata, self.ordination,
+                            highlighted_buckets='2', isolate=isolate,
+                            **kwargs)
+
+                self.assert_same_outputs(*outputs)
+
+    def test_pcoa_2d_interactive(self):
+        output_dir = self.temp_dir.name
+
+        pcoa_2d(output_dir, self.metadata, self.ordination, average=True,
+                highlighted_buckets='2', interactive=True)
+
+        for fn in ('pcoa_plot.png', 'pcoa_data.json', 'pcoa_2d.js'):
+            self.assertTrue(os.path.exists(os.path.join(output_dir, fn)))
+        # the weekly mean is initially shown, as in the static plot
+        with open(os.path.join(output_dir, 'pcoa_data.json')) as fh:
+            self.assertTrue(json.load(fh)['average'])
+        with open(os.path.join(output_dir, 'index.html')) as fh:
+            self.assertIn('<script src="pcoa_2d.js">', fh.read())
+
+    def test_pcoa_2d_trajectory_index(self):
+        index = trajectory_index(self.metadata, self.ordination)
+
+        self.assertEqual(list(index.samples.loc['HEC.2.1']),
+                         [2.0, 'HEC', 1.0,
+                          *self.ordination.samples.loc['HEC.2.1', 0:1]])
+
+        outputs = {}
+        for name, isolate, trajectories in (
+                ('metadata', False, None), ('index', False, index),
+                ('index-isolated', True, index)):
+            outputs[name] = self.output_dir(name)
+            pcoa_2d(outputs[name], self.metadata, self.ordination,
+                    average=True, invert_x=True, week_annotations=True,
+                    highlighted_buckets='1, 3', isolate=isolate,
+                    trajectory_index=trajectories)
+
+        self.assert_same_outputs(outputs['metadata'], outputs['index'])
+        self.assert_same_outputs(outputs['metadata'],
+                                 outputs['index-isolated'])
+
+    def test_pcoa_2d_trajectory_index_other_ordination(self):
+        index = trajectory_index(self.metadata, self.ordination)
+        index.samples.rename(index={'HEC.1.1': 'HEC.9.1'}, inplace=True)
+
+        with self.assertRaisesRegex(ValueError, "'HEC.9.1'"):
+            pcoa_2d(self.temp_dir.name, self.metadata, self.ordination,
+                    highlighted_buckets='1', trajectory_index=index)
+
+    def test_pcoa_2d_trajectory_index_other_coordinates(self):
+        index = trajectory_index(self.metadata, self.ordination)
+        # the same samples, but at other coordinates
+        other = skbio.OrdinationResults.read(
+            self.get_data_path('ordination.txt'))
+        other.samples = other.samples * -3 + 1
+
+        with self.assertRaisesRegex(ValueError, 'coordinates'):
+            pcoa_2d(self.temp_dir.name, self.metadata, other, average=True,
+                    trajectory_index=index)
+
+    def test_pcoa_2d_reference_orientation(self):
+        # the same ordination, with PCoA 1 inverted & the axes swapped
+        reference = skbio.OrdinationResults.read(
+            self.get_data_path('ordination.txt'))
+        reference.samples[[0, 1]] = \
+            reference.samples[[1, 0]].to_numpy() * [1.0, -1.0]
+
+        outputs = {}
+        for name, kwargs in (
+                ('manual', dict(invert_x=True, swap_axes=True)),
+                ('reference', dict(orientation='reference',
+                                   reference=reference))):
+            outputs[name] = self.output_dir(name)
+            pcoa_2d(outputs[name], self.metadata, self.ordination,
+                    highlighted_buckets='2', **kwargs)
+
+        self.assert_same_outputs(outputs['manual'], outputs['reference'])
+        with open(os.path.join(self.temp_dir.name, 'reference',
+                               'index.html')) as fh:
+            self.assertIn('swap_axes=True, invert_x=True, invert_y=False',
+                          fh.read())
+
+    def test_pcoa_2d_canonical_orientation(self):
+        pcoa_2d(self.temp_dir.name, self.metadata, self.ordination,
+                orientation='canonical')
+
+        with open(os.path.join(self.temp_dir.name, 'index.html')) as fh:
+            self.assertIn('Orientation (canonical)', fh.read())
+
+    def test_pcoa_2d_reference_required(self):
+        with self.assertRaisesRegex(ValueError, 'reference ordination is'
+                                                ' required'):
+            pcoa_2d(self.temp_dir.name, self.metadata, self.ordination,
+                    orientation='reference')
+
+        with self.assertRaisesRegex(ValueError, 'only used'):
+            pcoa_2d(self.temp_dir.name, self.metadata, self.ordination,
+                    reference=self.ordination)
+
+    def test_pcoa_2d_does_not_modify_ordination(self):
+        before = self.ordination.samples.copy()
+
+        pcoa_2d(self.temp_dir.name, self.metadata, self.ordination,
+                invert_x=True, invert_y=True)
+
+        self.assertTrue(self.ordination.samples.equals(before))
+
+    def test_pcoa_2d_use_cache(self):
+        cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        first_dir = self.output_dir('first')
+        second_dir = self.output_dir('second')
+
+        with mock.patch.dict(os.environ, {CACHE_DIR_ENV: cache_dir}):
+            pcoa_2d(first_dir, self.metadata, self.ordination,
+                    export_legend=True, use_cache=True)
+            with mock.patch('gut_to_soil_manuscript_figures.scripts.'
+                            'plot_pcoa_2d.plot_pcoa_2d') as plot:
+                pcoa_2d(second_dir, self.metadata, self.ordination,
+                        export_legend=True, use_cache=True)
+                plot.assert_not_called()
+
+        self.assert_same_outputs(first_dir, second_dir,
+                                 ('pcoa_plot.png', 'legend.png'))
+
+    def test_pcoa_2d_use_cache_layers(self):
+        cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        layer_params = dict(average=True, highlighted_buckets='2')
+        # only presentation parameters differ from the first render, so these
+        # are redrawn from its cached layer data without the inputs
+        restyled = {
+            'in_process': dict(measure='Jaccard', week_annotations=True,
+                               export_legend=True),
+            'isolated': dict(measure='Bray-Curtis', isolate=True)
+        }
+
+        def _pcoa_2d(name, **kwargs):
+            output_dir = self.output_dir(name)
+            pcoa_2d(output_dir, self.metadata, self.ordination,
+                    **layer_params, **kwargs)
+
+            return output_dir
+
+        with mock.patch.dict(os.environ, {CACHE_DIR_ENV: cache_dir}):
+            _pcoa_2d('first', use_cache=True)
+            with mock.patch('gut_to_soil_manuscript_figures.scripts.'
+                            'plot_pcoa_2d.plot_pcoa_2d') as plot:
+                obs = {name: _pcoa_2d(name, use_cache=True, **kwargs)
+                       for name, kwargs in restyled.items()}
+                plot.assert_not_called()
+
+        for name, kwargs in restyled.items():
+            exp = _pcoa_2d(f'{name}_exp', **kwargs)
+            self.assert_same_outputs(
+                exp, obs[name],
+                [fn for fn in os.listdir(exp) if fn.endswith('.png')])
+
+    def test_pcoa_2d_output_formats(self):
+        output_dir = self.temp_dir.name
+
+        pcoa_2d(output_dir, self.metadata, self.ordination,
+                highlighted_buckets='2', vector_formats=['svg', 'pdf'],
+                dpi=300, max_pixels=1_000_000)
+
+        with open(os.path.join(output_dir, 'pcoa_plot.svg')) as fh:
+            self.assertTrue(fh.read().lstrip().startswith('<?xml'))
+        with open(os.path.join(output_dir, 'pcoa_plot.pdf'), 'rb') as fh:
+            self.assertEqual(fh.read(5), b'%PDF-')
+
+        # 300 dpi wouldn't fit in the budget, so the DPI is lowered
+        height, width, _ = plt.imread(
+            os.path.join(output_dir, 'pcoa_plot.png')).shape
+        self.assertLessEqual(width * height, 1_000_000)
+        self.assertGreater(width * height, 900_000)
+
+        with open(os.path.join(output_dir, 'index.html')) as fh:
+            index = fh.read()
+        self.assertIn(f'({width} &times; {height} px)', index)
+        self.assertIn('<a href="pcoa_plot.svg">SVG</a>', index)
+        self.assertIn('<a href="pcoa_plot.pdf">PDF</a>', index)
+
+    def test_pcoa_2d_output_formats_isolated(self):
+        output_dir = self.temp_dir.name
+
+        pcoa_2d(output_dir, self.metadata, self.ordination,
+                vector_formats=['svg'], dpi=50, isolate=True)
+
+        self.assertTrue(
+            os.path.exists(os.path.join(output_dir, 'pcoa_plot.svg')))
+        self.assertFalse(
+            os.path.exists(os.path.join(output_dir, 'pcoa_plot.pdf')))
+        # half of the default DPI
+        default_dir = os.path.join(output_dir, 'default')
+        os.mkdir(default_dir)
+        pcoa_2d(default_dir, self.metadata, self.ordination)
+        height, width, _ = plt.imread(
+            os.path.join(output_dir, 'pcoa_plot.png')).shape
+        default_height, default_width, _ = plt.imread(
+            os.path.join(default_dir, 'pcoa_plot.png')).shape
+        self.assertAlmostEqual(width, default_width / 2, delta=2)
+        self.assertAlmostEqual(height, default_height / 2, delta=2)
+
+    def _profile_stages(self, output_dir):
+        with open(os.path.join(output_dir, 'profile.json')) as fh:
+            report = json.load(fh)
+
+        return {(s['process'], s['stage']) for s in report['stages']}
+
+    def test_pcoa_2d_profile(self):
+        output_dir = self.temp_dir.name
+
+        pcoa_2d(output_dir, self.metadata, self.ordination, average=True,
+                highlighted_buckets='2', profile=True)
+
+        stages = self._profile_stages(output_dir)
+        for stage in ('project_metadata', 'load_metadata', 'filter_ids',
+                      'orient_coordinates', 'weekly_average', 'savefig'):
+            self.assertIn(('pcoa_2d', stage), stages)
+
+        # the visualization shows the same report as profile.json
+        with open(os.path.join(output_dir, 'profile.json')) as fh:
+            report = json.load(fh)
+        with open(os.path.join(output_dir, 'index.html')) as fh:
+            index = fh.read()
+        self.assertIn('Stage timings', index)
+        self.assertIn(f"Total: {report['wall_seconds']:.3f} s", index)
+
+    def test_pcoa_2d_profile_isolated(self):
+        output_dir = self.temp_dir.name
+
+        pcoa_2d(output_dir, self.metadata, self.ordination,
+                highlighted_buckets='2', isolate=True, profile=True)
+
+        # the script's stages are collected from the subprocess
+        stages = self._profile_stages(output_dir)
+        self.assertIn(('pcoa_2d', 'serialize_handoff'), stages)
+        self.assertIn(('pcoa_2d', 'subprocess'), stages)
+        self.assertIn(('plot_pcoa_2d', 'load_ordination'), stages)
+        self.assertIn(('plot_pcoa_2d', 'savefig'), stages)
+
+    def test_pcoa_2d_no_profile(self):
+        output_dir = self.temp_dir.name
+
+        pcoa_2d(output_dir, self.metadata, self.ordination)
+
+        self.assertFalse(
+            os.path.exists(os.path.join(output_dir, 'profile.json')))
+        with open(os.path.join(output_dir, 'index.html')) as fh:
+            self.assertNotIn('Stage timings', fh.read())
+
+
+class PCoAGridTests(TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def setUp(self):
+        super().setUp()
+
+        self.metadata = qiime2.Metadata.load(
+            self.get_data_path('metadata.tsv'))
+        ordination = skbio.OrdinationResults.read(
+            self.get_data_path('ordination.txt'))
+        self.ordinations = {
+            'Unweighted Unifrac': ordination,
+            'Jaccard': OrdinationFormat(
+                self.get_data_path('ordination.txt'), mode='r'),
+            'Bray-Curtis': ordination
+        }
+
+    def test_pcoa_2d_grid(self):
+        output_dir = self.temp_dir.name
+
+        with mock.patch('gut_to_soil_manuscript_figures.scripts.'
+                        'plot_pcoa_2d.sort_plot_metadata',
+                        wraps=sort_plot_metadata) as sort:
+            pcoa_2d_grid(output_dir, self.metadata, self.ordinations,
+                         average=True, export_legend=True,
+                         highlighted_buckets='1, 3')
+
+        # the metadata is sorted once for all of the ordinations
+        sort.assert_called_once()
+        self.assertEqual(sorted(os.listdir(output_dir)),
+                         ['index.html', 'legend.png', 'pcoa_grid.png'])
+        with open(os.path.join(output_dir, 'index.html')) as fh:
+            self.assertIn('Unweighted Unifrac, Jaccard, Bray-Curtis',
+                          fh.read())
+
+    def test_pcoa_2d_grid_missing_metadata_samples(self):
+        metadata = qiime2.Metadata(
+            self.metadata.to_dataframe().drop(index='HE.1'))
+
+        with self.assertRaisesRegex(KeyError, 'HE.1'):
+            pcoa_2d_grid(self.temp_dir.name, metadata, self.ordinations)
+
+
+class PCoABatchTests(OutputsMixin, TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def setUp(self):
+        super().setUp()
+
+        self.metadata = qiime2.Metadata.load(
+            self.get_data_path('metadata.tsv'))
+        self.ordination = skbio.OrdinationResults.read(
+            self.get_data_path('ordination.txt'))
+
+    def test_pcoa_2d_batch(self):
+        output_dir = self.temp_dir.name
+        specs = ['highlighted_buckets=1; average',
+                 'highlighted_buckets=2, 3; average',
+                 'swap_axes; invert_x; himalaya; pit_toilet']
+
+        pcoa_2d_batch(output_dir, self.metadata, self.ordination, specs,
+                      export_legend=True)
+
+        for i in range(1, 4):
+            for fn in (f'pcoa_plot_{i}.png', f'legend_{i}.png'):
+                self.assertTrue(
+                    os.path.exists(os.path.join(output_dir, fn)))
+        with open(os.path.join(output_dir, 'index.html')) as fh:
+            self.assertIn('highlighted_buckets=2, 3; average', fh.read())
+
+    def test_pcoa_2d_batch_parallel_matches_serial(self):
+        specs = ['highlighted_buckets=1', 'highlighted_buckets=2',
+                 'highlighted_buckets=3; swap_axes']
+        serial_dir = self.output_dir('serial')
+        parallel_dir = self.output_dir('parallel')
+
+        pcoa_2d_batch(serial_dir, self.metadata, self.ordination, specs)
+        pcoa_2d_batch(parallel_dir, self.metadata, self.ordination, specs,
+                      n_jobs=2)
+
+        self.assert_same_outputs(serial_dir, parallel_dir,
+                                 [f'pcoa_plot_{i}.png' for i in range(1, 4)])
+
+    def assert_blitted(self, exp, obs, msg):
+        self.assertEqual(obs.shape, exp.shape, msg)
+
+        # the crop can be shifted by up to a pixel (& so can the
+        # antialiasing of what's drawn on the background), so the images are
+        # compared at their best alignment, blurred over each pixel's
+        # neighbours (as the shift needn't be a whole pixel), & have to be
+        # much closer to each other than to a blank image
+        def blurred(image):
+            padded = np.pad(image, ((1, 1), (1, 1), (0, 0)), mode='edge')
+            return np.mean([padded[dy:dy + height, dx:dx + width]
+                            for dy in range(3) for dx in range(3)], axis=0)
+
+        height, width = exp.shape[:2]
+        blurred_exp, blurred_obs = blurred(exp), blurred(obs)
+        diff = min(
+            np.abs(blurred_exp[1 + dy:height - 1 + dy, 1 + dx:width - 1 + dx]
+                   - blurred_obs[1:height - 1, 1:width - 1]).mean()
+            for dy in (-1, 0, 1) for dx in (-1, 0, 1))
+        self.assertLess(diff, 0.25 * np.abs(exp - 1).mean(), msg)
+
+    def test_pcoa_2d_batch_blit(self):
+        specs = ['highlighted_buckets=1; average', 'highlighted_buckets=2',
+                 'average', 'highlighted_buckets=3; swap_axes', 'swap_axes']
+
+        # blitted onto the shared backgrounds, with the same layout (&
+        # legend location, including for the axes with a fixed aspect)
+        for export_legend in (True, False):
+            with self.subTest(export_legend=export_legend):
+                full_dir = self.output_dir(f'full-{export_legend}')
+                blit_dir = self.output_dir(f'blit-{export_legend}')
+
+                for output_dir, blit in ((full_dir, False), (blit_dir, True)):
+                    pcoa_2d_batch(output_dir, self.metadata, self.ordination,
+                                  specs, export_legend=export_legend,
+                                  blit=blit)
+
+                for i in range(1, 6):
+                    fns = [f'pcoa_plot_{i}.png']
+                    if export_legend:
+                        fns.append(f'legend_{i}.png')
+                    for fn in fns:
+                        self.assert_blitted(
+                            plt.imread(os.path.join(full_dir, fn)),
+                            plt.imread(os.path.join(blit_dir, fn)), fn)
+
+    def test_parse_render_spec(self):
+        params = _parse_render_spec(
+            'highlighted_buckets=2, 3; average; invert_y=False')
+
+        self.assertEqual(params['highlighted_buckets'], '2, 3')
+        self.assertTrue(params['average'])
+        self.assertFalse(params['invert_y'])
+        self.assertFalse(params['swap_axes'])
+
+    def test_parse_render_spec_empty(self):
+        params = _parse_render_spec('')
+
+        self.assertEqual(params['highlighted_buckets'], '')
+        self.assertFalse(params['average'])
+
+    def test_parse_render_spec_invalid(self):
+        with self.assertRaisesRegex(ValueError, 'Unrecognized.*measure'):
+            _parse_render_spec('measure=Jaccard')
+        with self.assertRaisesRegex(ValueError, 'Invalid value.*average'):
+            _parse_render_spec('average=maybe')
@@ -0,0 +1,74 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+
+import numpy as np
+import pandas as pd
+import skbio
+
+from qiime2.plugin.testing import TestPluginBase
+
+from gut_to_soil_manuscript_figures._ordination import read_ordination_axes
+
+
+class ReadOrdinationAxesTests(TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def _write(self, ordination):
+        fp = os.path.join(self.temp_dir.name, 'ordination.txt')
+        ordination.write(fp)
+
+        return fp
+
+    def test_matches_skbio(self):
+        fp = self.get_data_path('ordination.txt')
+        exp = skbio.OrdinationResults.read(fp)
+
+        obs = read_ordination_axes(fp)
+
+        pd.testing.assert_frame_equal(obs.samples, exp.samples.iloc[:, 0:2])
+        np.testing.assert_array_equal(obs.proportion_explained,
+                                      exp.proportion_explained.iloc[0:2])
+
+    def test_skips_features_and_other_axes(self):
+        rng = np.random.default_rng(0)
+        eigvals = pd.Series([4.0, 3.0, 2.0, 1.0])
+        samples = pd.DataFrame(rng.normal(size=(5, 4)),
+                               index=[f's{i}' for i in range(5)])
+        features = pd.DataFrame(rng.normal(size=(3, 4)),
+                                index=['f1', 'f2', 'f3'])
+        fp = self._write(skbio.OrdinationResults(
+            'PCoA', 'Principal Coordinate Analysis', eigvals, samples,
+            features=features,
+            proportion_explained=eigvals / eigvals.sum()))
+
+        obs = read_ordination_axes(fp)
+
+        pd.testing.assert_frame_equal(obs.samples, samples.iloc[:, 0:2])
+        np.testing.assert_array_equal(obs.proportion_explained, [0.4, 0.3])
+
+    def test_two_axes(self):
+        eigvals = pd.Series([2.0, 1.0])
+        samples = pd.DataFrame([[0.5, -0.5], [1.0, 2.0]], index=['a', 'b'])
+        fp = self._write(skbio.OrdinationResults(
+            'PCoA', 'Principal Coordinate Analysis', eigvals, samples,
+            proportion_explained=eigvals / eigvals.sum()))
+
+        pd.testing.assert_frame_equal(read_ordination_axes(fp).samples,
+                                      samples)
+
+    def test_too_few_axes(self):
+        fp = self.get_data_path('ordination.txt')
+
+        with self.assertRaisesRegex(ValueError, '4 are required'):
+            read_ordination_axes(fp, n_axes=4)
+
+    def test_not_an_ordination(self):
+        with self.assertRaisesRegex(ValueError, "'Eigvals' section"):
+            read_ordination_axes(self.get_data_path('metadata.tsv'))
@@ -0,0 +1,102 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+
+from qiime2.plugin.testing import TestPluginBase
+
+from gut_to_soil_manuscript_figures._orientation import (
+    ORIENTATIONS, align_to_reference, canonical_orientation)
+
+
+def _oriented(ord_2d, swap_axes, invert_x, invert_y):
+    # oriented the same way as the plotting script
+    ord_2d = ord_2d * [-1.0 if invert_x else 1.0, -1.0 if invert_y else 1.0]
+
+    return ord_2d[[1, 0]].set_axis([0, 1], axis=1) if swap_axes else ord_2d
+
+
+class OrientationTests(TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def setUp(self):
+        super().setUp()
+
+        rng = np.random.default_rng(0)
+        self.ord_2d = pd.DataFrame(rng.normal(size=(50, 2)) * [2.0, 1.0],
+                                   index=[f's{i}' for i in range(50)])
+
+    def test_align_to_reference(self):
+        for orientation in ORIENTATIONS:
+            noise = np.random.default_rng(1).normal(scale=0.05,
+                                                    size=(50, 2))
+            reference = _oriented(self.ord_2d, *orientation) + noise
+
+            self.assertEqual(align_to_reference(self.ord_2d, reference),
+                             orientation)
+
+    def test_align_to_reference_shared_samples(self):
+        # only half of the samples are in the reference, which also has
+        # samples that aren't in the ordination
+        reference = pd.concat([
+            _oriented(self.ord_2d, True, False, True).iloc[::2],
+            pd.DataFrame([[100.0, -100.0]], index=['other'])])
+
+        self.assertEqual(align_to_reference(self.ord_2d, reference),
+                         (True, False, True))
+
+    def test_align_to_reference_too_few_shared(self):
+        with self.assertRaisesRegex(ValueError, 'found 1'):
+            align_to_reference(self.ord_2d, self.ord_2d.iloc[:1])
+
+    def test_canonical_orientation(self):
+        md = pd.DataFrame({
+            'SampleType': ['Soil', 'Soil', 'Human Excrement Compost',
+                           'Human Excrement Compost', 'Food Compost'],
+            'Bucket': [np.nan, np.nan, 1.0, 1.0, np.nan],
+            'Composting Time Point': [np.nan, np.nan, 1.0, 52.0, np.nan]},
+            index=['soil1', 'soil2', 'wk1', 'wk52', 'fc'])
+        # soils on the right & week 1 at the bottom
+        ord_2d = pd.DataFrame([[2.0, -1.0], [3.0, -0.5], [-1.0, -2.0],
+                               [-2.0, 1.0], [0.0, 0.5]], index=md.index)
+
+        self.assertEqual(canonical_orientation(md, ord_2d),
+                         (False, True, True))
+        # PCoA 2 is on the x axis once swapped, where soils are already on
+        # the left, & week 1 is above the center on PCoA 1
+        self.assertEqual(canonical_orientation(md, ord_2d, swap_axes=True),
+                         (True, True, False))
+
+    def test_canonical_orientation_plotted_samples(self):
+        md = pd.DataFrame({
+            'SampleType': ['Soil', 'Soil', 'Food Compost', 'Control'],
+            'Bucket': [np.nan] * 4,
+            'Composting Time Point': [np.nan] * 4},
+            index=['soil1', 'soil2', 'fc', 'control'])
+        # the soils are left of the plotted samples' center, but not of the
+        # center with the (never plotted) control
+        ord_2d = pd.DataFrame([[-1.0, 0.0], [-2.0, 0.0], [3.0, 0.0],
+                               [-10.0, 0.0]], index=md.index)
+
+        self.assertEqual(canonical_orientation(md, ord_2d),
+                         (False, False, False))
+        self.assertEqual(
+            canonical_orientation(md.replace('Control', 'Food Compost'),
+                                  ord_2d),
+            (False, True, False))
+
+    def test_canonical_orientation_missing_groups(self):
+        md = pd.DataFrame({'SampleType': ['Food Compost'] * 2,
+                           'Bucket': [np.nan] * 2,
+                           'Composting Time Point': [np.nan] * 2},
+                          index=['a', 'b'])
+        ord_2d = pd.DataFrame([[1.0, 1.0], [-1.0, -1.0]], index=md.index)
+
+        self.assertEqual(canonical_orientation(md, ord_2d),
+                         (False, False, False))
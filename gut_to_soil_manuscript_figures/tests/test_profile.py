@@ -0,0 +1,67 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+
+from qiime2.plugin.testing import TestPluginBase
+
+from gut_to_soil_manuscript_figures._profile import (
+    Profiler, activate, read_report, stage)
+
+
+class ProfilerTests(TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def test_repeated_stage(self):
+        profiler = Profiler('test')
+
+        with activate(profiler):
+            for _ in range(3):
+                with stage('lookup'):
+                    pass
+
+        entry, = profiler.report()['stages']
+        self.assertEqual(entry['stage'], 'lookup')
+        self.assertEqual(entry['process'], 'test')
+        self.assertEqual(entry['calls'], 3)
+        self.assertGreater(entry['peak_rss_bytes'], 0)
+
+    def test_inactive(self):
+        profiler = Profiler('test')
+
+        with activate(profiler):
+            pass
+        with stage('lookup'):
+            pass
+
+        self.assertEqual(profiler.report()['stages'], [])
+
+    def test_write_report(self):
+        profiler = Profiler('test')
+        report = profiler.report()
+        fp = os.path.join(self.temp_dir.name, 'profile.json')
+
+        profiler.write(fp, report)
+
+        self.assertEqual(read_report(fp), report)
+
+    def test_merge(self):
+        child = Profiler('child')
+        with child.stage('render'):
+            pass
+        fp = os.path.join(self.temp_dir.name, 'profile.json')
+        child.write(fp)
+
+        parent = Profiler('parent')
+        with parent.stage('render'):
+            parent.merge(read_report(fp))
+
+        self.assertEqual(
+            [(s['process'], s['stage'])
+             for s in parent.report()['stages']],
+            [('child', 'render'), ('parent', 'render')])
@@ -0,0 +1,168 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+
+from qiime2.plugin.testing import TestPluginBase
+
+from gut_to_soil_manuscript_figures._selection import (
+    CoordinateView, SampleSelector)
+
+
+class SampleSelectorTests(TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def setUp(self):
+        super().setUp()
+
+        self.md = pd.DataFrame({
+            'SampleType': ['Human Excrement Compost'] * 3 +
+                          ['Human Excrement', 'Bulking Material', 'Soil',
+                           'Himalaya'],
+            'Bucket': [2, 2, 3, 2, 2, np.nan, 18],
+            'Composting Time Point': [52, 1, 1, np.nan, np.nan, np.nan,
+                                      np.nan]},
+            index=pd.Index(['hec-52', 'hec-1', 'hec-b3', 'he', 'bm', 'soil',
+                            'hima'], name='sample-id'))
+        # 'soil' is missing from the ordination & 'extra' from the md
+        self.ord_2d = pd.DataFrame(
+            np.arange(14, dtype=float).reshape(7, 2),
+            index=['extra', 'hima', 'bm', 'he', 'hec-b3', 'hec-1', 'hec-52'])
+
+    def test_only_shared_ids_selected(self):
+        selector = SampleSelector(self.md, self.ord_2d)
+
+        self.assertEqual(len(selector.soil()), 0)
+        self.assertNotIn('extra', selector.ids)
+        self.assertEqual(
+            list(self.ord_2d.index[selector.positions]), list(selector.ids))
+
+    def test_bucket_trajectory_sorted_by_week(self):
+        selector = SampleSelector(self.md, self.ord_2d)
+
+        self.assertEqual(list(selector.bucket_trajectory(2)),
+                         ['hec-1', 'hec-52'])
+
+    def test_week0_and_week_groups(self):
+        selector = SampleSelector(self.md, self.ord_2d)
+
+        self.assertEqual(list(selector.week0('Human Excrement', 2)), ['he'])
+        self.assertEqual(list(selector.week0('Bulking Material', 3)), [])
+        self.assertEqual(list(selector.composted_week(1.0)),
+                         ['hec-1', 'hec-b3'])
+        self.assertEqual(list(selector.composted_week(1.0, bucket=3)),
+                         ['hec-b3'])
+
+    def test_external_studies_by_bucket(self):
+        selector = SampleSelector(self.md, self.ord_2d)
+
+        self.assertEqual(list(selector.himalaya()), ['hima'])
+        self.assertEqual(list(selector.pit_toilet()), [])
+
+    def test_compact_columns(self):
+        selector = SampleSelector(self.md, self.ord_2d)
+
+        self.assertEqual(selector.type_code.dtype, np.int8)
+        self.assertEqual(selector.bucket_code.dtype, np.int8)
+        self.assertEqual(selector.week_code.dtype, np.int16)
+        self.assertEqual(selector.week_code.tolist(),
+                         [52, 1, 1, -1, -1, -1])
+
+        # decoded as the metadata columns
+        self.assertEqual(list(selector.sample_type),
+                         ['Human Excrement Compost'] * 3 +
+                         ['Human Excrement', 'Bulking Material', 'Himalaya'])
+        np.testing.assert_array_equal(selector.bucket,
+                                      [2, 2, 3, 2, 2, 18])
+        np.testing.assert_array_equal(
+            selector.week, [52, 1, 1, np.nan, np.nan, np.nan])
+
+    def test_masks_computed_once(self):
+        selector = SampleSelector(self.md, self.ord_2d)
+
+        mask = selector.of_type('Human Excrement Compost')
+        self.assertIs(selector.of_type('Human Excrement Compost'), mask)
+        self.assertIs(selector.in_bucket(2), selector.in_bucket(2.0))
+        self.assertFalse(mask.flags.writeable)
+
+        self.assertFalse(selector.of_type('Pit Toilet').any())
+
+    def test_fractional_weeks(self):
+        self.md.loc['hec-1', 'Composting Time Point'] = 1.5
+
+        with self.assertRaisesRegex(ValueError, 'Composting Time Point'):
+            SampleSelector(self.md, self.ord_2d)
+
+
+class CoordinateViewTests(SampleSelectorTests):
+
+    def _exp(self, ids, swap_axes=False, invert_x=False, invert_y=False):
+        xy = self.ord_2d.loc[list(ids)].to_numpy() * \
+            [-1.0 if invert_x else 1.0, -1.0 if invert_y else 1.0]
+
+        return xy[:, ::-1] if swap_axes else xy
+
+    def test_groups(self):
+        selector = SampleSelector(self.md, self.ord_2d)
+
+        for flags in [(False, False, False), (True, True, False),
+                      (False, False, True), (True, True, True)]:
+            view = CoordinateView(selector, self.ord_2d, *flags)
+            for group, args in [('composted', (2,)), ('composted', ()),
+                                ('bucket_trajectory', (2,)),
+                                ('human_excrement', ()), ('bulking', ()),
+                                ('himalaya', ()), ('soil', ())]:
+                obs = getattr(view, group)(*args)
+                exp = self._exp(getattr(selector, group)(*args), *flags)
+                self.assertEqual(obs.shape, (len(exp), 2))
+                np.testing.assert_array_equal(obs, exp)
+
+            np.testing.assert_array_equal(
+                view.of_ids(['extra', 'hec-1']),
+                self._exp(['extra', 'hec-1'], *flags))
+
+    def test_groups_are_views(self):
+        view = CoordinateView(SampleSelector(self.md, self.ord_2d),
+                              self.ord_2d, swap_axes=True)
+
+        # the background groups are slices of the oriented coordinates, while
+        # a trajectory (in week, rather than metadata, order) is a copy
+        for group in (view.composted(2), view.composted(),
+                      view.human_excrement(), view.himalaya()):
+            self.assertTrue(np.shares_memory(group, view._xy))
+        self.assertFalse(np.shares_memory(view.bucket_trajectory(2),
+                                          view._xy))
+
+    def test_extent(self):
+        selector = SampleSelector(self.md, self.ord_2d)
+
+        # including the samples that aren't plotted
+        view = CoordinateView(selector, self.ord_2d)
+        np.testing.assert_array_equal(view.extent, [0, 12, 1, 13])
+        view = CoordinateView(selector, self.ord_2d, swap_axes=True,
+                              invert_x=True)
+        np.testing.assert_array_equal(view.extent, [1, 13, -12, 0])
+        self.assertEqual(view.n_samples, 7)
+
+    def test_missing_ids(self):
+        view = CoordinateView(SampleSelector(self.md, self.ord_2d),
+                              self.ord_2d)
+
+        with self.assertRaisesRegex(KeyError, 'soil'):
+            view.of_ids(['hec-1', 'soil'])
+
+    def test_orient_table(self):
+        view = CoordinateView(SampleSelector(self.md, self.ord_2d),
+                              self.ord_2d, swap_axes=True, invert_y=True)
+        table = pd.DataFrame({'PC1': [1.0, 2.0], 'PC2': [3.0, 4.0]})
+
+        obs = view.orient_table(table)
+
+        self.assertEqual(list(obs.columns), ['X', 'Y'])
+        np.testing.assert_array_equal(obs, [[-3.0, 1.0], [-4.0, 2.0]])
@@ -0,0 +1,185 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import json
+import os
+import socket
+import stat
+import subprocess
+import sys
+import time
+from unittest import mock
+
+import skbio
+
+import qiime2
+from qiime2.plugin.testing import TestPluginBase
+
+from gut_to_soil_manuscript_figures import __version__
+from gut_to_soil_manuscript_figures._methods import pcoa_2d
+from gut_to_soil_manuscript_figures._server import (
+    RENDER_SOCKET_ENV, RenderError, RenderServer, check_health,
+    render_on_server)
+from gut_to_soil_manuscript_figures.tests.test_methods import OutputsMixin
+
+
+class RenderServerTests(OutputsMixin, TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def setUp(self):
+        super().setUp()
+
+        self.metadata = qiime2.Metadata.load(
+            self.get_data_path('metadata.tsv'))
+        self.ordination = skbio.OrdinationResults.read(
+            self.get_data_path('ordination.txt'))
+        self.socket_path = os.path.join(self.temp_dir.name, 'render.sock')
+
+    def start_server(self, *args):
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gut_to_soil_manuscript_figures._server',
+             self.socket_path, *args])
+        self.addCleanup(server.wait)
+        self.addCleanup(server.terminate)
+
+        deadline = time.monotonic() + 60
+        while check_health(self.socket_path) is None:
+            if server.poll() is not None or time.monotonic() > deadline:
+                self.fail('The render server did not start.')
+            time.sleep(0.1)
+
+        return server
+
+    def render(self, output_dir, **kwargs):
+        pcoa_2d(output_dir, self.metadata, self.ordination,
+                highlighted_buckets='1, 3', isolate=True, profile=True,
+                **kwargs)
+
+        with open(os.path.join(output_dir, 'profile.json')) as fh:
+            report = json.load(fh)
+
+        return {(s['process'], s['stage']) for s in report['stages']}
+
+    def test_health(self):
+        server = self.start_server('--workers', '2', '--max-queue', '3')
+
+        status = check_health(self.socket_path)
+
+        self.assertEqual(status['version'], __version__)
+        self.assertEqual(status['pid'], server.pid)
+        self.assertEqual(status['workers'], 2)
+        self.assertEqual(status['max_queue'], 3)
+        self.assertEqual(status['queued'], 0)
+
+        # the socket is removed when the server shuts down
+        server.terminate()
+        server.wait()
+        self.assertFalse(os.path.exists(self.socket_path))
+        self.assertIsNone(check_health(self.socket_path))
+
+    def test_pcoa_2d_on_server_matches_subprocess(self):
+        self.start_server()
+        server_dir = self.output_dir('server')
+        subprocess_dir = self.output_dir('subprocess')
+
+        with mock.patch.dict(os.environ,
+                             {RENDER_SOCKET_ENV: self.socket_path}):
+            server_stages = self.render(server_dir)
+        with mock.patch.dict(os.environ, {RENDER_SOCKET_ENV: ''}):
+            subprocess_stages = self.render(subprocess_dir)
+
+        self.assertIn(('pcoa_2d', 'render_server'), server_stages)
+        self.assertNotIn(('pcoa_2d', 'subprocess'), server_stages)
+        # the script's stages are collected from the server's render too
+        self.assertIn(('plot_pcoa_2d', 'savefig'), server_stages)
+        self.assertIn(('pcoa_2d', 'subprocess'), subprocess_stages)
+
+        self.assert_same_outputs(subprocess_dir, server_dir)
+
+    def test_pcoa_2d_falls_back_without_server(self):
+        output_dir = self.output_dir('output')
+
+        # nothing is listening on the socket
+        with mock.patch.dict(os.environ,
+                             {RENDER_SOCKET_ENV: self.socket_path}):
+            stages = self.render(output_dir)
+
+        self.assertIn(('pcoa_2d', 'subprocess'), stages)
+        self.assertTrue(
+            os.path.exists(os.path.join(output_dir, 'pcoa_plot.png')))
+
+    def test_render_error(self):
+        self.start_server()
+
+        with self.assertRaisesRegex(RenderError, 'IndexError'):
+            render_on_server(['too', 'few', 'arguments'], self.socket_path)
+
+        # the server outlives its failed renders
+        self.assertIsNotNone(check_health(self.socket_path))
+
+    def test_render_timeout(self):
+        self.start_server('--timeout', '0.01')
+        output_dir = self.output_dir('output')
+
+        with mock.patch.dict(os.environ,
+                             {RENDER_SOCKET_ENV: self.socket_path}), \
+                self.assertRaisesRegex(RenderError, 'timed out'):
+            self.render(output_dir)
+
+        self.assertIsNotNone(check_health(self.socket_path))
+
+    def test_socket_permissions(self):
+        # only the server's user can connect, even before the socket's mode
+        # is set
+        with mock.patch('gut_to_soil_manuscript_figures._server.os.chmod'):
+            server = RenderServer(self.socket_path)
+        self.addCleanup(server.close)
+
+        mode = stat.S_IMODE(os.stat(self.socket_path).st_mode)
+        self.assertEqual(mode & 0o077, 0)
+
+    def test_queue_full(self):
+        server = RenderServer(self.socket_path, max_queue=1)
+        self.addCleanup(server.close)
+
+        responses = []
+        for _ in range(2):
+            conn, client = socket.socketpair()
+            self.addCleanup(client.close)
+            server._handle(conn, {'op': 'render', 'args': []})
+            responses.append(client)
+
+        # the first render is queued (its connection left open for the
+        # response), & the second is turned away
+        self.assertEqual(len(server._queue), 1)
+        with responses[1].makefile('rb') as reader:
+            response = json.loads(reader.readline())
+        self.assertFalse(response['ok'])
+        self.assertTrue(response['busy'])
+
+        # which the client takes as the server being unavailable
+        with mock.patch('gut_to_soil_manuscript_figures._server._request',
+                        side_effect=[server.health(), response]):
+            self.assertFalse(render_on_server([], self.socket_path))
+
+    def test_invalid_requests(self):
+        server = RenderServer(self.socket_path)
+        self.addCleanup(server.close)
+
+        for request in (None, {'op': 'nope'}, {'op': 'render', 'args': 'a'},
+                        {'op': 'render', 'args': [], 'cwd': 1}):
+            conn, client = socket.socketpair()
+            self.addCleanup(client.close)
+            server._handle(conn, request)
+
+            with client.makefile('rb') as reader:
+                response = json.loads(reader.readline())
+            self.assertFalse(response['ok'])
+            self.assertNotIn('busy', response)
+
+        self.assertEqual(len(server._queue), 0)
@@ -0,0 +1,110 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Liz Gehret.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import numpy as np
+import pandas as pd
+
+from qiime2.plugin.testing import TestPluginBase
+
+from gut_to_soil_manuscript_figures._selection import (
+    SampleSelector, filter_plot_metadata)
+from gut_to_soil_manuscript_figures._trajectory import (
+    bucket_trajectories, read_bucket_trajectories, sample_table,
+    weekly_centroids, weekly_trajectory, write_bucket_trajectories)
+
+
+class WeeklyTrajectoryTests(TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def setUp(self):
+        super().setUp()
+
+        self.md = pd.DataFrame({
+            'SampleType': ['Human Excrement Compost'] * 4 +
+                          ['Human Excrement', 'Human Excrement',
+                           'Bulking Material', 'Soil'],
+            'Bucket': [1, 2, 1, 2, 1, 2, 1, np.nan],
+            'Composting Time Point': [52, 52, 1, 1, np.nan, np.nan, np.nan,
+                                      np.nan]},
+            index=['a', 'b', 'c', 'd', 'he1', 'he2', 'bm', 'soil'])
+        self.ord_2d = pd.DataFrame(
+            [[1.0, 2.0], [3.0, 4.0], [0.0, 0.0], [2.0, -2.0],
+             [-1.0, 1.0], [-3.0, 3.0], [5.0, 5.0], [9.0, 9.0]],
+            index=self.md.index)
+
+    def test_sample_table(self):
+        table = sample_table(SampleSelector(self.md, self.ord_2d),
+                             self.ord_2d)
+
+        self.assertEqual(list(table.columns),
+                         ['SampleType', 'Bucket', 'week', 'PC1', 'PC2'])
+        self.assertEqual(table.loc['d', 'PC2'], -2.0)
+
+    def test_weekly_centroids(self):
+        table = sample_table(SampleSelector(self.md, self.ord_2d),
+                             self.ord_2d)
+        centroids = weekly_centroids(table)
+
+        self.assertEqual(
+            list(centroids.loc[('Human Excrement', 0.0)]), [-2.0, 2.0])
+        self.assertEqual(
+            list(centroids.loc[('Bulking Material', 0.0)]), [5.0, 5.0])
+        # soil samples don't contribute to any centroid
+        self.assertNotIn('Soil', centroids.index.get_level_values(0))
+
+    def test_weekly_trajectory_ordered_by_week(self):
+        trajectory = weekly_trajectory(self.md, self.ord_2d)
+
+        exp = pd.DataFrame({'PC1': [1.0, 2.0], 'PC2': [-1.0, 3.0]},
+                           index=pd.Index([1.0, 52.0], name='week'))
+        pd.testing.assert_frame_equal(trajectory, exp)
+
+
+class BucketTrajectoriesTests(TestPluginBase):
+    package = 'gut_to_soil_manuscript_figures.tests'
+
+    def setUp(self):
+        super().setUp()
+
+        self.md = pd.DataFrame({
+            'SampleType': ['Human Excrement Compost'] * 4 +
+                          ['Human Excrement', 'Bulking Material',
+                           'Human Excrement', 'Soil'],
+            'Bucket': [1, 1, 2, 1, 1, 1, 2, np.nan],
+            'Composting Time Point': [52, 2, 1, 1, np.nan, np.nan, np.nan,
+                                      np.nan]},
+            index=['a', 'b', 'c', 'd', 'he1', 'bm1', 'he2', 'soil'])
+        self.ord_2d = pd.DataFrame(
+            [[1.0, 2.0], [3.0, 4.0], [0.0, 0.0], [2.0, -2.0],
+             [-1.0, 1.0], [5.0, 5.0], [-3.0, 3.0], [9.0, 9.0]],
+            index=self.md.index)
+        _, self.selector = filter_plot_metadata(self.md, self.ord_2d)
+
+    def test_bucket_trajectories(self):
+        samples, centroids = bucket_trajectories(self.selector, self.ord_2d)
+
+        # the inputs of each bucket, followed by its weeks in order
+        self.assertEqual(list(samples.index),
+                         ['he1', 'bm1', 'd', 'b', 'a', 'he2', 'c'])
+        self.assertEqual(list(samples['role']),
+                         ['HE', 'bulking', 'HEC', 'HEC', 'HEC', 'HE', 'HEC'])
+        self.assertEqual(list(samples.loc['b']), [1.0, 'HEC', 2.0, 3.0, 4.0])
+        self.assertTrue(np.isnan(samples.loc['he2', 'week']))
+
+        pd.testing.assert_frame_equal(
+            centroids.set_index(['SampleType', 'week']),
+            weekly_centroids(sample_table(self.selector, self.ord_2d)))
+
+    def test_round_trip(self):
+        exp = bucket_trajectories(self.selector, self.ord_2d)
+
+        write_bucket_trajectories(self.temp_dir.name, exp)
+        obs = read_bucket_trajectories(self.temp_dir.name)
+
+        pd.testing.assert_frame_equal(obs.samples, exp.samples)
+        pd.testing.assert_frame_equal(obs.centroids, exp.centroids)
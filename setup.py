@@ -33,6 +33,7 @@ setup(
     package_data={
         'gut_to_soil_manuscript_figures': [
             'citations.bib',
+            'assets/*',
             'scripts/*'
         ],
         'gut_to_soil_manuscript_figures.tests': ['data/*'],